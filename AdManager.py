@@ -1,63 +1,237 @@
-import ldap
 from Logging import LogManager
-import configparser
+from Metrics import metrics
+from Membership import MembershipIndex
+from Config import getConfig
+from GroupMapper import GroupMapper
+from LdapFilter import escapeValue, orFilter, orFilters
+import json
+import os
+import sys
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from contextlib import contextmanager
+
+# O python-ldap e importado somente ao abrir a conexao (ver _importLdap)
+ldap = None
+SimplePagedResultsControl = None
+
+def _importLdap():
+	"""
+	Metodo que importa o python-ldap na primeira conexao.
+	"""
+	global ldap, SimplePagedResultsControl
+	if ldap is None:
+		import ldap
+		import ldap.dn
+		import ldap.controls
+		SimplePagedResultsControl = ldap.controls.SimplePagedResultsControl
+	return ldap
+
 
 class AdManager:
 	"""
 	Classe para gerenciar a conexao e extracao de dados do AD.
 	"""
 
-	def __init__(self):
+	def __init__(self, section='ad', config=None):
 		"""
 		Metodo construtor.
 		Pega configuracoes iniciais do arquivo conexao.ini.
+
+		Parameters
+		----------
+		section : str
+			Secao do conexao.ini com a configuracao do dominio. As secoes '[ad:<nome>]'
+			herdam da secao [ad] as opcoes nao informadas.
+			Ex: 'ad:filial'
+		config : Config
+			Configuracao ja lida do conexao.ini. Opcional (padrao: getConfig()).
 		"""
-		cp = configparser.ConfigParser()
-		cp.read('conexao.ini', encoding='utf-8')
-		if cp.has_section('ad'):
-			self._log_level = cp['ad']['log_level']
+		config = config or getConfig()
+		if config.has_section(section):
+			self.section = section
+			ad = config.section(section)
+			self._log_level = ad['log_level']
 			self._log = LogManager(self._log_level, __name__)
-			self._server_url = cp['ad']['host']
-			self._bind_dn = cp['ad']['bind_dn']
-			self._bind_pass = cp['ad']['bind_pw']
-			self._users_ou = cp['ad']['users_ou']
-			self._groups_ou = cp['ad']['groups_ou']
-			self._group_filter = '(&(objectClass=user)(memberof:1.2.840.113556.1.4.1941:=cn={group_name},%s)(!(userAccountControl:1.2.840.113556.1.4.803:=2)))' % self._groups_ou
+			# Lista de DCs (separados por espaco ou virgula), usados em ordem em caso de falha
+			self._server_urls = ad['host'].replace(',', ' ').split()
+			self._server_url = self._server_urls[0]
+			self._network_timeout = ad.getint('network_timeout', 10)
+			self._bind_dn = ad['bind_dn']
+			self._bind_pass = ad['bind_pw']
+			self._users_ou = ad['users_ou']
+			self._groups_ou = ad['groups_ou']
+			self._group_filter = '(&(objectClass=user)(memberof:1.2.840.113556.1.4.1941:=%s)(!(userAccountControl:1.2.840.113556.1.4.803:=2)))'
+			self._users_filter = '(&(objectClass=user)(!(userAccountControl:1.2.840.113556.1.4.803:=2)))'
+			self._membership_mode = ad.get('membership_mode', 'per_group')
+			self._page_size = ad.getint('page_size', 1000)
+			self._pool_size = max(1, ad.getint('pool_size', 1))
+			self._incremental = ad.getboolean('incremental', False)
+			self._state_file = ad.get('state_file', 'ad_state.json')
+			# DN de cada grupo retornado por getGroupsList (nome -> DN), usado na consulta em lote
+			self._group_dns = {}
+			self._naming_context = None
 			self._log.logger.debug("Pegou configuracoes do arquivo conexao.ini.")
-			self.FILTER_GROUP_SEARCH_ZB = cp['ad']['filter_group_search_zb'].replace("'", '')
-			self.FILTER_GROUP_SUFFIX_ZB = cp['ad']['filter_group_suffix_zb'].replace("'", '')
-			# Monta filtro com grupos do AD informados no conexao.ini
-			self.FILTER_GROUP_SEARCH_AD = '(|'
-			cp_groups = cp['ad']['filter_group_search'].split('\n')
-			for group in list(filter(None, cp_groups)): # o filter elimina possiveis itens vazios na lista
-				self.FILTER_GROUP_SEARCH_AD += '(cn=' + group + ')'
-			self.FILTER_GROUP_SEARCH_AD += ')'
+			self.FILTER_GROUP_SEARCH_ZB = ad['filter_group_search_zb'].replace("'", '')
+			self.FILTER_GROUP_SUFFIX_ZB = ad['filter_group_suffix_zb'].replace("'", '')
+			self._group_mapper = GroupMapper(self.FILTER_GROUP_SEARCH_ZB, self.FILTER_GROUP_SUFFIX_ZB,
+											GroupMapper.parseRules(ad.get('group_rename', '')))
+			# Monta filtro com grupos do AD informados no conexao.ini ('*' e curinga). Com muitos
+			# grupos a consulta e dividida em filtros de ate filter_max_length caracteres.
+			cp_groups = list(filter(None, ad['filter_group_search'].split('\n'))) # o filter elimina possiveis itens vazios na lista
+			self.FILTER_GROUP_SEARCH_AD = orFilter('cn', cp_groups, wildcard=True)
+			self._filter_max_length = ad.getint('filter_max_length', 8000)
+			self._group_search_filters = orFilters('cn', cp_groups, wildcard=True, max_length=self._filter_max_length)
 
 	def connect(self):
 		"""
-		Metodo para conexao ao AD.
+		Metodo para conexao ao AD. Caso 'host' possua mais de um DC, tenta os
+		seguintes quando a conexao com o atual falha.
+		"""
+		_importLdap()
+		last_error = None
+		for server_url in self._server_urls:
+			try:
+				self._connect(server_url)
+			except ldap.LDAPError as e:
+				self._log.logger.warning("Falha ao conectar no DC %s: %s" % (server_url, e))
+				last_error = e
+			else:
+				self._server_url = server_url
+				return
+		raise last_error
+
+	def _connect(self, server_url):
+		"""
+		Metodo que abre o pool de conexoes com o DC informado.
 		"""
-		self.ldap = ldap.initialize(self._server_url)
-		#self.ldap.set_option(ldap.OPT_X_TLS_CACERTFILE , '/path/to/saved.cert') # ldaps://
-		self.ldap.set_option(ldap.OPT_REFERRALS, 0)
-		self.ldap.bind_s(self._bind_dn, self._bind_pass)
-		self._log.logger.debug("Conectou no AD.")
+		connections = []
+		try:
+			for i in range(self._pool_size):
+				conn = ldap.initialize(server_url)
+				#conn.set_option(ldap.OPT_X_TLS_CACERTFILE , '/path/to/saved.cert') # ldaps://
+				conn.set_option(ldap.OPT_REFERRALS, 0)
+				conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self._network_timeout)
+				conn.bind_s(self._bind_dn, self._bind_pass)
+				connections.append(conn)
+		except ldap.LDAPError:
+			for conn in connections:
+				conn.unbind()
+			raise
+		self._connections = connections
+		self._pool = queue.Queue()
+		for conn in connections:
+			self._pool.put(conn)
+		self.ldap = self._connections[0]
+		self._log.logger.debug("Conectou no AD %s (%d conexao(oes))." % (server_url, self._pool_size))
+
+	@contextmanager
+	def _borrowConnection(self):
+		"""
+		Metodo que empresta uma conexao do pool, devolvendo-a ao final do bloco.
+		"""
+		conn = self._pool.get()
+		try:
+			yield conn
+		finally:
+			self._pool.put(conn)
+
+	def isConnected(self):
+		"""
+		Metodo que verifica se as conexoes com o AD continuam validas (LDAP Who Am I).
+
+		Returns
+		-------
+		bool
+			False caso alguma conexao tenha sido perdida.
+		"""
+		if ldap is None:
+			return False
+		try:
+			for conn in self._connections:
+				conn.whoami_s()
+		except (AttributeError, ldap.LDAPError) as e:
+			self._log.logger.warning('Conexao com o AD perdida: ' + str(e))
+			return False
+		return True
 
 	def disconnect(self):
 		"""
 		Metodo para desconectar do AD.
 		"""
-		self.ldap.unbind()
+		for conn in self._connections:
+			conn.unbind()
 		self._log.logger.debug("Desconectou do AD.")
 
+	def searchPaged(self, base, scope, filter, attrs=None, conn=None):
+		"""
+		Metodo que realiza uma consulta paginada (RFC 2696) no AD, retornando as entradas
+		pagina a pagina. Evita o truncamento no MaxPageSize do AD e nao mantem o
+		resultado completo em memoria. Caso 'page_size = 0' no conexao.ini, usa search_s.
+
+		Parameters
+		----------
+		base : str
+			DN base da consulta.
+			Ex: 'OU=Grupos,DC=yourdomain,DC=com'
+		scope : int
+			Escopo da consulta (ldap.SCOPE_ONELEVEL, ldap.SCOPE_SUBTREE...).
+		filter : str
+			Filtro a ser utilizado na consulta ao AD.
+		attrs : list
+			Atributos a serem retornados. Opcional, por padrao retorna todos.
+		conn : ldap.ldapobject.LDAPObject
+			Conexao do pool a ser utilizada. Opcional, por padrao usa a conexao principal.
+
+		Returns
+		-------
+		generator
+			Tuplas (dn, atributos) retornadas pelo AD, ignorando referrals.
+			Ex:
+			('CN=FULANO OLIVEIRA,OU=STI,OU=IT Admins,DC=yourdomain,DC=com', {'sAMAccountName': [b'fulano']})
+		"""
+		conn = conn or self.ldap
+		if not self._page_size:
+			with metrics.timer('ldap.search') as timer:
+				result = conn.search_s(base, scope, filter, attrs)
+				timer.items_in = len(result)
+			for dn, entry in result:
+				if dn:
+					yield dn, entry
+			return
+
+		control = SimplePagedResultsControl(True, size=self._page_size, cookie='')
+		pages = 0
+		while True:
+			with metrics.timer('ldap.search') as timer:
+				msgid = conn.search_ext(base, scope, filter, attrs, serverctrls=[control])
+				rtype, rdata, rmsgid, serverctrls = conn.result3(msgid)
+				timer.items_in = len(rdata)
+			pages += 1
+			for dn, entry in rdata:
+				if dn:
+					yield dn, entry
+
+			control.cookie = None
+			for ctrl in serverctrls:
+				if ctrl.controlType == SimplePagedResultsControl.controlType:
+					control.cookie = ctrl.cookie
+			if not control.cookie:
+				break
+		self._log.logger.debug("Consulta paginada em %s retornou %d pagina(s)." % (base, pages))
+
 	def convertAdGroupNameToZabbix(self, group):
 		"""
-		Metodo estatico para conversao do nome do grupo do AD para uso no Zabbix:
+		Metodo para conversao do nome do grupo do AD para uso no Zabbix:
 		'Monitoracao - Your Group 1' -> 'Your Group 1 (AD)'.
+		O prefixo e removido somente do inicio do nome e as regras 'group_rename' do
+		conexao.ini sao aplicadas antes do sufixo (ver GroupMapper).
 		"""
-		return group.replace(self.FILTER_GROUP_SEARCH_ZB, '') + self.FILTER_GROUP_SUFFIX_ZB
+		return self._group_mapper.map(group)
 
-	def getGroups(self, filter):
+	def getGroups(self, filter, attrs=None):
 		"""
 		Metodo que retorna grupos do AD.
 
@@ -66,6 +240,9 @@ class AdManager:
 		filter : str
 			Filtro a ser utilizado na consulta ao AD.
 			Ex: 'cn=Monitoracao - *'
+		attrs : list
+			Atributos a serem retornados. Opcional, por padrao retorna todos.
+			Ex: ['cn']
 
 		Returns
 		-------
@@ -83,7 +260,17 @@ class AdManager:
 			'sAMAccountName': [b'Monitoracao - Acesso de leitura'], 'sAMAccountType': [b'536870912'], 'groupType': [b'-2147483644'], 
 			'objectCategory': [b'CN=Group,CN=Schema,CN=Configuration,DC=yourdomain,DC=com'], 'dSCorePropagationData': [b'16010101000000.0Z']})]
 		"""
-		result = self.ldap.search_s(self._groups_ou, ldap.SCOPE_ONELEVEL, filter)
+		if filter == self.FILTER_GROUP_SEARCH_AD and len(self._group_search_filters) > 1:
+			# Filtro padrao dividido em partes: junta os resultados sem repetir grupos
+			result = []
+			seen = set()
+			for part in self._group_search_filters:
+				for dn, entry in self.searchPaged(self._groups_ou, ldap.SCOPE_ONELEVEL, part, attrs):
+					if dn not in seen:
+						seen.add(dn)
+						result.append((dn, entry))
+			return result
+		result = list(self.searchPaged(self._groups_ou, ldap.SCOPE_ONELEVEL, filter, attrs))
 		return result
 
 	def getGroupsList(self, filter):
@@ -107,7 +294,9 @@ class AdManager:
 		query = self.getGroups(filter)
 		
 		for group in query:
-			group_list.append(group[1]['cn'][0].decode('utf-8'))
+			name = group[1]['cn'][0].decode('utf-8')
+			self._group_dns[name] = group[0]
+			group_list.append(name)
 
 		return group_list
 
@@ -131,19 +320,72 @@ class AdManager:
 			('CN=CICLANO COSTA,OU=ITI,OU=IT Admins,DC=yourdomain,DC=com', 
 			{'sAMAccountName': [b'ciclano']})]
 		"""
-		filter = self._group_filter.replace('{group_name}', group_name)
-		result = self.ldap.search_s(self._users_ou, ldap.SCOPE_SUBTREE, filter, ['samaccountname'])
-		return result
+		return list(self.iterUsersFromGroup(group_name))
 
-	def getGroupMembersDic(self, group_filter):
+	def iterUsersFromGroup(self, group_name, conn=None):
+		"""
+		Metodo que retorna, pagina a pagina, os usuarios membros de um grupo no AD.
+
+		Parameters
+		----------
+		group_name : str
+			Grupo do AD a ser utilizado no filtro para buscar os usuarios membros.
+			Ex: 'Monitoracao - Your Group 1'
+		conn : ldap.ldapobject.LDAPObject
+			Conexao do pool a ser utilizada. Opcional.
+
+		Returns
+		-------
+		generator
+			Tuplas no mesmo formato dos itens de getUsersFromGroup.
+		"""
+		group_dn = 'CN=%s,%s' % (ldap.dn.escape_dn_chars(group_name), self._groups_ou)
+		filter = self._group_filter % escapeValue(group_dn)
+		return self.searchPaged(self._users_ou, ldap.SCOPE_SUBTREE, filter, ['samaccountname'], conn)
+
+	def getAccounts(self, aliases):
+		"""
+		Metodo que retorna quais dos logins informados possuem conta ativa no dominio,
+		consultando em lote (filtros '(|(sAMAccountName=...)...)').
+
+		Parameters
+		----------
+		aliases : iterable
+			Ex: ['fulano', 'ciclano']
+
+		Returns
+		-------
+		set
+			Logins encontrados, com a grafia informada.
+			Ex:
+			{'fulano'}
+		"""
+		aliases = dict((alias.lower(), alias) for alias in aliases)
+		found = set()
+		for part in orFilters('sAMAccountName', sorted(aliases.values()), max_length=self._filter_max_length):
+			filter = '(&%s%s)' % (self._users_filter, part)
+			for dn, entry in self.searchPaged(self._users_ou, ldap.SCOPE_SUBTREE, filter, ['sAMAccountName']):
+				if 'sAMAccountName' in entry:
+					alias = aliases.get(entry['sAMAccountName'][0].decode('utf-8').lower())
+					if alias is not None:
+						found.add(alias)
+		return found
+
+	def getGroupMembersDic(self, group_filter, groups=None):
 		"""
 		Metodo que retorna dicionario com grupo e seus respectivos membros do AD.
+		Utiliza a consulta em lote caso 'membership_mode = bulk' no conexao.ini, voltando
+		para a consulta por grupo caso ocorra erro no AD.
 
 		Parameters
 		----------
 		group_filter : str
 			Filtro a ser utilizado no AD para buscar os usuarios membros do grupo/filtro repassdo.
 			Ex: 'cn=Monitoracao - *'
+		groups : list
+			Nomes dos grupos ja obtidos com getGroupsList(group_filter). Opcional,
+			evita uma nova consulta dos grupos no AD.
+			Ex: ['Monitoracao - Your Group 1']
 		
 		Returns
 		-------
@@ -155,17 +397,520 @@ class AdManager:
 			{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}, {'group': 'Your Group', 
 			'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}, {'alias': '´fulano', 'name': 'FULANO OLIVEIRA'}]}]
 		"""
-		groups_members = []
-		for ad_group in self.getGroupsList(group_filter):
-			zb_group = self.convertAdGroupNameToZabbix(ad_group)
-			members = []
+		return self._toDic(self.iterGroupMembers(group_filter, groups))
+
+	def getGroupMembersIndex(self, group_filter, groups=None):
+		"""
+		Metodo que retorna os grupos do AD e seus membros em um MembershipIndex, consumindo os
+		membros conforme sao lidos do AD (sem montar a lista de getGroupMembersDic).
+
+		Parameters
+		----------
+		group_filter : str
+			Filtro a ser utilizado no AD para buscar os grupos.
+			Ex: 'cn=Monitoracao - *'
+		groups : list
+			Nomes dos grupos ja obtidos com getGroupsList(group_filter). Opcional.
+
+		Returns
+		-------
+		MembershipIndex
+			Indice compacto grupo -> membros.
+		"""
+		index = MembershipIndex()
+		for zb_group, members in self.iterGroupMembers(group_filter, groups):
+			index.addGroup(zb_group)
+			for alias, name in members:
+				index.add(zb_group, alias, name)
+		return index
+
+	def iterGroupMembers(self, group_filter, groups=None):
+		"""
+		Metodo que retorna, grupo a grupo, os membros dos grupos do AD conforme sao lidos.
+		Utiliza a consulta em lote caso 'membership_mode = bulk' no conexao.ini, voltando
+		para a consulta por grupo caso ocorra erro no AD.
+
+		Parameters
+		----------
+		group_filter : str
+			Filtro a ser utilizado no AD para buscar os grupos.
+			Ex: 'cn=Monitoracao - *'
+		groups : list
+			Nomes dos grupos ja obtidos com getGroupsList(group_filter). Opcional.
+
+		Returns
+		-------
+		generator
+			Tuplas (nome do grupo no Zabbix, iterador de tuplas (alias, nome)). Os membros de
+			cada grupo devem ser consumidos antes de avancar para o proximo grupo.
+			Ex:
+			('Your Group (AD)', <generator>) -> ('thiago', 'THIAGO MURILO DINIZ')
+		"""
+		if groups is None:
+			groups = self.getGroupsList(group_filter)
+		if self._membership_mode == 'bulk':
+			try:
+				graph = self.getDirectoryGraph(groups)
+				group_dns = self._getGraphGroupDns(graph, groups)
+			except (ldap.LDAPError, KeyError) as e:
+				self._log.logger.warning("Falha na consulta em lote, usando consulta por grupo: " + str(e))
+			else:
+				return self._iterGroupMembersBulk(graph, group_dns)
+		return self._iterGroupMembersPerGroup(groups)
+
+	def getGroupMembersDicPerGroup(self, group_filter, groups=None):
+		"""
+		Metodo que retorna dicionario com grupo e seus respectivos membros do AD,
+		executando uma consulta (LDAP_MATCHING_RULE_IN_CHAIN) por grupo.
+
+		Parameters
+		----------
+		group_filter : str
+			Filtro a ser utilizado no AD para buscar os usuarios membros do grupo/filtro repassdo.
+			Ex: 'cn=Monitoracao - *'
+		groups : list
+			Nomes dos grupos ja obtidos com getGroupsList(group_filter). Opcional,
+			evita uma nova consulta dos grupos no AD.
+			Ex: ['Monitoracao - Your Group 1']
+		
+		Returns
+		-------
+		dict
+			Mesmo formato de getGroupMembersDic.
+		"""
+		if groups is None:
+			groups = self.getGroupsList(group_filter)
+		return self._toDic(self._iterGroupMembersPerGroup(groups))
+
+	def _iterGroupMembersPerGroup(self, groups):
+		"""
+		Metodo que retorna os membros de cada grupo com uma consulta por grupo. Com pool de
+		conexoes os grupos sao consultados simultaneamente e retornados conforme terminam.
+		"""
+		if self._pool_size > 1:
+			# Janela limitada de consultas pendentes: os grupos sao retornados conforme terminam,
+			# mantendo em memoria no maximo pool_size * 2 resultados
+			groups = iter(groups)
+			pending = {}
+			with ThreadPoolExecutor(max_workers=self._pool_size) as executor:
+				for ad_group in islice(groups, self._pool_size * 2):
+					pending[executor.submit(self._getGroupMembers, ad_group)] = ad_group
+				while pending:
+					done, _ = wait(pending, return_when=FIRST_COMPLETED)
+					for future in done:
+						ad_group = pending.pop(future)
+						for next_group in islice(groups, 1):
+							pending[executor.submit(self._getGroupMembers, next_group)] = next_group
+						yield self.convertAdGroupNameToZabbix(ad_group), iter(future.result())
+		else:
+			for ad_group in groups:
+				yield self.convertAdGroupNameToZabbix(ad_group), self._iterMemberRecords(self.iterUsersFromGroup(ad_group))
+
+	def _getGroupMembers(self, ad_group):
+		"""
+		Metodo que retorna a lista de tuplas (alias, nome) dos membros de um grupo do AD,
+		usando uma conexao do pool.
+		"""
+		with self._borrowConnection() as conn:
+			return list(self._iterMemberRecords(self.iterUsersFromGroup(ad_group, conn)))
 
-			for member in self.getUsersFromGroup(ad_group):
-				if 'sAMAccountName' in member[1]:
-					members.append({
-									'alias': member[1]['sAMAccountName'][0].decode('utf-8'),
-									'name': member[0].split(',')[0].replace('CN=','')
-									})
+	def _iterMemberRecords(self, entries):
+		"""
+		Metodo que converte as entradas de usuarios do AD em tuplas (alias, nome).
+		"""
+		for member in entries:
+			if 'sAMAccountName' in member[1]:
+				yield member[1]['sAMAccountName'][0].decode('utf-8'), member[0].split(',')[0].replace('CN=','')
+
+	def getGroupMembersDicBulk(self, group_filter, groups=None):
+		"""
+		Metodo que retorna dicionario com grupo e seus respectivos membros do AD,
+		carregando todos os grupos e usuarios ativos em poucas consultas e expandindo
+		os grupos aninhados localmente.
+
+		Parameters
+		----------
+		group_filter : str
+			Filtro a ser utilizado no AD para buscar os grupos.
+			Ex: 'cn=Monitoracao - *'
+		groups : list
+			Nomes dos grupos ja obtidos com getGroupsList(group_filter). Opcional,
+			evita uma nova consulta dos grupos no AD.
+			Ex: ['Monitoracao - Your Group 1']
+		
+		Returns
+		-------
+		dict
+			Mesmo formato de getGroupMembersDic.
+		"""
+		if groups is None:
+			groups = self.getGroupsList(group_filter)
+		graph = self.getDirectoryGraph(groups)
+		return self._toDic(self._iterGroupMembersBulk(graph, self._getGraphGroupDns(graph, groups)))
+
+	def _getGraphGroupDns(self, graph, groups):
+		"""
+		Metodo que retorna o DN de cada grupo monitorado, conforme retornado por getGroupsList.
+
+		Returns
+		-------
+		list
+			Tuplas (nome do grupo no AD, DN do grupo).
+
+		Raises
+		------
+		KeyError
+			Caso algum grupo nao esteja no grafo (ex: fora da base consultada), para que a
+			consulta por grupo seja utilizada em vez de retornar o grupo sem membros.
+		"""
+		group_dns = []
+		for ad_group in groups:
+			group_dn = self._getGroupDn(ad_group)
+			if group_dn.lower() not in graph['groups']:
+				raise KeyError('Grupo ' + group_dn + ' nao encontrado no grafo do AD')
+			group_dns.append((ad_group, group_dn))
+		return group_dns
+
+	def _getGroupDn(self, ad_group):
+		"""
+		Metodo que retorna o DN do grupo conforme retornado por getGroupsList ou, caso o grupo
+		nao tenha sido consultado, o DN do grupo em groups_ou.
+		"""
+		return self._group_dns.get(ad_group) or 'CN=%s,%s' % (ldap.dn.escape_dn_chars(ad_group), self._groups_ou)
 
-			groups_members.append({'group': zb_group, 'members': members})
-		return groups_members
+	def _iterGroupMembersBulk(self, graph, group_dns):
+		"""
+		Metodo que retorna os membros de cada grupo expandindo os grupos aninhados no grafo.
+		"""
+		for ad_group, group_dn in group_dns:
+			members = ((graph['users'][user_dn.lower()], user_dn.split(',')[0].replace('CN=',''))
+						for user_dn in self._expandGroup(graph, group_dn))
+			yield self.convertAdGroupNameToZabbix(ad_group), members
+
+	def _toDic(self, group_members):
+		"""
+		Metodo que converte o retorno de iterGroupMembers no formato de getGroupMembersDic.
+		"""
+		return [{'group': zb_group, 'members': [{'alias': alias, 'name': name} for alias, name in members]}
+				for zb_group, members in group_members]
+
+	def getDirectoryGraph(self, groups=None):
+		"""
+		Metodo que carrega os grupos monitorados e os grupos aninhados neles (com seus membros
+		diretos) e os usuarios ativos do AD. Caso 'incremental = true' no conexao.ini, busca
+		apenas as alteracoes desde a ultima execucao (ver getDirectoryGraphIncremental).
+
+		Parameters
+		----------
+		groups : list
+			Nomes dos grupos monitorados ja obtidos com getGroupsList. Opcional, por padrao
+			consulta os grupos do filtro filter_group_search.
+			Ex: ['Monitoracao - Your Group 1']
+
+		Returns
+		-------
+		dict
+			Dicionario contendo os grupos (key 'groups', DN -> lista de DNs membros),
+			os usuarios ativos (key 'users', DN -> sAMAccountName) e o DN de cada objeto
+			(key 'guids', objectGUID em hexadecimal -> DN). DNs em minusculo.
+			Ex:
+			{'groups': {'cn=monitoracao - your group,ou=grupos,dc=yourdomain,dc=com': 
+			['CN=FULANO OLIVEIRA,OU=STI,OU=IT Admins,DC=yourdomain,DC=com']}, 
+			'users': {'cn=fulano oliveira,ou=sti,ou=it admins,dc=yourdomain,dc=com': 'fulano'},
+			'guids': {'83d1d22a5111bf4f843da9f16d91c2ba': 'cn=monitoracao - your group,ou=grupos,dc=yourdomain,dc=com'}}
+		"""
+		if groups is None:
+			groups = self.getGroupsList(self.FILTER_GROUP_SEARCH_AD)
+		group_dns = [self._getGroupDn(ad_group) for ad_group in groups]
+		if self._incremental:
+			return self.getDirectoryGraphIncremental(group_dns)
+		return self._loadDirectoryGraph(group_dns)
+
+	def _loadDirectoryGraph(self, group_dns):
+		"""
+		Metodo que carrega o grafo completo dos grupos monitorados (DNs informados) e dos
+		usuarios ativos do AD.
+		"""
+		if self._pool_size > 1:
+			with ThreadPoolExecutor(max_workers=2) as executor:
+				groups = executor.submit(self._loadGroupsGraph, group_dns)
+				users = executor.submit(self._loadActiveUsers)
+				(groups, group_guids), (users, user_guids) = groups.result(), users.result()
+		else:
+			(groups, group_guids), (users, user_guids) = self._loadGroupsGraph(group_dns), self._loadActiveUsers()
+
+		group_guids.update(user_guids)
+		self._log.logger.debug("Carregou %d grupos e %d usuarios do AD." % (len(groups), len(users)))
+		return {'groups': groups, 'users': users, 'guids': group_guids}
+
+	def _loadGroupsGraph(self, group_dns, groups=None, guids=None, frontier=()):
+		"""
+		Metodo que retorna os grupos monitorados e, nivel a nivel, os grupos aninhados neles
+		com seus membros diretos (DN -> lista de DNs) e o DN de cada grupo por objectGUID.
+		Cada nivel e buscado em lote com filtros '(|(memberOf=...)...)' contendo os grupos do
+		nivel anterior, sem carregar os demais grupos do dominio.
+
+		Parameters
+		----------
+		group_dns : list
+			DNs dos grupos monitorados.
+		groups : dict
+			Grupos ja carregados, completados com os grupos que faltam. Opcional.
+		guids : dict
+			objectGUID -> DN dos objetos ja carregados. Opcional.
+		frontier : list
+			DNs de grupos ja carregados cujos grupos aninhados devem ser buscados. Opcional.
+		"""
+		groups = {} if groups is None else groups
+		guids = {} if guids is None else guids
+		with self._borrowConnection() as conn:
+			roots = [dn for dn in group_dns if dn.lower() not in groups]
+			level = self._searchGroups('distinguishedName', roots, groups, guids, conn) + list(frontier)
+			while level:
+				level = self._searchGroups('memberOf', level, groups, guids, conn)
+		return groups, guids
+
+	def _searchGroups(self, attr, dns, groups, guids, conn):
+		"""
+		Metodo que busca em lote os grupos cujo atributo possui algum dos DNs informados e
+		adiciona ao grafo os grupos ainda nao carregados, retornando os seus DNs.
+		"""
+		found = []
+		# Grupos monitorados (groups_ou) e aninhados podem estar fora de users_ou
+		naming_context = self._getNamingContext(conn)
+		for part in orFilters(attr, dns, max_length=self._filter_max_length):
+			filter = '(&(objectClass=group)%s)' % part
+			for dn, attrs in self.searchPaged(naming_context, ldap.SCOPE_SUBTREE, filter, ['member', 'objectGUID'], conn):
+				key = sys.intern(dn.lower())
+				if key not in groups:
+					groups[key] = self._getMemberValues(dn, attrs, conn)
+					guids[attrs['objectGUID'][0].hex()] = key
+					found.append(dn)
+		return found
+
+	def _getNamingContext(self, conn):
+		"""
+		Metodo que retorna o DN da raiz do dominio (defaultNamingContext do RootDSE).
+		"""
+		if self._naming_context is None:
+			with metrics.timer('ldap.search'):
+				root_dse = conn.search_s('', ldap.SCOPE_BASE, '(objectClass=*)', ['defaultNamingContext'])[0][1]
+			self._naming_context = root_dse['defaultNamingContext'][0].decode('utf-8')
+		return self._naming_context
+
+	def _loadActiveUsers(self):
+		"""
+		Metodo que retorna os usuarios ativos do AD (DN -> sAMAccountName)
+		e o DN de cada usuario por objectGUID.
+		"""
+		users = {}
+		guids = {}
+		with self._borrowConnection() as conn:
+			for dn, attrs in self.searchPaged(self._users_ou, ldap.SCOPE_SUBTREE, self._users_filter, ['sAMAccountName', 'objectGUID'], conn):
+				if 'sAMAccountName' in attrs:
+					key = sys.intern(dn.lower())
+					users[key] = attrs['sAMAccountName'][0].decode('utf-8')
+					guids[attrs['objectGUID'][0].hex()] = key
+		return users, guids
+
+	def getDirectoryGraphIncremental(self, group_dns):
+		"""
+		Metodo que retorna o grafo de grupos e usuarios do AD (mesmo formato de getDirectoryGraph)
+		buscando apenas os objetos alterados (uSNChanged) ou removidos desde a ultima execucao.
+		O grafo e o maior USN ja processado sao gravados por DC no arquivo 'state_file', pois
+		o uSNChanged e local a cada DC. Sem estado para o DC atual, carrega o grafo completo.
+		Grupos monitorados novos e grupos aninhados nos grupos alterados sao buscados em
+		seguida (ver _loadGroupsGraph).
+
+		Parameters
+		----------
+		group_dns : list
+			DNs dos grupos monitorados.
+
+		Returns
+		-------
+		dict
+			Mesmo formato de getDirectoryGraph.
+		"""
+		with metrics.timer('ldap.search'):
+			root_dse = self.ldap.search_s('', ldap.SCOPE_BASE, '(objectClass=*)',
+										['highestCommittedUSN', 'dsServiceName', 'defaultNamingContext'])[0][1]
+		highest_usn = int(root_dse['highestCommittedUSN'][0])
+		dc = root_dse['dsServiceName'][0].decode('utf-8')
+		naming_context = root_dse['defaultNamingContext'][0].decode('utf-8')
+
+		state = self._loadState()
+		dc_state = state.get(dc)
+		if dc_state is None:
+			self._log.logger.info("Sem estado incremental para o DC " + dc + ", carregando grafo completo.")
+			graph = self._loadDirectoryGraph(group_dns)
+		else:
+			graph = self._internGraph(dc_state['graph'])
+			changed_groups = self._applyChanges(graph, dc_state['usn'] + 1, naming_context)
+			self._loadGroupsGraph(group_dns, graph['groups'], graph['guids'], changed_groups)
+			self._pruneGroups(graph, group_dns)
+
+		state[dc] = {'usn': highest_usn, 'graph': graph}
+		self._saveState(state)
+		return graph
+
+	def _pruneGroups(self, graph, group_dns):
+		"""
+		Metodo que remove do grafo os grupos que deixaram de ser monitorados ou aninhados
+		em algum grupo monitorado.
+		"""
+		reachable = set(dn.lower() for dn in group_dns if dn.lower() in graph['groups'])
+		pending = deque(reachable)
+		while pending:
+			for member in graph['groups'][pending.popleft()]:
+				key = member.lower()
+				if key in graph['groups'] and key not in reachable:
+					reachable.add(key)
+					pending.append(key)
+		unreachable = set(graph['groups']).difference(reachable)
+		if unreachable:
+			for key in unreachable:
+				del graph['groups'][key]
+			graph['guids'] = dict((guid, key) for guid, key in graph['guids'].items() if key not in unreachable)
+
+	def _internGraph(self, graph):
+		"""
+		Metodo que internaliza (sys.intern) os DNs do grafo lido do arquivo de estado, para que
+		cada DN repetido nos membros dos grupos ocupe memoria uma unica vez.
+		"""
+		graph['groups'] = dict((sys.intern(key), [sys.intern(member) for member in members])
+							for key, members in graph['groups'].items())
+		graph['users'] = dict((sys.intern(key), alias) for key, alias in graph['users'].items())
+		graph['guids'] = dict((guid, sys.intern(key)) for guid, key in graph['guids'].items())
+		return graph
+
+	def _applyChanges(self, graph, from_usn, naming_context):
+		"""
+		Metodo que aplica no grafo os grupos e usuarios alterados ou removidos a partir do USN informado,
+		retornando os DNs dos grupos alterados.
+		"""
+		changed = removed = 0
+		changed_groups = []
+		users_ou = self._users_ou.lower()
+		filter = '(&(|(objectClass=group)(objectClass=user))(uSNChanged>=%d))' % from_usn
+		attrs = ['objectClass', 'objectGUID', 'member', 'sAMAccountName', 'userAccountControl']
+		with self._borrowConnection() as conn:
+			for dn, entry in self.searchPaged(naming_context, ldap.SCOPE_SUBTREE, filter, attrs, conn):
+				guid = entry['objectGUID'][0].hex()
+				key = sys.intern(dn.lower())
+				old_key = graph['guids'].pop(guid, None)
+				known_group = (old_key or key) in graph['groups']
+				if old_key and old_key != key:
+					# Objeto renomeado/movido: remove o DN antigo e atualiza os membros dos grupos
+					self._renameInGraph(graph, old_key, dn)
+					graph['groups'].pop(old_key, None)
+					graph['users'].pop(old_key, None)
+				graph['groups'].pop(key, None)
+				graph['users'].pop(key, None)
+				changed += 1
+				classes = [value.lower() for value in entry['objectClass']]
+				if b'group' in classes:
+					if not known_group:
+						continue # grupo fora do grafo: se foi aninhado, e buscado a partir do grupo pai
+					graph['groups'][key] = self._getMemberValues(dn, entry, conn)
+					changed_groups.append(dn)
+				elif not key.endswith(users_ou):
+					continue # usuario movido para fora de users_ou
+				elif 'sAMAccountName' in entry and not int(entry.get('userAccountControl', [b'0'])[0]) & 2:
+					graph['users'][key] = entry['sAMAccountName'][0].decode('utf-8')
+				else:
+					continue # usuario desabilitado
+				graph['guids'][guid] = key
+
+			# Objetos removidos ficam em 'CN=Deleted Objects', visiveis com o controle LDAP_SERVER_SHOW_DELETED_OID
+			show_deleted = ldap.controls.LDAPControl('1.2.840.113556.1.4.417', True)
+			filter = '(&(isDeleted=TRUE)(uSNChanged>=%d))' % from_usn
+			with metrics.timer('ldap.search') as timer:
+				deleted = conn.search_ext_s(naming_context, ldap.SCOPE_SUBTREE, filter, ['objectGUID'], serverctrls=[show_deleted])
+				timer.items_in = len(deleted)
+			for dn, entry in deleted:
+				if not dn:
+					continue
+				key = graph['guids'].pop(entry['objectGUID'][0].hex(), None)
+				if key:
+					graph['groups'].pop(key, None)
+					graph['users'].pop(key, None)
+					removed += 1
+
+		self._log.logger.debug("Sincronizacao incremental: %d objeto(s) alterado(s), %d removido(s)." % (changed, removed))
+		return changed_groups
+
+	def _renameInGraph(self, graph, old_key, new_dn):
+		"""
+		Metodo que substitui o DN antigo de um objeto renomeado/movido nos membros dos grupos.
+		"""
+		for members in graph['groups'].values():
+			for i, member in enumerate(members):
+				if member.lower() == old_key:
+					members[i] = sys.intern(new_dn)
+
+	def _loadState(self):
+		"""
+		Metodo que le o arquivo de estado da sincronizacao incremental.
+		"""
+		try:
+			with open(self._state_file, encoding='utf-8') as state_file:
+				return json.load(state_file)
+		except FileNotFoundError:
+			return {}
+		except ValueError:
+			self._log.logger.warning("Arquivo de estado " + self._state_file + " invalido, ignorando.")
+			return {}
+
+	def _saveState(self, state):
+		"""
+		Metodo que grava o arquivo de estado da sincronizacao incremental de forma atomica.
+		"""
+		tmp_file = self._state_file + '.tmp'
+		with open(tmp_file, 'w', encoding='utf-8') as state_file:
+			json.dump(state, state_file)
+		os.replace(tmp_file, self._state_file)
+
+	def _getMemberValues(self, dn, attrs, conn):
+		"""
+		Metodo que retorna os membros de um grupo, buscando as faixas restantes
+		quando o AD retorna o atributo 'member' paginado (ex: 'member;range=0-1499').
+		"""
+		values = list(attrs.get('member', []))
+		range_key = self._getRangeKey(attrs)
+		while range_key:
+			values.extend(attrs[range_key])
+			end = range_key.rsplit('-', 1)[1]
+			if end == '*':
+				break
+			with metrics.timer('ldap.search'):
+				result = conn.search_s(dn, ldap.SCOPE_BASE, '(objectClass=*)', ['member;range=%d-*' % (int(end) + 1)])
+			attrs = result[0][1]
+			range_key = self._getRangeKey(attrs)
+		# Um usuario e membro de muitos grupos: cada DN fica uma unica vez em memoria
+		return [sys.intern(value.decode('utf-8')) for value in values]
+
+	def _getRangeKey(self, attrs):
+		for key in attrs:
+			if key.lower().startswith('member;range='):
+				return key
+		return None
+
+	def _expandGroup(self, graph, group_dn):
+		"""
+		Metodo que retorna, conforme sao encontrados e sem repeticao, os DNs dos usuarios ativos
+		membros (diretos ou aninhados) de um grupo.
+		"""
+		seen_users = set()
+		seen_groups = {group_dn.lower()}
+		pending = deque([group_dn.lower()])
+		while pending:
+			for member in graph['groups'].get(pending.popleft(), []):
+				key = member.lower()
+				if key in graph['users']:
+					if key not in seen_users:
+						seen_users.add(key)
+						yield member
+				elif key in graph['groups'] and key not in seen_groups:
+					seen_groups.add(key)
+					pending.append(key)
@@ -0,0 +1,269 @@
+from AdManager import AdManager
+from Membership import MembershipIndex
+from Logging import LogManager
+from Metrics import metrics
+from Config import getConfig
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+def createAdManager(config=None):
+	"""
+	Metodo que retorna o gerenciador do AD conforme o conexao.ini: AdSourceSet quando
+	existem secoes '[ad:<nome>]' (varios dominios), senao AdManager.
+
+	Parameters
+	----------
+	config : Config
+		Configuracao ja lida do conexao.ini. Opcional (padrao: getConfig()).
+	"""
+	config = config or getConfig()
+	if len(config.adSections()) > 1:
+		return AdSourceSet(config)
+	return AdManager(config=config)
+
+
+class AdSourceSet:
+	"""
+	Classe que consulta simultaneamente varios dominios do AD (secao [ad] e secoes
+	'[ad:<nome>]' do conexao.ini) e junta os resultados em um unico MembershipIndex.
+	Possui os mesmos metodos do AdManager utilizados pela sincronizacao.
+
+	Usuarios com o mesmo sAMAccountName em mais de um dominio pertencem ao primeiro
+	dominio, na ordem das secoes do conexao.ini, que possui a conta ativa. O dominio
+	escolhido e gravado em 'owners_file' e mantido nas proximas execucoes. Os demais
+	dominios seguem 'duplicate_users' (secao [ad]): 'first' descarta o usuario e
+	'qualify' o mantem como 'alias@<nome>'.
+	"""
+
+	def __init__(self, config=None):
+		"""
+		Metodo construtor.
+		Pega configuracoes iniciais do arquivo conexao.ini.
+
+		Parameters
+		----------
+		config : Config
+			Configuracao ja lida do conexao.ini. Opcional (padrao: getConfig()).
+		"""
+		config = config or getConfig()
+		self.sources = [AdManager(section, config) for section in config.adSections()]
+		ad = config.section('ad')
+		self._log = LogManager(ad['log_level'], __name__)
+		self._duplicate_users = ad.get('duplicate_users', 'first')
+		self._owners_file = ad.get('owners_file', 'ad_owners.json')
+		primary = self.sources[0]
+		self.FILTER_GROUP_SEARCH_AD = primary.FILTER_GROUP_SEARCH_AD
+		self.FILTER_GROUP_SEARCH_ZB = primary.FILTER_GROUP_SEARCH_ZB
+		self.FILTER_GROUP_SUFFIX_ZB = primary.FILTER_GROUP_SUFFIX_ZB
+		self._groups = {}
+		self._owners = {}
+
+	def _map(self, function):
+		"""
+		Metodo que executa a funcao para cada dominio simultaneamente, retornando os
+		resultados na ordem dos dominios no conexao.ini.
+		"""
+		with ThreadPoolExecutor(max_workers=len(self.sources)) as executor:
+			return list(executor.map(function, self.sources))
+
+	def _sourceFilter(self, source, filter):
+		"""
+		Metodo que retorna o filtro de grupos do dominio quando o filtro informado e o padrao.
+		"""
+		return source.FILTER_GROUP_SEARCH_AD if filter == self.FILTER_GROUP_SEARCH_AD else filter
+
+	def _sourceName(self, source):
+		return source.section.split(':', 1)[1] if ':' in source.section else source.section
+
+	def connect(self):
+		"""
+		Metodo para conexao a todos os dominios. Cada dominio tenta os seus DCs em ordem;
+		a falha de todos os DCs de um dominio interrompe a conexao.
+		"""
+		self._map(lambda source: source.connect())
+		self._log.logger.debug("Conectou em %d dominio(s) do AD." % len(self.sources))
+
+	def isConnected(self):
+		"""
+		Metodo que verifica se as conexoes com todos os dominios continuam validas.
+		"""
+		return all(source.isConnected() for source in self.sources)
+
+	def disconnect(self):
+		"""
+		Metodo para desconectar de todos os dominios.
+		"""
+		for source in self.sources:
+			try:
+				source.disconnect()
+			except Exception as e:
+				self._log.logger.debug('Falha ao desconectar do dominio %s: %s' % (source.section, e))
+
+	def convertAdGroupNameToZabbix(self, group):
+		"""
+		Metodo para conversao do nome do grupo do AD para uso no Zabbix, com as regras
+		do primeiro dominio que possui o grupo.
+		"""
+		return self._owners.get(group, self.sources[0]).convertAdGroupNameToZabbix(group)
+
+	def getGroupsList(self, filter):
+		"""
+		Metodo que retorna os nomes dos grupos de todos os dominios, sem repeticao e na
+		ordem dos dominios no conexao.ini.
+
+		Parameters
+		----------
+		filter : str
+			Filtro a ser utilizado na consulta dos grupos no AD. O filtro padrao
+			(FILTER_GROUP_SEARCH_AD) e substituido pelo filtro de cada dominio.
+
+		Returns
+		-------
+		list
+			Ex:
+			['Monitoracao - Acesso de leitura', 'Monitoracao - Your Group 1']
+		"""
+		results = self._map(lambda source: source.getGroupsList(self._sourceFilter(source, filter)))
+		group_list = []
+		for source, groups in zip(self.sources, results):
+			self._groups[source.section] = groups
+			for group in groups:
+				if group not in self._owners:
+					self._owners[group] = source
+				if group not in group_list:
+					group_list.append(group)
+		return group_list
+
+	def getGroupMembersIndex(self, group_filter, groups=None):
+		"""
+		Metodo que consulta os membros dos grupos em todos os dominios simultaneamente e
+		junta os resultados. Grupos com o mesmo nome no Zabbix tem os membros unidos.
+
+		Parameters
+		----------
+		group_filter : str
+			Filtro a ser utilizado no AD para buscar os grupos.
+		groups : list
+			Nomes dos grupos ja obtidos com getGroupsList(group_filter). Opcional.
+
+		Returns
+		-------
+		MembershipIndex
+			Indice compacto grupo -> membros de todos os dominios.
+		"""
+		selected = set(groups) if groups is not None else None
+
+		def load(source):
+			source_groups = self._groups.get(source.section)
+			if selected is None or source_groups is None:
+				source_groups = None
+			else:
+				source_groups = [group for group in source_groups if group in selected]
+			with metrics.timer('ad.source.' + self._sourceName(source)) as timer:
+				index = source.getGroupMembersIndex(self._sourceFilter(source, group_filter), source_groups)
+				timer.items_in = index.countMemberships()
+			return index
+
+		return self._merge(self._map(load))
+
+	def getGroupMembersDic(self, group_filter, groups=None):
+		"""
+		Metodo que retorna os grupos e membros de todos os dominios no formato de
+		AdManager.getGroupMembersDic.
+		"""
+		return self.getGroupMembersIndex(group_filter, groups).toList()
+
+	def _merge(self, indexes):
+		"""
+		Metodo que junta os indices dos dominios, na ordem do conexao.ini, aplicando a
+		regra de 'duplicate_users' aos usuarios que nao pertencem ao dominio (ver getUserOwners).
+		"""
+		owners = self.getUserOwners(indexes)
+		merged = MembershipIndex()
+		duplicates = set()
+		for source, index in zip(self.sources, indexes):
+			for group in index.iterGroups():
+				merged.addGroup(group.name)
+				for user in group.members:
+					alias = user.alias
+					if owners[alias] != source.section:
+						duplicates.add(alias)
+						if self._duplicate_users != 'qualify':
+							continue
+						alias = '%s@%s' % (alias, self._sourceName(source))
+					merged.add(group.name, alias, user.name)
+		if duplicates:
+			self._log.logger.warning('%d usuario(s) existem em mais de um dominio (duplicate_users = %s): %s'
+									% (len(duplicates), self._duplicate_users, sorted(duplicates)[:10]))
+		return merged
+
+	def getUserOwners(self, indexes):
+		"""
+		Metodo que retorna o dominio de cada usuario membro dos grupos. O dono gravado em
+		owners_file e mantido enquanto o usuario for membro de algum grupo nesse dominio.
+		Os demais usuarios sao consultados em lote em todos os dominios: o dono gravado e
+		mantido enquanto possuir a conta ativa, senao o dono passa a ser o primeiro
+		dominio, na ordem do conexao.ini, que possui a conta ativa.
+
+		Parameters
+		----------
+		indexes : list
+			MembershipIndex de cada dominio, na ordem de self.sources.
+
+		Returns
+		-------
+		dict
+			Alias -> secao do conexao.ini do dominio dono.
+			Ex:
+			{'fulano': 'ad', 'ciclano': 'ad:filial'}
+		"""
+		sections = [source.section for source in self.sources]
+		members = dict((source.section, index.aliases()) for source, index in zip(self.sources, indexes))
+		stored = self._loadOwners()
+		owners = {}
+		lookup = set()
+		for section in sections:
+			for alias in members[section]:
+				if alias in owners or alias in lookup:
+					continue
+				owner = stored.get(alias)
+				if owner in members and alias in members[owner]:
+					owners[alias] = owner
+				else:
+					lookup.add(alias)
+		if lookup:
+			accounts = self._map(lambda source: source.getAccounts(lookup))
+			for alias in lookup:
+				found = [section for section, aliases in zip(sections, accounts) if alias in aliases]
+				if stored.get(alias) in found:
+					owners[alias] = stored[alias]
+				else:
+					# Sem conta ativa encontrada: primeiro dominio que retornou o usuario nos grupos
+					owners[alias] = (found or [section for section in sections if alias in members[section]])[0]
+			self._log.logger.debug('Dono de %d usuario(s) definido pela consulta das contas nos dominios.' % len(lookup))
+		if owners != stored:
+			self._saveOwners(owners)
+		return owners
+
+	def _loadOwners(self):
+		"""
+		Metodo que le o arquivo com o dominio dono de cada usuario.
+		"""
+		try:
+			with open(self._owners_file, encoding='utf-8') as owners_file:
+				return json.load(owners_file)
+		except FileNotFoundError:
+			return {}
+		except ValueError:
+			self._log.logger.warning("Arquivo de donos " + self._owners_file + " invalido, ignorando.")
+			return {}
+
+	def _saveOwners(self, owners):
+		"""
+		Metodo que grava o arquivo com o dominio dono de cada usuario de forma atomica.
+		"""
+		tmp_file = self._owners_file + '.tmp'
+		with open(tmp_file, 'w', encoding='utf-8') as owners_file:
+			json.dump(owners, owners_file)
+		os.replace(tmp_file, self._owners_file)
@@ -0,0 +1,257 @@
+import asyncio
+import http.client
+import json
+import queue
+import ssl
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from Metrics import metrics
+
+
+class ZabbixAPIException(Exception):
+	"""
+	Erro retornado pela API Zabbix. O ZabbixManager converte para esta classe as excecoes
+	do py-zabbix, de forma que os dois clientes levantam a mesma excecao.
+	"""
+
+
+class AsyncZabbixAPI:
+	"""
+	Cliente JSON-RPC assincrono (asyncio) da API Zabbix, com conexoes HTTP persistentes
+	(keep-alive) reaproveitadas entre as chamadas e limite de chamadas simultaneas.
+	"""
+
+	def __init__(self, url, max_concurrency=8, timeout=30, verify=True, auth=None):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		url : str
+			URL do frontend Zabbix.
+			Ex: 'https://zabbix.yourdomain.com/'
+		max_concurrency : int
+			Quantidade maxima de chamadas simultaneas (e de conexoes abertas).
+		timeout : int
+			Timeout (segundos) de cada chamada.
+		verify : bool
+			Valida o certificado do servidor (https).
+		auth : str
+			Token de sessao/API ja existente. Opcional.
+		"""
+		if not url.endswith('api_jsonrpc.php'):
+			url = url.rstrip('/') + '/api_jsonrpc.php'
+		parts = urlsplit(url)
+		self.url = url
+		self.auth = auth
+		self._https = parts.scheme == 'https'
+		self._host = parts.hostname
+		self._port = parts.port
+		self._path = parts.path
+		self._timeout = timeout
+		self._context = ssl.create_default_context()
+		if not verify:
+			self._context.check_hostname = False
+			self._context.verify_mode = ssl.CERT_NONE
+		self._max_concurrency = max(1, max_concurrency)
+		self._connections = queue.LifoQueue()
+		self._executor = ThreadPoolExecutor(max_workers=self._max_concurrency)
+		self._ids = itertools.count(1)
+		self._semaphore = None
+
+	def _newConnection(self):
+		if self._https:
+			return http.client.HTTPSConnection(self._host, self._port, timeout=self._timeout, context=self._context)
+		return http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+	def _post(self, body):
+		"""
+		Metodo (executado em uma thread do pool) que envia a requisicao em uma conexao persistente.
+		Em caso de conexao encerrada pelo servidor, tenta novamente uma vez com nova conexao.
+		Somente conexoes com resposta 200 voltam ao pool; nos demais casos (erro HTTP, timeout,
+		erro de rede) a conexao e fechada.
+		"""
+		try:
+			conn = self._connections.get_nowait()
+		except queue.Empty:
+			conn = self._newConnection()
+		for attempt in (1, 2):
+			try:
+				conn.request('POST', self._path, body, {'Content-Type': 'application/json-rpc'})
+				response = conn.getresponse()
+				data = response.read()
+			except (http.client.HTTPException, ConnectionError):
+				conn.close()
+				if attempt == 2:
+					raise
+				conn = self._newConnection()
+				continue
+			except OSError:
+				# Timeout: a chamada pode ter sido executada, portanto nao e repetida
+				conn.close()
+				raise
+			if response.status != 200:
+				conn.close()
+				raise ZabbixAPIException('HTTP %d: %s' % (response.status, response.reason))
+			self._connections.put(conn)
+			return data
+
+	async def call(self, method, params=None):
+		"""
+		Metodo que executa uma chamada da API.
+
+		Parameters
+		----------
+		method : str
+			Ex: 'usergroup.get'
+		params : dict ou list
+			Ex: {'output': ['usrgrpid', 'name']}
+
+		Returns
+		-------
+		dict
+			Resposta JSON-RPC completa (mesmo formato do do_request do py-zabbix).
+			Ex: {'jsonrpc': '2.0', 'result': [...], 'id': 1}
+		"""
+		payload = {'jsonrpc': '2.0', 'method': method, 'params': params if params is not None else {}, 'id': next(self._ids)}
+		if self.auth and method not in ('user.login', 'apiinfo.version', 'user.checkAuthentication'):
+			payload['auth'] = self.auth
+		if self._semaphore is None:
+			self._semaphore = asyncio.Semaphore(self._max_concurrency)
+		async with self._semaphore:
+			with metrics.timer('zabbix.' + method, len(params) if isinstance(params, list) else 1) as timer:
+				body = json.dumps(payload).encode('utf-8')
+				timer.bytes_out = len(body)
+				data = await asyncio.get_running_loop().run_in_executor(self._executor, self._post, body)
+				timer.bytes_in = len(data)
+				response = json.loads(data.decode('utf-8'))
+				if 'error' in response:
+					error = response['error']
+					raise ZabbixAPIException('Error %s: %s, %s' % (error.get('code'), error.get('message'), error.get('data')))
+				result = response.get('result')
+				timer.items_in = len(result) if isinstance(result, list) else 1
+		return response
+
+	async def gather(self, calls):
+		"""
+		Metodo que executa varias chamadas simultaneamente (respeitando max_concurrency).
+
+		Parameters
+		----------
+		calls : list
+			Lista de tuplas (metodo, parametros).
+
+		Returns
+		-------
+		list
+			Respostas na mesma ordem das chamadas; chamadas com erro retornam a excecao.
+		"""
+		return await asyncio.gather(*[self.call(method, params) for method, params in calls], return_exceptions=True)
+
+	async def login(self, user, password):
+		"""
+		Metodo que autentica na API e guarda o token de sessao.
+		"""
+		response = await self.call('user.login', {'user': user, 'password': password})
+		self.auth = response['result']
+		return self.auth
+
+	def close(self):
+		"""
+		Metodo que fecha as conexoes abertas.
+		"""
+		while True:
+			try:
+				self._connections.get_nowait().close()
+			except queue.Empty:
+				break
+		self._executor.shutdown(wait=False)
+
+
+class _ApiObject:
+
+	def __init__(self, client, name):
+		self._client = client
+		self._name = name
+
+	def __getattr__(self, attr):
+		def call(*args, **kwargs):
+			return self._client.do_request(self._name + '.' + attr, args[0] if args else kwargs)['result']
+		return call
+
+
+class ZabbixClient:
+	"""
+	Fachada sincrona do AsyncZabbixAPI compativel com o zabbix.api.ZabbixAPI (do_request e
+	chamadas no formato zapi.objeto.metodo()), com do_requests para chamadas simultaneas.
+	"""
+
+	def __init__(self, url, user=None, password=None, max_concurrency=8, auth=None, timeout=30, verify=True):
+		"""
+		Metodo construtor. Autentica na API caso user seja informado.
+
+		Parameters
+		----------
+		url : str
+			URL do frontend Zabbix.
+		user : str
+			Usuario da API. Opcional quando auth e informado.
+		password : str
+			Senha do usuario.
+		max_concurrency : int
+			Quantidade maxima de chamadas simultaneas.
+		auth : str
+			Token de sessao/API ja existente. Opcional.
+		timeout : int
+			Timeout (segundos) de cada chamada.
+		verify : bool
+			Valida o certificado do servidor (https).
+		"""
+		self._loop = asyncio.new_event_loop()
+		self._api = AsyncZabbixAPI(url, max_concurrency, timeout, verify, auth)
+		if user:
+			self._loop.run_until_complete(self._api.login(user, password))
+
+	@property
+	def auth(self):
+		return self._api.auth
+
+	@auth.setter
+	def auth(self, value):
+		self._api.auth = value
+
+	def do_request(self, method, params=None):
+		"""
+		Metodo que executa uma chamada da API e retorna a resposta JSON-RPC completa.
+		"""
+		return self._loop.run_until_complete(self._api.call(method, params))
+
+	def do_requests(self, calls):
+		"""
+		Metodo que executa varias chamadas simultaneamente.
+
+		Parameters
+		----------
+		calls : list
+			Lista de tuplas (metodo, parametros).
+			Ex: [('usergroup.update', {'usrgrpid': '55', 'userids': ['3']})]
+
+		Returns
+		-------
+		list
+			Respostas JSON-RPC na mesma ordem das chamadas; chamadas com erro retornam a excecao.
+		"""
+		return self._loop.run_until_complete(self._api.gather(calls))
+
+	def close(self):
+		"""
+		Metodo que fecha as conexoes e o event loop.
+		"""
+		self._api.close()
+		self._loop.close()
+
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return _ApiObject(self, name)
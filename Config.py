@@ -0,0 +1,167 @@
+import configparser
+import os
+import re
+from GroupMapper import GroupMapper
+
+class ConfigError(ValueError):
+	"""
+	Erro de validacao do conexao.ini.
+	"""
+
+
+class Config:
+	"""
+	Classe com as configuracoes do conexao.ini, lidas uma unica vez e compartilhadas
+	por AdManager, AdSourceSet, ZabbixManager e sync_users (ver getConfig).
+	"""
+
+	# Opcoes obrigatorias por secao (as secoes '[ad:<nome>]' seguem as regras da secao [ad])
+	REQUIRED = {
+		'zabbix': ['host', 'username', 'password', 'log_level', 'default_group'],
+		'ad': ['host', 'bind_dn', 'bind_pw', 'users_ou', 'groups_ou', 'log_level',
+				'filter_group_search_zb', 'filter_group_suffix_zb', 'filter_group_search'],
+	}
+	INTEGERS = {
+		'zabbix': ['batch_size', 'max_concurrency', 'id_cache_ttl', 'timeout'],
+		'ad': ['network_timeout', 'page_size', 'pool_size', 'filter_max_length'],
+		'daemon': ['interval', 'jitter', 'retry_interval'],
+		'log': ['max_bytes', 'backup_count'],
+	}
+	BOOLEANS = {
+		'zabbix': ['verify'],
+		'ad': ['incremental'],
+	}
+	CHOICES = {
+		'zabbix': {'log_level': ['INFO', 'WARN', 'DEBUG'], 'client': ['pyzabbix', 'async']},
+		'ad': {'log_level': ['INFO', 'WARN', 'DEBUG'], 'membership_mode': ['per_group', 'bulk'],
+				'duplicate_users': ['first', 'qualify']},
+		'log': {'format': ['text', 'json']},
+		'sync': {'log_level': ['INFO', 'WARN', 'DEBUG']},
+	}
+
+	def __init__(self, path='conexao.ini'):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		path : str
+			Arquivo de configuracao.
+		"""
+		self.path = path
+		self.parser = configparser.ConfigParser()
+		self.parser.read(path, encoding='utf-8')
+		self._sections = {}
+
+	def has_section(self, name):
+		return self.parser.has_section(name)
+
+	def section(self, name):
+		"""
+		Metodo que retorna a secao informada. As secoes '[ad:<nome>]' herdam da secao [ad]
+		as opcoes nao informadas e possuem seu proprio 'state_file'.
+
+		Parameters
+		----------
+		name : str
+			Ex: 'ad:filial'
+
+		Returns
+		-------
+		configparser.SectionProxy
+		"""
+		if name not in self._sections:
+			if name.startswith('ad:') and self.parser.has_section('ad'):
+				options = dict(self.parser.items('ad', raw=True))
+				# Cada dominio possui seu proprio estado incremental
+				options['state_file'] = 'ad_state_%s.json' % name.split(':', 1)[1]
+				options.update(self.parser.items(name, raw=True))
+				self.parser[name] = options
+			self._sections[name] = self.parser[name]
+		return self._sections[name]
+
+	def adSections(self):
+		"""
+		Metodo que retorna as secoes dos dominios do AD: [ad] seguida das secoes '[ad:<nome>]'
+		na ordem do arquivo.
+
+		Returns
+		-------
+		list
+			Ex: ['ad', 'ad:filial']
+		"""
+		return ['ad'] + [name for name in self.parser.sections() if name.startswith('ad:')]
+
+	def validate(self):
+		"""
+		Metodo que valida as opcoes obrigatorias, numericas, booleanas e com valores fixos.
+
+		Raises
+		------
+		ConfigError
+			Com a lista de todos os problemas encontrados.
+		"""
+		errors = []
+		if not self.parser.has_section('zabbix') or not self.parser.has_section('ad'):
+			errors.append("%s: secoes [zabbix] e [ad] sao obrigatorias" % self.path)
+		for name in self.parser.sections():
+			rule = 'ad' if name.startswith('ad:') else name
+			section = self.section(name)
+			for option in self.REQUIRED.get(rule, []):
+				if not section.get(option, '').strip():
+					errors.append('[%s] %s e obrigatorio' % (name, option))
+			for option in self.INTEGERS.get(rule, []):
+				if option in section:
+					try:
+						section.getint(option)
+					except ValueError:
+						errors.append('[%s] %s deve ser um numero inteiro: %r' % (name, option, section[option]))
+			for option in self.BOOLEANS.get(rule, []):
+				if option in section:
+					try:
+						section.getboolean(option)
+					except ValueError:
+						errors.append('[%s] %s deve ser true ou false: %r' % (name, option, section[option]))
+			for option, values in self.CHOICES.get(rule, {}).items():
+				if option in section and section[option] not in values:
+					errors.append('[%s] %s deve ser %s: %r' % (name, option, ' ou '.join(values), section[option]))
+			# Somente a consulta em lote usa o grafo incremental
+			if (rule == 'ad' and self.parser.BOOLEAN_STATES.get(section.get('incremental', '').lower())
+					and section.get('membership_mode', 'per_group') != 'bulk'):
+				errors.append('[%s] incremental = true requer membership_mode = bulk' % name)
+			if rule == 'ad' and 'group_rename' in section:
+				try:
+					for pattern, replacement in GroupMapper.parseRules(section['group_rename']):
+						re.compile(pattern)
+				except (ValueError, re.error) as e:
+					errors.append('[%s] group_rename: %s' % (name, e))
+		if errors:
+			raise ConfigError('; '.join(errors))
+		return self
+
+
+_configs = {}
+
+def getConfig(path='conexao.ini'):
+	"""
+	Metodo que retorna a configuracao do arquivo, lendo-o somente na primeira chamada ou
+	quando o arquivo for alterado.
+
+	Parameters
+	----------
+	path : str
+		Arquivo de configuracao.
+
+	Returns
+	-------
+	Config
+	"""
+	key = os.path.abspath(path)
+	try:
+		mtime = os.stat(key).st_mtime_ns
+	except OSError:
+		mtime = None
+	cached = _configs.get(key)
+	if cached is None or cached[0] != mtime:
+		cached = _configs[key] = (mtime, Config(path))
+	return cached[1]
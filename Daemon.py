@@ -0,0 +1,146 @@
+import json
+import os
+import random
+import signal
+import threading
+import time
+import traceback
+from Logging import LogManager
+
+class SyncDaemon:
+	"""
+	Classe que executa a sincronizacao periodicamente em um processo de longa duracao,
+	mantendo as conexoes abertas entre as execucoes e reconectando em caso de falha.
+	"""
+
+	def __init__(self, connect, sync, disconnect, interval=300, jitter=30, status_file='sync_status.json',
+				retry_interval=30, log_level='INFO', log_file=None):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		connect : function
+			Funcao que garante as conexoes abertas (reaproveitando-as quando ainda validas).
+		sync : function
+			Funcao que executa uma sincronizacao. O retorno e gravado no status.
+		disconnect : function
+			Funcao que fecha as conexoes. Chamada apos falhas e ao encerrar.
+		interval : int
+			Intervalo (segundos) entre as sincronizacoes.
+		jitter : int
+			Variacao aleatoria maxima (segundos) somada ao intervalo.
+		status_file : str
+			Arquivo JSON com o status da ultima execucao (health check).
+		retry_interval : int
+			Intervalo inicial (segundos) apos uma falha, dobrado a cada falha seguida
+			ate o limite de 'interval'.
+		log_level : str
+			Nivel de log.
+		log_file : str
+			Arquivo de log. Opcional, por padrao o arquivo da secao [log] do conexao.ini.
+		"""
+		self._connect = connect
+		self._sync = sync
+		self._disconnect = disconnect
+		self._interval = interval
+		self._jitter = jitter
+		self._status_file = status_file
+		self._retry_interval = retry_interval
+		self._log = LogManager(log_level, __name__, log_file)
+		self._stop = threading.Event()
+		self.status = {'pid': os.getpid(), 'state': 'starting', 'runs': 0, 'consecutive_failures': 0,
+					'last_run_start': None, 'last_run_end': None, 'last_duration': None,
+					'last_success': None, 'last_error': None, 'last_result': None, 'next_run': None}
+
+	def stop(self, *args):
+		"""
+		Metodo que solicita o encerramento do daemon apos a execucao atual.
+		"""
+		self._log.logger.info('Encerrando o daemon de sincronizacao.')
+		self._stop.set()
+
+	def runOnce(self):
+		"""
+		Metodo que executa uma sincronizacao, registrando o resultado no status.
+
+		Returns
+		-------
+		bool
+			True caso a sincronizacao tenha sido concluida com sucesso.
+		"""
+		start = time.time()
+		self.status.update({'state': 'running', 'last_run_start': start})
+		self._writeStatus()
+		try:
+			self._connect()
+			result = self._sync()
+		except Exception as e:
+			self._log.logger.error('Falha na sincronizacao: ' + str(e))
+			self._log.logger.debug(traceback.format_exc())
+			self.status.update({'state': 'error', 'last_error': str(e),
+								'consecutive_failures': self.status['consecutive_failures'] + 1})
+			try:
+				self._disconnect()
+			except Exception as disconnect_error:
+				self._log.logger.debug('Falha ao desconectar: ' + str(disconnect_error))
+			success = False
+		else:
+			self.status.update({'state': 'ok', 'last_success': time.time(), 'last_error': None,
+								'consecutive_failures': 0, 'last_result': result})
+			success = True
+		end = time.time()
+		self.status.update({'runs': self.status['runs'] + 1, 'last_run_end': end, 'last_duration': end - start})
+		self._writeStatus()
+		return success
+
+	def nextDelay(self):
+		"""
+		Metodo que retorna o tempo (segundos) ate a proxima sincronizacao: o intervalo
+		com jitter, ou o intervalo de nova tentativa com backoff apos falhas.
+		"""
+		failures = self.status['consecutive_failures']
+		if failures:
+			return min(self._interval, self._retry_interval * 2 ** (failures - 1))
+		return self._interval + random.uniform(0, self._jitter)
+
+	def run(self, max_runs=None):
+		"""
+		Metodo que executa as sincronizacoes ate receber SIGTERM/SIGINT (ou max_runs execucoes).
+
+		Parameters
+		----------
+		max_runs : int
+			Quantidade maxima de execucoes. Opcional.
+		"""
+		if threading.current_thread() is threading.main_thread():
+			signal.signal(signal.SIGTERM, self.stop)
+			signal.signal(signal.SIGINT, self.stop)
+		self._log.logger.info('Daemon de sincronizacao iniciado (intervalo de %ds).' % self._interval)
+		try:
+			while not self._stop.is_set():
+				self.runOnce()
+				if max_runs is not None and self.status['runs'] >= max_runs:
+					break
+				delay = self.nextDelay()
+				self.status['next_run'] = time.time() + delay
+				self._writeStatus()
+				self._stop.wait(delay)
+		finally:
+			self.status['state'] = 'stopped'
+			self._writeStatus()
+			try:
+				self._disconnect()
+			except Exception as e:
+				self._log.logger.debug('Falha ao desconectar: ' + str(e))
+
+	def _writeStatus(self):
+		"""
+		Metodo que grava o status de forma atomica.
+		"""
+		if not self._status_file:
+			return
+		tmp_file = self._status_file + '.tmp'
+		with open(tmp_file, 'w', encoding='utf-8') as status_file:
+			json.dump(self.status, status_file)
+		os.replace(tmp_file, self._status_file)
@@ -0,0 +1,883 @@
+"""
+Substitutos em processo das bibliotecas 'ldap' (python-ldap) e 'zabbix.api' (py-zabbix),
+usados pelo benchmark.py e pelos testes para executar a sincronizacao sem AD e sem Zabbix reais.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import random
+from collections import Counter
+from contextlib import contextmanager
+import AsyncZabbixAPI
+from Logging import configureLogging, shutdownLogging, getLogFile
+
+SCOPE_BASE = 0
+SCOPE_ONELEVEL = 1
+SCOPE_SUBTREE = 2
+OPT_REFERRALS = 8
+OPT_NETWORK_TIMEOUT = 20485
+
+# conexao.ini usado com os substitutos (benchmark.py e fakeEnvironment)
+CONFIG = """[zabbix]
+host = http://zabbix.bench.local/
+username = Admin
+password = zabbix
+log_level = WARN
+default_group = Users from AD
+batch_size = {batch_size}
+
+[ad]
+host = ldap://bench.local
+bind_dn = CN=zabbix,DC=bench,DC=local
+bind_pw = bench
+users_ou = {users_ou}
+groups_ou = {groups_ou}
+log_level = WARN
+membership_mode = {mode}
+page_size = {page_size}
+pool_size = {pool_size}
+filter_group_search_zb = 'Monitoracao - '
+filter_group_suffix_zb = ' (AD)'
+filter_group_search =
+	Monitoracao - *
+
+[sync]
+state_db = sync_state.db
+"""
+
+IN_CHAIN = '1.2.840.113556.1.4.1941'
+BIT_AND = '1.2.840.113556.1.4.803'
+
+# Nome canonico dos atributos, como retornado pelo AD
+CANONICAL_ATTRS = ['objectClass', 'objectGUID', 'cn', 'member', 'memberOf', 'sAMAccountName',
+				'userAccountControl', 'uSNChanged', 'distinguishedName', 'highestCommittedUSN',
+				'dsServiceName', 'defaultNamingContext', 'isDeleted']
+CANONICAL = dict((attr.lower(), attr) for attr in CANONICAL_ATTRS)
+
+
+def parseFilter(text):
+	"""
+	Metodo que converte um filtro LDAP (RFC 4515) em uma arvore de tuplas.
+
+	Parameters
+	----------
+	text : str
+		Ex: '(&(objectClass=user)(cn=Fulano*))'
+
+	Returns
+	-------
+	tuple
+		Ex:
+		('&', [('=', 'objectclass', None, 'user'), ('=', 'cn', None, 'Fulano*')])
+	"""
+	node, pos = _parseNode(text.strip(), 0)
+	return node
+
+def _parseNode(text, pos):
+	if text[pos] != '(':
+		raise ValueError('Filtro invalido: ' + text)
+	pos += 1
+	op = text[pos]
+	if op in '&|':
+		pos += 1
+		children = []
+		while text[pos] == '(':
+			child, pos = _parseNode(text, pos)
+			children.append(child)
+		return (op, children), pos + 1
+	if op == '!':
+		child, pos = _parseNode(text, pos + 1)
+		return ('!', child), pos + 1
+	end = text.index(')', pos)
+	item = text[pos:end]
+	if ':=' in item:
+		attr, value = item.split(':=', 1)
+		attr, rule = attr.split(':', 1)
+		return ('ext', attr.lower(), rule, _unescape(value)), end + 1
+	for operator in ('>=', '<='):
+		if operator in item:
+			attr, value = item.split(operator, 1)
+			return (operator, attr.lower(), None, _unescape(value)), end + 1
+	attr, value = item.split('=', 1)
+	return ('=', attr.lower(), None, value), end + 1
+
+def _unescape(value):
+	result = ''
+	i = 0
+	while i < len(value):
+		if value[i] == '\\':
+			result += chr(int(value[i + 1:i + 3], 16))
+			i += 3
+		else:
+			result += value[i]
+			i += 1
+	return result
+
+def _wildcardMatch(pattern, value):
+	"""
+	Metodo que compara um valor com um padrao de substring LDAP (com '*' e escapes).
+	"""
+	parts = [_unescape(part).lower() for part in pattern.split('*')]
+	value = value.lower()
+	if len(parts) == 1:
+		return value == parts[0]
+	if not value.startswith(parts[0]):
+		return False
+	pos = len(parts[0])
+	for part in parts[1:-1]:
+		pos = value.find(part, pos)
+		if pos < 0:
+			return False
+		pos += len(part)
+	return value.endswith(parts[-1]) and len(value) - len(parts[-1]) >= pos
+
+
+class FakeDirectory:
+	"""
+	Classe que representa um AD sintetico com grupos monitorados, grupos aninhados e usuarios.
+	"""
+
+	def __init__(self, users=1000, groups=50, nesting=2, memberships=3, disabled=0.02, seed=1):
+		"""
+		Metodo construtor. Gera o diretorio.
+
+		Parameters
+		----------
+		users : int
+			Quantidade de usuarios.
+		groups : int
+			Quantidade de grupos 'Monitoracao - *'.
+		nesting : int
+			Profundidade dos grupos aninhados dentro de cada grupo monitorado.
+		memberships : int
+			Quantidade de grupos (monitorados ou aninhados) dos quais cada usuario e membro direto.
+		disabled : float
+			Fracao de usuarios desabilitados.
+		seed : int
+			Semente do gerador aleatorio.
+		"""
+		rnd = random.Random(seed)
+		self.base = 'DC=bench,DC=local'
+		self.groups_ou = 'OU=Grupos,' + self.base
+		self.users_ou = self.base
+		self.entries = {}
+		self.deleted = []
+		self.server_name = 'DC1'
+		self.usn = 0
+		self.searches = Counter()
+		self.monitored = []
+
+		leaf_groups = []
+		for g in range(groups):
+			name = 'Monitoracao - Group %d' % g
+			dn = self._addGroup(name, self.groups_ou)
+			self.monitored.append(name)
+			leaf_groups.append(dn)
+			parent = dn
+			for level in range(nesting):
+				child = self._addGroup('Nested %d-%d' % (g, level), 'OU=Nested,' + self.base)
+				self.entries[parent.lower()]['attrs']['member'].append(child.encode('utf-8'))
+				leaf_groups.append(child)
+				parent = child
+
+		for u in range(users):
+			dn = 'CN=USER %d,OU=Users,%s' % (u, self.base)
+			uac = b'514' if rnd.random() < disabled else b'512'
+			self._add(dn, {'objectClass': [b'top', b'person', b'user'], 'cn': [('USER %d' % u).encode('utf-8')],
+						'sAMAccountName': [('user%d' % u).encode('utf-8')], 'userAccountControl': [uac]})
+			for group_dn in rnd.sample(leaf_groups, min(memberships, len(leaf_groups))):
+				self.entries[group_dn.lower()]['attrs']['member'].append(dn.encode('utf-8'))
+
+		self._buildClosure()
+
+	def _add(self, dn, attrs):
+		self.usn += 1
+		attrs['objectGUID'] = [self.usn.to_bytes(16, 'big')]
+		attrs['uSNChanged'] = [str(self.usn).encode('utf-8')]
+		attrs['distinguishedName'] = [dn.encode('utf-8')]
+		self.entries[dn.lower()] = {'dn': dn, 'attrs': attrs, 'closure': set()}
+		return dn
+
+	def _addGroup(self, name, ou):
+		return self._add('CN=%s,%s' % (name, ou), {'objectClass': [b'top', b'group'],
+												'cn': [name.encode('utf-8')], 'member': []})
+
+	def _touch(self, entry):
+		self.usn += 1
+		entry['attrs']['uSNChanged'] = [str(self.usn).encode('utf-8')]
+
+	def modify(self, dn, attrs):
+		"""
+		Metodo que altera atributos de um objeto, atualizando o uSNChanged.
+		Ex: directory.modify(dn, {'userAccountControl': [b'514']})
+		"""
+		entry = self.entries[dn.lower()]
+		entry['attrs'].update(attrs)
+		self._touch(entry)
+		self._buildClosure()
+
+	def rename(self, dn, new_dn):
+		"""
+		Metodo que renomeia ou move um objeto. Como no AD, o atributo 'member' dos grupos
+		passa a ter o novo DN sem alterar o uSNChanged dos grupos.
+		"""
+		entry = self.entries.pop(dn.lower())
+		entry['dn'] = new_dn
+		entry['attrs']['distinguishedName'] = [new_dn.encode('utf-8')]
+		self.entries[new_dn.lower()] = entry
+		for other in self.entries.values():
+			members = other['attrs'].get('member')
+			if members:
+				other['attrs']['member'] = [new_dn.encode('utf-8') if member.decode('utf-8').lower() == dn.lower() else member
+											for member in members]
+		self._touch(entry)
+		self._buildClosure()
+
+	def delete(self, dn):
+		"""
+		Metodo que remove um objeto, mantendo-o como tombstone em 'CN=Deleted Objects'.
+		"""
+		entry = self.entries.pop(dn.lower())
+		for other in self.entries.values():
+			members = other['attrs'].get('member')
+			if members:
+				other['attrs']['member'] = [member for member in members if member.decode('utf-8').lower() != dn.lower()]
+		guid = entry['attrs']['objectGUID']
+		tombstone = {'dn': 'CN=%s\\0ADEL:%s,CN=Deleted Objects,%s' % (dn.split(',')[0][3:], guid[0].hex(), self.base),
+					'attrs': {'objectGUID': guid, 'isDeleted': [b'TRUE']}, 'closure': set()}
+		self._touch(tombstone)
+		self.deleted.append(tombstone)
+		self._buildClosure()
+
+	def searchDeleted(self, filter, attrlist=None):
+		"""
+		Metodo que executa uma consulta nos objetos removidos (controle LDAP_SERVER_SHOW_DELETED_OID).
+		"""
+		node = parseFilter(filter)
+		return [(entry['dn'], self._project(entry['attrs'], attrlist)) for entry in self.deleted if self._match(node, entry)]
+
+	def _buildClosure(self):
+		"""
+		Metodo que calcula memberOf e o fecho transitivo dos grupos de cada objeto,
+		alem do indice reverso grupo -> membros transitivos usado pelo filtro IN_CHAIN.
+		"""
+		for entry in self.entries.values():
+			entry['attrs'].pop('memberOf', None)
+			entry['closure'] = set()
+		for key, entry in self.entries.items():
+			for member in entry['attrs'].get('member', []):
+				member_entry = self.entries.get(member.decode('utf-8').lower())
+				if member_entry:
+					member_entry['attrs'].setdefault('memberOf', []).append(entry['dn'].encode('utf-8'))
+		self.chain = {}
+		for key, entry in self.entries.items():
+			pending = [m.decode('utf-8').lower() for m in entry['attrs'].get('memberOf', [])]
+			while pending:
+				group = pending.pop()
+				if group not in entry['closure']:
+					entry['closure'].add(group)
+					self.chain.setdefault(group, []).append(key)
+					pending.extend(m.decode('utf-8').lower() for m in self.entries[group]['attrs'].get('memberOf', []))
+
+	def search(self, base, scope, filter, attrlist=None):
+		"""
+		Metodo que executa uma consulta no diretorio.
+
+		Returns
+		-------
+		list
+			Tuplas (dn, atributos), no formato do python-ldap.
+		"""
+		self.searches[scope] += 1
+		if base == '' and scope == SCOPE_BASE:
+			return [('', {'highestCommittedUSN': [str(self.usn).encode('utf-8')],
+						'dsServiceName': [('CN=NTDS Settings,CN=%s,CN=Servers,CN=Default-First-Site-Name,CN=Sites,CN=Configuration,DC=bench,DC=local' % self.server_name).encode('utf-8')],
+						'defaultNamingContext': [self.base.encode('utf-8')]})]
+		node = parseFilter(filter)
+		base_key = base.lower()
+		result = []
+		for key in self._candidates(node, base_key, scope):
+			entry = self.entries.get(key)
+			if entry is None or not self._inScope(key, base_key, scope):
+				continue
+			if self._match(node, entry):
+				result.append((entry['dn'], self._project(entry['attrs'], attrlist)))
+		return result
+
+	def _candidates(self, node, base_key, scope):
+		if scope == SCOPE_BASE:
+			return [base_key]
+		if node[0] == '&':
+			for child in node[1]:
+				if child[0] == 'ext' and child[2] == IN_CHAIN:
+					return self.chain.get(child[3].lower(), [])
+		return list(self.entries)
+
+	def _inScope(self, key, base_key, scope):
+		if scope == SCOPE_BASE:
+			return key == base_key
+		if not key.endswith(',' + base_key):
+			return False
+		if scope == SCOPE_ONELEVEL:
+			return ',' not in key[:-len(base_key) - 1].replace('\\,', '')
+		return True
+
+	def _project(self, attrs, attrlist):
+		if not attrlist:
+			return dict(attrs)
+		result = {}
+		for attr in attrlist:
+			name = attr.split(';')[0]
+			canonical = CANONICAL.get(name.lower(), name)
+			if canonical in attrs:
+				result[canonical] = attrs[canonical]
+		return result
+
+	def _values(self, entry, attr):
+		return [value.decode('utf-8', 'replace') for value in entry['attrs'].get(CANONICAL.get(attr, attr), [])]
+
+	def _match(self, node, entry):
+		op = node[0]
+		if op == '&':
+			return all(self._match(child, entry) for child in node[1])
+		if op == '|':
+			return any(self._match(child, entry) for child in node[1])
+		if op == '!':
+			return not self._match(node[1], entry)
+		attr, rule, value = node[1], node[2], node[3]
+		if op == 'ext' and rule == IN_CHAIN:
+			return value.lower() in entry['closure']
+		values = self._values(entry, attr)
+		if op == 'ext' and rule == BIT_AND:
+			return any(int(v) & int(value) == int(value) for v in values)
+		if op == '>=':
+			return any(int(v) >= int(value) for v in values)
+		if op == '<=':
+			return any(int(v) <= int(value) for v in values)
+		if value == '*':
+			return bool(values)
+		return any(_wildcardMatch(value, v) for v in values)
+
+
+class SimplePagedResultsControl:
+	"""
+	Substituto de ldap.controls.SimplePagedResultsControl.
+	"""
+	controlType = '1.2.840.113556.1.4.319'
+
+	def __init__(self, criticality=True, size=10, cookie=''):
+		self.criticality = criticality
+		self.size = size
+		self.cookie = cookie
+
+
+class LDAPControl:
+	"""
+	Substituto de ldap.controls.LDAPControl.
+	"""
+
+	def __init__(self, controlType=None, criticality=False, encodedControlValue=None):
+		self.controlType = controlType
+		self.criticality = criticality
+		self.encodedControlValue = encodedControlValue
+
+
+class LDAPError(Exception):
+	pass
+
+
+class SERVER_DOWN(LDAPError):
+	pass
+
+
+class FakeLDAPObject:
+	"""
+	Substituto de ldap.ldapobject.LDAPObject ligado a um FakeDirectory.
+	"""
+
+	def __init__(self, directory):
+		self._directory = directory
+		self._pending = {}
+		self._msgid = 0
+
+	def set_option(self, option, value):
+		pass
+
+	def bind_s(self, who, cred):
+		if self._directory is None:
+			raise SERVER_DOWN("Can't contact LDAP server")
+		self._directory.searches['bind'] += 1
+
+	def unbind(self):
+		pass
+
+	def whoami_s(self):
+		return 'u:zabbix'
+
+	def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None):
+		return self._directory.search(base, scope, filterstr, attrlist)
+
+	def search_ext_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None, serverctrls=None):
+		for ctrl in serverctrls or []:
+			if getattr(ctrl, 'controlType', None) == '1.2.840.113556.1.4.417':
+				self._directory.searches[scope] += 1
+				return self._directory.searchDeleted(filterstr, attrlist)
+		return self._directory.search(base, scope, filterstr, attrlist)
+
+	def search_ext(self, base, scope, filterstr='(objectClass=*)', attrlist=None, serverctrls=None):
+		page = None
+		for ctrl in serverctrls or []:
+			if isinstance(ctrl, SimplePagedResultsControl):
+				page = ctrl
+		self._msgid += 1
+		if page and page.cookie:
+			results = self._pending.pop(page.cookie)
+		else:
+			results = self._directory.search(base, scope, filterstr, attrlist)
+		self._pending[self._msgid] = (results, page)
+		return self._msgid
+
+	def result3(self, msgid):
+		results, page = self._pending.pop(msgid)
+		if page is None:
+			return 101, results, msgid, []
+		data, rest = results[:page.size], results[page.size:]
+		response = SimplePagedResultsControl(True, size=page.size, cookie='')
+		if rest:
+			response.cookie = 'page-%d' % msgid
+			self._pending[response.cookie] = rest
+		return 101, data, msgid, [response]
+
+
+class ZabbixAPIException(Exception):
+	"""
+	Substituto de zabbix.api.ZabbixAPIException (excecao do py-zabbix).
+	"""
+
+
+class FakeZabbixServer:
+	"""
+	Classe que simula a API do Zabbix em memoria, contando as chamadas por metodo.
+	"""
+
+	def __init__(self, usergroups=100, users=0, latency=0.0):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		usergroups : int
+			Quantidade de grupos de usuario nao relacionados ao AD.
+		users : int
+			Quantidade de usuarios locais (nao importados do AD).
+		latency : float
+			Tempo (segundos) simulado de cada chamada.
+		"""
+		self.latency = latency
+		self.calls = Counter()
+		self.next_id = 1
+		self.users = {}
+		self.usergroups = {}
+		self.hostgroups = {}
+		self.services = {}
+		self._aliases = set()
+		self._usergroup_names = set()
+		self.sessions = set()
+		# Aliases e nomes de usergroup cuja criacao deve falhar
+		self.rejected = set()
+		admin_group = self._createUsergroup({'name': 'Zabbix administrators'})
+		self._createUser({'alias': 'Admin', 'usrgrps': [{'usrgrpid': admin_group}]})
+		for g in range(usergroups):
+			self._createUsergroup({'name': 'Local Group %d' % g})
+		for u in range(users):
+			self._createUser({'alias': 'local%d' % u, 'usrgrps': [{'usrgrpid': admin_group}]})
+
+	def _newId(self):
+		self.next_id += 1
+		return str(self.next_id)
+
+	def request(self, method, params):
+		"""
+		Metodo que executa uma chamada da API.
+
+		Returns
+		-------
+		dict
+			Resposta JSON-RPC. Ex: {'jsonrpc': '2.0', 'result': [...], 'id': '1'}
+		"""
+		self.calls[method] += 1
+		if self.latency:
+			import time
+			time.sleep(self.latency)
+		handler = getattr(self, '_' + method.replace('.', '_'), None)
+		if handler is None:
+			raise ZabbixAPIException('Metodo nao suportado: ' + method)
+		return {'jsonrpc': '2.0', 'result': handler(params), 'id': '1'}
+
+	def _many(self, params):
+		return params if isinstance(params, list) else [params]
+
+	def _output(self, obj, output, idkey):
+		if output in (None, 'extend'):
+			return dict(obj)
+		return dict((key, obj[key]) for key in [idkey] + list(output) if key in obj)
+
+	def _matcher(self, params):
+		"""
+		Metodo que retorna uma funcao que aplica os parametros 'filter' e 'search' da API.
+		"""
+		filters = []
+		for key, value in (params.get('filter') or {}).items():
+			filters.append((key, set(value) if isinstance(value, list) else {value}))
+		searches = [(key, value.lower()) for key, value in (params.get('search') or {}).items()]
+
+		def matches(obj):
+			for key, values in filters:
+				if obj.get(key) not in values:
+					return False
+			for key, value in searches:
+				if value not in obj.get(key, '').lower():
+					return False
+			return True
+		return matches
+
+	def _createUser(self, user):
+		if user['alias'] in self._aliases:
+			raise ZabbixAPIException('User with alias "%s" already exists.' % user['alias'])
+		self._aliases.add(user['alias'])
+		userid = self._newId()
+		self.users[userid] = {'userid': userid, 'alias': user['alias'], 'name': user.get('name', '')}
+		for group in user.get('usrgrps', []):
+			self.usergroups[group['usrgrpid']]['userids'].append(userid)
+		return userid
+
+	def _createUsergroup(self, group):
+		if group['name'] in self._usergroup_names:
+			raise ZabbixAPIException('User group "%s" already exists.' % group['name'])
+		self._usergroup_names.add(group['name'])
+		usrgrpid = self._newId()
+		self.usergroups[usrgrpid] = {'usrgrpid': usrgrpid, 'name': group['name'], 'userids': list(group.get('userids', []))}
+		return usrgrpid
+
+	def _user_login(self, params):
+		sessionid = 'fake-session-%s' % self._newId()
+		self.sessions.add(sessionid)
+		return sessionid
+
+	def _user_logout(self, params):
+		return True
+
+	def _user_checkAuthentication(self, params):
+		if params.get('sessionid') not in self.sessions:
+			raise ZabbixAPIException('Session terminated, re-login, please.')
+		return {'userid': '1', 'alias': 'Admin', 'sessionid': params['sessionid']}
+
+	def _user_get(self, params):
+		usrgrpids = params.get('usrgrpids')
+		allowed = None
+		if usrgrpids:
+			allowed = set()
+			for usrgrpid in usrgrpids if isinstance(usrgrpids, list) else [usrgrpids]:
+				allowed.update(self.usergroups[usrgrpid]['userids'])
+		matches = self._matcher(params)
+		result = [self._output(user, params.get('output'), 'userid') for userid, user in self.users.items()
+				if (allowed is None or userid in allowed) and matches(user)]
+		return result[:params['limit']] if params.get('limit') else result
+
+	def _reject(self, names):
+		# A API do Zabbix cria todos os objetos da chamada ou nenhum
+		for name in names:
+			if name in self.rejected:
+				raise ZabbixAPIException('Falha simulada ao criar "%s".' % name)
+
+	def _user_create(self, params):
+		self._reject(user['alias'] for user in self._many(params))
+		return {'userids': [self._createUser(user) for user in self._many(params)]}
+
+	def _usergroup_get(self, params):
+		usrgrpids = params.get('usrgrpids')
+		if usrgrpids is not None:
+			usrgrpids = set(self._many(usrgrpids))
+		matches = self._matcher(params)
+		result = []
+		for usrgrpid, group in self.usergroups.items():
+			if usrgrpids and usrgrpid not in usrgrpids:
+				continue
+			if not matches(group):
+				continue
+			item = self._output({'usrgrpid': usrgrpid, 'name': group['name']}, params.get('output'), 'usrgrpid')
+			select = params.get('selectUsers')
+			if select:
+				item['users'] = [self._output(self.users[userid], None if select in (1, 'extend') else select, 'userid')
+								for userid in group['userids']]
+			result.append(item)
+		return result
+
+	def _usergroup_create(self, params):
+		self._reject(group['name'] for group in self._many(params))
+		return {'usrgrpids': [self._createUsergroup(group) for group in self._many(params)]}
+
+	def _usergroup_update(self, params):
+		result = []
+		for group in self._many(params):
+			if 'userids' in group:
+				self.usergroups[group['usrgrpid']]['userids'] = list(group['userids'])
+			result.append(group['usrgrpid'])
+		return {'usrgrpids': result}
+
+	def _hostgroup_get(self, params):
+		matches = self._matcher(params)
+		return [self._output(group, params.get('output'), 'groupid') for group in self.hostgroups.values()
+				if matches(group)]
+
+	def _hostgroup_create(self, params):
+		groupids = []
+		for group in self._many(params):
+			groupid = self._newId()
+			self.hostgroups[groupid] = {'groupid': groupid, 'name': group['name']}
+			groupids.append(groupid)
+		return {'groupids': groupids}
+
+	def _service_get(self, params):
+		serviceids = params.get('serviceids')
+		if serviceids is not None:
+			serviceids = set(self._many(serviceids))
+		parentids = params.get('parentids')
+		if parentids is not None:
+			parentids = set(self._many(parentids))
+		matches = self._matcher(params)
+		result = []
+		for serviceid, service in self.services.items():
+			if serviceids is not None and serviceid not in serviceids:
+				continue
+			if parentids is not None and service['parentid'] not in parentids:
+				continue
+			if not matches(service):
+				continue
+			item = self._output({'serviceid': serviceid, 'name': service['name']}, params.get('output'), 'serviceid')
+			if params.get('selectParent'):
+				item['parent'] = {'serviceid': service['parentid']} if service['parentid'] else []
+			if params.get('selectDependencies'):
+				item['dependencies'] = [dict(dependency) for dependency in service['dependencies']]
+			result.append(item)
+		return result
+
+	def _service_create(self, params):
+		serviceids = []
+		for service in self._many(params):
+			parentid = service.get('parentid')
+			if parentid and parentid not in self.services:
+				raise ZabbixAPIException('Incorrect value for field "parentid".')
+			serviceid = self._newId()
+			self.services[serviceid] = {'serviceid': serviceid, 'name': service['name'], 'parentid': parentid,
+										'triggerid': service.get('triggerid'), 'dependencies': []}
+			if parentid:
+				self.services[parentid]['dependencies'].append({'serviceid': serviceid, 'soft': '0'})
+			serviceids.append(serviceid)
+		return {'serviceids': serviceids}
+
+	def _service_adddependencies(self, params):
+		serviceids = []
+		for link in self._many(params):
+			dependencies = self.services[link['serviceid']]['dependencies']
+			if any(dependency['serviceid'] == link['dependsOnServiceid'] for dependency in dependencies):
+				raise ZabbixAPIException('Link between services already exists.')
+			dependencies.append({'serviceid': link['dependsOnServiceid'], 'soft': str(link.get('soft', 0))})
+			serviceids.append(link['serviceid'])
+		return {'serviceids': serviceids}
+
+
+class _FakeApiObject:
+
+	def __init__(self, api, name):
+		self._api = api
+		self._name = name
+
+	def __getattr__(self, attr):
+		def call(*args, **kwargs):
+			return self._api.do_request(self._name + '.' + attr, args[0] if args else kwargs)['result']
+		return call
+
+
+class FakeZabbixAPI:
+	"""
+	Substituto de zabbix.api.ZabbixAPI ligado ao FakeZabbixServer atual.
+	"""
+	server = None
+
+	def __init__(self, url=None, use_authenticate=False, use_basic_auth=False, user=None, password=None):
+		self.url = url
+		self.auth = None
+		if user:
+			self.auth = self.user.login(user=user, password=password)
+
+	def do_request(self, method, params=None):
+		return FakeZabbixAPI.server.request(method, params if params is not None else {})
+
+	def __getattr__(self, name):
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return _FakeApiObject(self, name)
+
+
+class FakeZabbixClient(FakeZabbixAPI):
+	"""
+	Substituto de AsyncZabbixAPI.ZabbixClient ligado ao FakeZabbixServer atual.
+	"""
+
+	def __init__(self, url, user=None, password=None, max_concurrency=8, auth=None, timeout=30, verify=True):
+		self.url = url
+		self.auth = auth
+		self.timeout = timeout
+		self.verify = verify
+		if user:
+			self.auth = self.user.login(user=user, password=password)
+
+	def do_requests(self, calls):
+		responses = []
+		for method, params in calls:
+			try:
+				responses.append(self.do_request(method, params))
+			except AsyncZabbixAPI.ZabbixAPIException as e:
+				responses.append(e)
+		return responses
+
+	def do_request(self, method, params=None):
+		try:
+			return FakeZabbixAPI.do_request(self, method, params)
+		except ZabbixAPIException as e:
+			raise AsyncZabbixAPI.ZabbixAPIException(*e.args)
+
+	def close(self):
+		pass
+
+
+def buildLdapModule(directory):
+	"""
+	Metodo que monta os modulos 'ldap', 'ldap.dn' e 'ldap.controls' ligados ao diretorio informado.
+
+	Parameters
+	----------
+	directory : FakeDirectory ou dict
+		Diretorio usado por qualquer URI, ou dicionario URI -> FakeDirectory (as URIs
+		ausentes simulam um DC fora do ar).
+
+	Returns
+	-------
+	dict
+		Nome do modulo -> modulo.
+	"""
+	ldap = types.ModuleType('ldap')
+	ldap.SCOPE_BASE, ldap.SCOPE_ONELEVEL, ldap.SCOPE_SUBTREE = SCOPE_BASE, SCOPE_ONELEVEL, SCOPE_SUBTREE
+	ldap.OPT_REFERRALS = OPT_REFERRALS
+	ldap.OPT_NETWORK_TIMEOUT = OPT_NETWORK_TIMEOUT
+	ldap.LDAPError = LDAPError
+	ldap.SERVER_DOWN = SERVER_DOWN
+	if isinstance(directory, dict):
+		ldap.initialize = lambda uri: FakeLDAPObject(directory.get(uri))
+	else:
+		ldap.initialize = lambda uri: FakeLDAPObject(directory)
+
+	dn = types.ModuleType('ldap.dn')
+	def escape_dn_chars(value):
+		for char in '\\,+"<>;=':
+			value = value.replace(char, '\\' + char)
+		return value
+	dn.escape_dn_chars = escape_dn_chars
+
+	controls = types.ModuleType('ldap.controls')
+	controls.SimplePagedResultsControl = SimplePagedResultsControl
+	controls.LDAPControl = LDAPControl
+
+	ldap.dn = dn
+	ldap.controls = controls
+	return {'ldap': ldap, 'ldap.dn': dn, 'ldap.controls': controls}
+
+def buildZabbixModule(server):
+	"""
+	Metodo que monta os modulos 'zabbix', 'zabbix.api' e 'AsyncZabbixAPI' ligados ao servidor informado.
+
+	Returns
+	-------
+	dict
+		Nome do modulo -> modulo.
+	"""
+	FakeZabbixAPI.server = server
+	zabbix = types.ModuleType('zabbix')
+	api = types.ModuleType('zabbix.api')
+	api.ZabbixAPI = FakeZabbixAPI
+	api.ZabbixAPIException = ZabbixAPIException
+	zabbix.api = api
+	client = types.ModuleType('AsyncZabbixAPI')
+	client.ZabbixClient = FakeZabbixClient
+	client.ZabbixAPIException = AsyncZabbixAPI.ZabbixAPIException
+	return {'zabbix': zabbix, 'zabbix.api': api, 'AsyncZabbixAPI': client}
+
+@contextmanager
+def installed(directory, server):
+	"""
+	Metodo que instala os modulos substitutos em sys.modules durante o bloco 'with',
+	recarregando AdManager, AdSources, ZabbixManager e sync_users para que os utilizem.
+
+	Parameters
+	----------
+	directory : FakeDirectory ou dict
+		Diretorio sintetico usado pelo 'ldap' (ou URI -> FakeDirectory, ver buildLdapModule).
+	server : FakeZabbixServer
+		API sintetica usada pelo 'zabbix.api'.
+	"""
+	modules = buildLdapModule(directory)
+	modules.update(buildZabbixModule(server))
+	reloaded = ['AdManager', 'AdSources', 'ZabbixManager', 'sync_users']
+	saved = dict((name, sys.modules.get(name)) for name in list(modules) + reloaded)
+	for name in reloaded:
+		sys.modules.pop(name, None)
+	sys.modules.update(modules)
+	try:
+		yield
+	finally:
+		for name, module in saved.items():
+			if module is None:
+				sys.modules.pop(name, None)
+			else:
+				sys.modules[name] = module
+
+@contextmanager
+def fakeEnvironment(directory, server, zabbix_options='', extra_config=''):
+	"""
+	Metodo que executa o bloco 'with' em um diretorio temporario com o conexao.ini (CONFIG)
+	e os substitutos instalados, para os testes offline. Os logs sao gravados no diretorio
+	temporario.
+
+	Parameters
+	----------
+	directory : FakeDirectory ou dict
+		Diretorio sintetico (ou URI -> FakeDirectory, com 'ldap://bench.local' como principal).
+	server : FakeZabbixServer
+		API sintetica.
+	zabbix_options : str
+		Linhas acrescentadas a secao [zabbix]. Opcional.
+		Ex: 'session_file = session.json'
+	extra_config : str
+		Secoes acrescentadas ao final do conexao.ini. Opcional.
+	"""
+	base = directory['ldap://bench.local'] if isinstance(directory, dict) else directory
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as tmpdir:
+		os.chdir(tmpdir)
+		previous_log_file = getLogFile()
+		log_file = os.path.join(tmpdir, 'python.log')
+		configureLogging(log_file=log_file)
+		try:
+			with open('conexao.ini', 'w') as config:
+				config.write(CONFIG.format(users_ou=base.users_ou, groups_ou=base.groups_ou,
+											mode='bulk', page_size=10, pool_size=1, batch_size=10)
+							.replace('batch_size = 10', 'batch_size = 10\n' + zabbix_options) + extra_config)
+			with installed(directory, server):
+				yield
+		finally:
+			shutdownLogging(log_file)
+			configureLogging(log_file=previous_log_file)
+			os.chdir(cwd)
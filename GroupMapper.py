@@ -0,0 +1,76 @@
+import re
+
+class GroupMapper:
+	"""
+	Classe que converte o nome do grupo do AD para o nome do grupo de usuario no Zabbix:
+	remove o prefixo (somente no inicio do nome), aplica as regras de renomeacao por
+	expressao regular e acrescenta o sufixo. Os resultados sao memorizados.
+	Ex: 'Monitoracao - Your Group 1' -> 'Your Group 1 (AD)'
+	"""
+
+	def __init__(self, prefix='', suffix='', rules=()):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		prefix : str
+			Prefixo removido do inicio do nome do grupo do AD.
+			Ex: 'Monitoracao - '
+		suffix : str
+			Sufixo acrescentado ao nome do grupo no Zabbix.
+			Ex: ' (AD)'
+		rules : list
+			Tuplas (expressao regular, substituicao) aplicadas em ordem ao nome sem o prefixo.
+			Ex: [('^NOC (.*)', r'\\1 - NOC')]
+		"""
+		self._prefix = prefix
+		self._suffix = suffix
+		self._rules = [(re.compile(pattern), replacement) for pattern, replacement in rules]
+		self._cache = {}
+
+	@staticmethod
+	def parseRules(text):
+		"""
+		Metodo que le as regras de renomeacao do conexao.ini, uma por linha no formato
+		'expressao => substituicao'.
+
+		Parameters
+		----------
+		text : str
+			Ex: '^NOC (.*) => \\1 - NOC'
+
+		Returns
+		-------
+		list
+			Ex: [('^NOC (.*)', '\\1 - NOC')]
+		"""
+		rules = []
+		for line in filter(None, (line.strip() for line in text.split('\n'))):
+			if '=>' not in line:
+				raise ValueError("Regra de renomeacao invalida (esperado 'expressao => substituicao'): " + line)
+			pattern, replacement = line.split('=>', 1)
+			rules.append((pattern.strip(), replacement.strip()))
+		return rules
+
+	def map(self, group):
+		"""
+		Metodo que retorna o nome do grupo no Zabbix.
+
+		Parameters
+		----------
+		group : str
+			Ex: 'Monitoracao - Your Group 1'
+
+		Returns
+		-------
+		str
+			Ex: 'Your Group 1 (AD)'
+		"""
+		result = self._cache.get(group)
+		if result is None:
+			result = group[len(self._prefix):] if self._prefix and group.startswith(self._prefix) else group
+			for pattern, replacement in self._rules:
+				result = pattern.sub(replacement, result)
+			result = self._cache[group] = result + self._suffix
+		return result
@@ -0,0 +1,112 @@
+import time
+
+class IdResolver:
+	"""
+	Classe que memoriza a resolucao nome -> ID de objetos do Zabbix (grupos de host,
+	grupos de usuario). Os nomes que faltam sao resolvidos juntos em uma unica consulta
+	e as entradas expiram apos 'ttl' segundos, permitindo reaproveitar o cache entre as
+	execucoes do daemon sem manter IDs de objetos removidos no Zabbix.
+	"""
+
+	def __init__(self, load, ttl=300, clock=time.monotonic):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		load : function
+			Funcao que recebe uma lista de nomes (ou None para todos) e retorna o
+			dicionario nome -> ID dos objetos encontrados, com uma unica chamada da API.
+		ttl : int
+			Tempo (segundos) de validade de cada entrada. 0 desativa o cache.
+		clock : function
+			Relogio utilizado para a expiracao. Opcional.
+		"""
+		self._load = load
+		self._ttl = ttl
+		self._clock = clock
+		self._ids = {}
+
+	def _valid(self, name, now):
+		entry = self._ids.get(name)
+		if entry is None:
+			return False
+		if entry[1] <= now:
+			del self._ids[name]
+			return False
+		return True
+
+	def get(self, name):
+		"""
+		Metodo que retorna o ID do objeto ou None caso nao exista.
+
+		Parameters
+		----------
+		name : str
+			Ex: 'Users from AD'
+		"""
+		return self.resolve([name]).get(name)
+
+	def resolve(self, names):
+		"""
+		Metodo que retorna os IDs dos objetos informados, consultando em uma unica chamada
+		somente os nomes que nao estao no cache.
+
+		Parameters
+		----------
+		names : list
+			Ex: ['Users from AD', 'Your Group (AD)']
+
+		Returns
+		-------
+		dict
+			Dicionario nome -> ID dos objetos encontrados.
+			Ex:
+			{'Users from AD': '13'}
+		"""
+		now = self._clock()
+		missing = [name for name in set(names) if not self._valid(name, now)]
+		loaded = self._load(missing) if missing else {}
+		self.update(loaded)
+		result = {}
+		for name in names:
+			entry = self._ids.get(name)
+			if entry is not None:
+				result[name] = entry[0]
+			elif name in loaded:
+				result[name] = loaded[name]
+		return result
+
+	def populate(self):
+		"""
+		Metodo que carrega todos os objetos em uma unica chamada, substituindo o cache.
+		"""
+		self._ids = {}
+		self.update(self._load(None))
+
+	def update(self, ids):
+		"""
+		Metodo que registra IDs conhecidos (ex: objetos recem-criados ou ja consultados).
+
+		Parameters
+		----------
+		ids : dict
+			Ex: {'Your Group (AD)': '127'}
+		"""
+		if self._ttl <= 0:
+			return
+		expires = self._clock() + self._ttl
+		for name, objectid in ids.items():
+			self._ids[name] = (objectid, expires)
+
+	def invalidate(self, name=None):
+		"""
+		Metodo que remove um nome do cache ou, sem parametro, todo o cache.
+		"""
+		if name is None:
+			self._ids = {}
+		else:
+			self._ids.pop(name, None)
+
+	def __len__(self):
+		return len(self._ids)
@@ -0,0 +1,76 @@
+"""
+Montagem de filtros LDAP com os valores escapados conforme a RFC 4515.
+"""
+
+# Tamanho maximo (caracteres) de cada filtro montado por orFilters
+MAX_FILTER_LENGTH = 8000
+
+_ESCAPES = {'\\': '\\5c', '*': '\\2a', '(': '\\28', ')': '\\29', '\x00': '\\00'}
+
+
+def escapeValue(value, wildcard=False):
+	"""
+	Metodo que escapa um valor para uso em um filtro LDAP.
+
+	Parameters
+	----------
+	value : str
+		Ex: 'Monitoracao - Web (Prod)'
+	wildcard : bool
+		Mantem '*' como curinga (padroes do conexao.ini), escapando os demais caracteres.
+
+	Returns
+	-------
+	str
+		Ex: 'Monitoracao - Web \\28Prod\\29'
+	"""
+	return ''.join(char if wildcard and char == '*' else _ESCAPES.get(char, char) for char in value)
+
+def equalityFilter(attr, value, wildcard=False):
+	"""
+	Metodo que retorna o filtro '(attr=valor)' com o valor escapado.
+	Ex: equalityFilter('cn', 'Monitoracao - *', True) -> '(cn=Monitoracao - *)'
+	"""
+	return '(%s=%s)' % (attr, escapeValue(value, wildcard))
+
+def orFilter(attr, values, wildcard=False):
+	"""
+	Metodo que retorna um unico filtro '(|(attr=valor1)(attr=valor2)...)'.
+	"""
+	return '(|' + ''.join(equalityFilter(attr, value, wildcard) for value in values) + ')'
+
+def orFilters(attr, values, wildcard=False, max_length=MAX_FILTER_LENGTH):
+	"""
+	Metodo que junta os valores no menor numero de filtros '(|...)' com ate max_length
+	caracteres cada, evitando filtros grandes demais para o AD.
+
+	Parameters
+	----------
+	attr : str
+		Ex: 'cn'
+	values : list
+		Ex: ['Monitoracao - Web', 'Monitoracao - Banco']
+	wildcard : bool
+		Mantem '*' como curinga nos valores.
+	max_length : int
+		Tamanho maximo de cada filtro. Um valor maior que o limite gera um filtro somente com ele.
+
+	Returns
+	-------
+	list
+		Ex: ['(|(cn=Monitoracao - Web)(cn=Monitoracao - Banco))']
+	"""
+	filters = []
+	items = []
+	length = 3
+	for value in values:
+		item = equalityFilter(attr, value, wildcard)
+		if items and length + len(item) > max_length:
+			filters.append('(|' + ''.join(items) + ')')
+			items = []
+			length = 3
+		items.append(item)
+		length += len(item)
+	if items:
+		filters.append('(|' + ''.join(items) + ')')
+	return filters
@@ -1,34 +1,152 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# Saidas compartilhadas pelo processo: caminho absoluto do arquivo de log -> (QueueHandler, QueueListener).
+# Os loggers gravam somente na fila; a escrita no arquivo e feita pela thread do listener.
+_outputs = {}
+_lock = threading.Lock()
+_settings = {'max_bytes': 10485760, 'backup_count': 5, 'log_format': 'text', 'log_file': 'python.log'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Classe que formata cada registro de log como uma linha JSON.
+    Ex: {"time": "2020-05-04 10:00:00,123", "name": "ZabbixManager", "level": "INFO", "message": "..."}
+    """
+
+    def format(self, record):
+        data = {'time': self.formatTime(record), 'name': record.name,
+                'level': record.levelname, 'message': record.getMessage()}
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _fileHandler(log_file):
+    """
+    Metodo que cria o handler com rotacao que grava no arquivo de log.
+    """
+    handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=_settings['max_bytes'],
+                                                   backupCount=_settings['backup_count'], encoding='utf-8')
+    if _settings['log_format'] == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return handler
+
+
+def _queueHandler(log_file):
+    """
+    Metodo que retorna o QueueHandler do arquivo de log, criando uma unica vez por processo
+    a fila e o listener que grava no arquivo.
+    """
+    with _lock:
+        if log_file not in _outputs:
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, _fileHandler(log_file))
+            listener.start()
+            _outputs[log_file] = (logging.handlers.QueueHandler(log_queue), listener)
+        return _outputs[log_file][0]
+
+
+def configureLogging(max_bytes=None, backup_count=None, log_format=None, log_file=None):
+    """
+    Metodo que altera a rotacao e o formato dos arquivos de log, inclusive dos ja abertos,
+    e o arquivo padrao dos LogManager criados em seguida.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Tamanho maximo (bytes) do arquivo antes da rotacao. 0 desativa a rotacao.
+    backup_count : int
+        Quantidade de arquivos rotacionados mantidos.
+    log_format : str
+        Formato das linhas: "text" ou "json".
+    log_file : str
+        Arquivo de log dos LogManager criados sem informar o arquivo.
+    """
+    with _lock:
+        for key, value in (('max_bytes', max_bytes), ('backup_count', backup_count), ('log_format', log_format),
+                           ('log_file', log_file)):
+            if value is not None:
+                _settings[key] = value
+        for log_file, (handler, listener) in list(_outputs.items()):
+            listener.stop()
+            for old_handler in listener.handlers:
+                old_handler.close()
+            listener = logging.handlers.QueueListener(listener.queue, _fileHandler(log_file))
+            listener.start()
+            _outputs[log_file] = (handler, listener)
+
+
+def getLogFile():
+    """
+    Metodo que retorna o arquivo de log padrao dos LogManager (ver configureLogging).
+    """
+    return _settings['log_file']
+
+
+def shutdownLogging(log_file=None):
+    """
+    Metodo que grava os registros pendentes nas filas e fecha os arquivos de log.
+    Um novo LogManager para o mesmo arquivo volta a abri-lo.
+
+    Parameters
+    ----------
+    log_file : str
+        Arquivo de log a ser fechado. Opcional (todos os arquivos).
+    """
+    with _lock:
+        for name in [os.path.abspath(log_file)] if log_file else list(_outputs):
+            if name not in _outputs:
+                continue
+            handler, listener = _outputs.pop(name)
+            for logger in list(logging.Logger.manager.loggerDict.values()):
+                if isinstance(logger, logging.Logger) and handler in logger.handlers:
+                    logger.removeHandler(handler)
+            listener.stop()
+            for file_handler in listener.handlers:
+                file_handler.close()
+
+atexit.register(shutdownLogging)
+
 
 class LogManager:
 
     # Log variables
     _log_level = "INFO"
     _logger_name = __name__
-    _log_file = 'python.log'
+    _log_file = None
     logger = None
 
     def __init__(self, log_level=_log_level, logger_name=_logger_name, log_file=_log_file):
         """
         Metodo construtor.
+        O arquivo de log e compartilhado pelo processo: criar varias instancias para o
+        mesmo logger nao duplica handlers nem as linhas gravadas.
 
         Parameters
         ----------
         log_level : str
             Nivel de log a ser exibido. Valores possiveis: "INFO", "WARN" e "DEBUG".
         log_file : str
-            Nome do arquivo no qual os logs serao gravados.
+            Nome do arquivo no qual os logs serao gravados. Opcional, por padrao o arquivo
+            informado em configureLogging (python.log).
         """
         self._log_level = self.getLogLevel(log_level)
-        self._log_file = log_file
+        # Caminho absoluto: o arquivo reaberto por configureLogging nao depende do diretorio atual
+        self._log_file = os.path.abspath(log_file or _settings['log_file'])
         self._logger_name = logger_name
         self.logger = logging.getLogger(self._logger_name)
         self.logger.setLevel(self._log_level)
-        handler = logging.FileHandler(self._log_file)
-        handler.setLevel(self._log_level)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        handler = _queueHandler(self._log_file)
+        if handler not in self.logger.handlers:
+            self.logger.addHandler(handler)
 
     def getLogLevel(self, log_level):
         """
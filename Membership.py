@@ -0,0 +1,159 @@
+import sys
+from Records import User, Group
+
+class MembershipIndex:
+	"""
+	Classe que armazena de forma compacta os membros dos grupos do AD: cada usuario e
+	guardado uma unica vez (User com alias internado, indexado por um ID inteiro) e cada
+	grupo guarda somente o conjunto de IDs dos seus membros, mesmo que o usuario
+	participe de muitos grupos.
+
+	A iteracao produz, um grupo por vez, os itens no formato de AdManager.getGroupMembersDic,
+	permitindo usar o indice onde a lista de dicionarios era esperada.
+	"""
+
+	def __init__(self):
+		"""
+		Metodo construtor.
+		"""
+		self._ids = {}
+		self._users = []
+		self._groups = {}
+
+	@classmethod
+	def fromList(cls, ad_list):
+		"""
+		Metodo que monta o indice a partir da lista no formato de AdManager.getGroupMembersDic.
+
+		Parameters
+		----------
+		ad_list : list
+			Ex:
+			[{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]}]
+		"""
+		index = cls()
+		for item in ad_list:
+			index.addGroup(item['group'])
+			for member in item['members']:
+				index.add(item['group'], member['alias'], member['name'])
+		return index
+
+	def addGroup(self, group):
+		"""
+		Metodo que registra um grupo (inclusive sem membros).
+		"""
+		if group not in self._groups:
+			self._groups[group] = set()
+
+	def add(self, group, alias, name):
+		"""
+		Metodo que registra um usuario como membro de um grupo.
+
+		Parameters
+		----------
+		group : str
+			Ex: 'Your Group (AD)'
+		alias : str
+			Ex: 'thiago'
+		name : str
+			Ex: 'THIAGO MURILO DINIZ'
+		"""
+		userid = self._ids.get(alias)
+		if userid is None:
+			alias = sys.intern(alias)
+			userid = self._ids[alias] = len(self._users)
+			self._users.append(User(alias, name))
+		else:
+			self._users[userid].name = name
+		members = self._groups.get(group)
+		if members is None:
+			members = self._groups[group] = set()
+		members.add(userid)
+
+	def select(self, groups):
+		"""
+		Metodo que retorna um indice somente com os grupos informados, compartilhando os usuarios.
+
+		Parameters
+		----------
+		groups : set
+			Ex: {'Your Group (AD)'}
+		"""
+		index = MembershipIndex()
+		index._ids = self._ids
+		index._users = self._users
+		index._groups = dict((group, members) for group, members in self._groups.items() if group in groups)
+		return index
+
+	def groups(self):
+		"""
+		Metodo que retorna os nomes dos grupos, na ordem em que foram registrados.
+		"""
+		return list(self._groups)
+
+	def aliases(self, group=None):
+		"""
+		Metodo que retorna os alias dos membros de um grupo ou, sem parametro, de todos os grupos.
+
+		Returns
+		-------
+		set
+			Ex: {'thiago', 'fulano'}
+		"""
+		if group is None:
+			return set(self._users[userid].alias for members in self._groups.values() for userid in members)
+		return set(self._users[userid].alias for userid in self._groups.get(group, ()))
+
+	def users(self, group):
+		"""
+		Metodo que retorna, ordenados pelo alias, os membros de um grupo.
+
+		Returns
+		-------
+		list
+			Lista de User (compartilhados entre os grupos).
+			Ex: [User('thiago', 'THIAGO MURILO DINIZ', None)]
+		"""
+		return sorted((self._users[userid] for userid in self._groups.get(group, ())), key=lambda user: user.alias)
+
+	def iterGroups(self):
+		"""
+		Metodo que retorna, um a um, os grupos como Group com os membros ordenados pelo alias.
+		"""
+		for group in self._groups:
+			yield Group(group, members=self.users(group))
+
+	def iterMembers(self, group):
+		"""
+		Metodo que retorna, ordenados pelo alias, os membros de um grupo no formato de
+		AdManager.getGroupMembersDic.
+
+		Returns
+		-------
+		generator
+			Ex: {'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}
+		"""
+		for user in self.users(group):
+			yield user.toDict()
+
+	def countMemberships(self):
+		"""
+		Metodo que retorna a quantidade de pares grupo/membro.
+		"""
+		return sum(len(members) for members in self._groups.values())
+
+	def toList(self):
+		"""
+		Metodo que retorna o indice no formato de AdManager.getGroupMembersDic.
+		"""
+		return list(self)
+
+	def __iter__(self):
+		for group in self._groups:
+			yield {'group': group, 'members': list(self.iterMembers(group))}
+
+	def __len__(self):
+		return len(self._groups)
+
+	def __contains__(self, group):
+		return group in self._groups
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class MetricsRegistry:
+	"""
+	Classe que registra, por nome de operacao, quantidade de chamadas, histograma de
+	latencia, quantidade de itens e de bytes enviados/recebidos (consultas ao AD, chamadas
+	da API Zabbix e fases da sincronizacao).
+	"""
+
+	# Limites (segundos) dos buckets do histograma de latencia
+	BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+	def __init__(self):
+		"""
+		Metodo construtor.
+		"""
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		"""
+		Metodo que descarta todas as metricas registradas.
+		"""
+		with self._lock:
+			self._metrics = {}
+			self._started = time.time()
+
+	def observe(self, name, seconds, items_in=0, items_out=0, bytes_in=0, bytes_out=0):
+		"""
+		Metodo que registra uma ocorrencia da operacao.
+
+		Parameters
+		----------
+		name : str
+			Nome da operacao.
+			Ex: 'zabbix.usergroup.get'
+		seconds : float
+			Duracao da operacao.
+		items_in : int
+			Quantidade de itens recebidos (entradas do AD, objetos retornados pela API).
+		items_out : int
+			Quantidade de itens enviados (objetos enviados a API).
+		bytes_in : int
+			Tamanho (bytes) das respostas recebidas (corpo das respostas da API).
+		bytes_out : int
+			Tamanho (bytes) das requisicoes enviadas (corpo das requisicoes a API).
+		"""
+		with self._lock:
+			metric = self._metrics.get(name)
+			if metric is None:
+				metric = self._metrics[name] = {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+												'items_in': 0, 'items_out': 0, 'bytes_in': 0, 'bytes_out': 0,
+												'buckets': [0] * len(self.BUCKETS)}
+			metric['count'] += 1
+			metric['seconds'] += seconds
+			metric['max_seconds'] = max(metric['max_seconds'], seconds)
+			metric['items_in'] += items_in
+			metric['items_out'] += items_out
+			metric['bytes_in'] += bytes_in
+			metric['bytes_out'] += bytes_out
+			for i, limit in enumerate(self.BUCKETS):
+				if seconds <= limit:
+					metric['buckets'][i] += 1
+					break
+
+	@contextmanager
+	def timer(self, name, items_out=0):
+		"""
+		Metodo que mede a duracao do bloco 'with' e a registra como uma ocorrencia da operacao.
+		O objeto retornado permite informar a quantidade de itens recebidos e os bytes
+		enviados/recebidos.
+
+		Ex:
+		with metrics.timer('ldap.search') as timer:
+			timer.items_in = len(result)
+		"""
+		timer = _Timer(items_out)
+		start = time.perf_counter()
+		try:
+			yield timer
+		finally:
+			self.observe(name, time.perf_counter() - start, timer.items_in, timer.items_out, timer.bytes_in, timer.bytes_out)
+
+	def summary(self):
+		"""
+		Metodo que retorna o resumo das metricas registradas.
+
+		Returns
+		-------
+		dict
+			Ex:
+			{'started': 1539978000.0, 'operations': {'ldap.search': {'count': 3, 'seconds': 0.42,
+			'max_seconds': 0.3, 'items_in': 1200, 'items_out': 0, 'bytes_in': 0, 'bytes_out': 0, 'buckets': {'0.005': 0, ..., '+Inf': 0}}}}
+		"""
+		with self._lock:
+			operations = {}
+			for name, metric in sorted(self._metrics.items()):
+				item = dict(metric)
+				item['buckets'] = dict(zip([str(limit) for limit in self.BUCKETS], metric['buckets']))
+				item['buckets']['+Inf'] = metric['count'] - sum(metric['buckets'])
+				operations[name] = item
+			return {'started': self._started, 'operations': operations}
+
+	def toJson(self):
+		"""
+		Metodo que retorna o resumo das metricas em JSON.
+		"""
+		return json.dumps(self.summary(), sort_keys=True)
+
+	def writeJson(self, path):
+		"""
+		Metodo que grava o resumo das metricas em JSON no arquivo informado.
+		"""
+		self._write(path, self.toJson() + '\n')
+
+	def writePrometheus(self, path):
+		"""
+		Metodo que grava as metricas no formato texto do Prometheus (textfile collector).
+		"""
+		lines = ['# TYPE zabbix_ad_sync_duration_seconds histogram']
+		summary = self.summary()['operations']
+		for name, metric in summary.items():
+			cumulative = 0
+			for limit in [str(limit) for limit in self.BUCKETS] + ['+Inf']:
+				cumulative += metric['buckets'][limit]
+				lines.append('zabbix_ad_sync_duration_seconds_bucket{operation="%s",le="%s"} %d' % (name, limit, cumulative))
+			lines.append('zabbix_ad_sync_duration_seconds_sum{operation="%s"} %f' % (name, metric['seconds']))
+			lines.append('zabbix_ad_sync_duration_seconds_count{operation="%s"} %d' % (name, metric['count']))
+		lines.append('# TYPE zabbix_ad_sync_items_total counter')
+		for name, metric in summary.items():
+			lines.append('zabbix_ad_sync_items_total{operation="%s",direction="in"} %d' % (name, metric['items_in']))
+			lines.append('zabbix_ad_sync_items_total{operation="%s",direction="out"} %d' % (name, metric['items_out']))
+		lines.append('# TYPE zabbix_ad_sync_bytes_total counter')
+		for name, metric in summary.items():
+			if metric['bytes_in'] or metric['bytes_out']:
+				lines.append('zabbix_ad_sync_bytes_total{operation="%s",direction="in"} %d' % (name, metric['bytes_in']))
+				lines.append('zabbix_ad_sync_bytes_total{operation="%s",direction="out"} %d' % (name, metric['bytes_out']))
+		self._write(path, '\n'.join(lines) + '\n')
+
+	def sendZabbixTrapper(self, server, host, port=10051):
+		"""
+		Metodo que envia as metricas para itens Zabbix trapper do host informado:
+		'zabbix_ad_sync.count[<operacao>]' e 'zabbix_ad_sync.seconds[<operacao>]'.
+
+		Parameters
+		----------
+		server : str
+			Endereco do Zabbix server/proxy.
+		host : str
+			Nome do host no Zabbix que possui os itens trapper.
+		port : int
+			Porta do trapper.
+		"""
+		from zabbix.sender import ZabbixMetric, ZabbixSender
+		packet = []
+		for name, metric in self.summary()['operations'].items():
+			packet.append(ZabbixMetric(host, 'zabbix_ad_sync.count[%s]' % name, metric['count']))
+			packet.append(ZabbixMetric(host, 'zabbix_ad_sync.seconds[%s]' % name, round(metric['seconds'], 6)))
+		return ZabbixSender(zabbix_server=server, zabbix_port=port).send(packet)
+
+	def _write(self, path, content):
+		"""
+		Metodo que grava o arquivo de forma atomica (coletores podem le-lo a qualquer momento).
+		"""
+		tmp_path = path + '.tmp'
+		with open(tmp_path, 'w', encoding='utf-8') as output:
+			output.write(content)
+		os.replace(tmp_path, path)
+
+
+class _Timer:
+
+	def __init__(self, items_out=0):
+		self.items_in = 0
+		self.items_out = items_out
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+
+# Registro unico do processo, compartilhado por AdManager, ZabbixManager e sync_users
+metrics = MetricsRegistry()
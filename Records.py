@@ -0,0 +1,201 @@
+class User:
+	"""
+	Classe que representa um usuario do AD ou do Zabbix. Igualdade e hash pelo alias.
+	"""
+	__slots__ = ('alias', 'name', 'id')
+
+	def __init__(self, alias, name=None, id=None):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		alias : str
+			Login do usuario.
+			Ex: 'thiago'
+		name : str
+			Nome do usuario no AD. Opcional.
+			Ex: 'THIAGO MURILO DINIZ'
+		id : str
+			ID do usuario no Zabbix. Opcional.
+			Ex: '3'
+		"""
+		self.alias = alias
+		self.name = name
+		self.id = id
+
+	@classmethod
+	def fromDict(cls, data):
+		"""
+		Metodo que cria o usuario a partir do dicionario usado por AdManager/ZabbixManager.
+		Ex: {'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'} ou {'id': '3', 'alias': 'thiago'}
+		"""
+		return cls(data['alias'], data.get('name'), data.get('id'))
+
+	def toDict(self):
+		"""
+		Metodo que retorna o usuario no formato de dicionario (somente com os campos preenchidos).
+		"""
+		data = {}
+		if self.id is not None:
+			data['id'] = self.id
+		data['alias'] = self.alias
+		if self.name is not None:
+			data['name'] = self.name
+		return data
+
+	def __eq__(self, other):
+		return isinstance(other, User) and self.alias == other.alias
+
+	def __hash__(self):
+		return hash(self.alias)
+
+	def __repr__(self):
+		return 'User(%r, %r, %r)' % (self.alias, self.name, self.id)
+
+
+class Group:
+	"""
+	Classe que representa um grupo do AD ou grupo de usuario do Zabbix e seus membros.
+	Igualdade e hash pelo ID (ou pelo nome, quando o grupo ainda nao possui ID).
+	"""
+	__slots__ = ('name', 'id', 'members')
+
+	def __init__(self, name, id=None, members=None):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		name : str
+			Ex: 'Your Group (AD)'
+		id : str
+			ID do grupo de usuario no Zabbix. Opcional.
+			Ex: '55'
+		members : list
+			Lista de User. Opcional (None quando os membros nao foram lidos).
+		"""
+		self.name = name
+		self.id = id
+		self.members = members
+
+	@classmethod
+	def fromDict(cls, data):
+		"""
+		Metodo que cria o grupo a partir do dicionario usado por AdManager/ZabbixManager.
+		Ex: {'group': 'Your Group (AD)', 'id': '55', 'members': [{'id': '3', 'alias': 'thiago'}]}
+		"""
+		members = data.get('members')
+		if members is not None:
+			members = [User.fromDict(member) for member in members]
+		return cls(data['group'], data.get('id'), members)
+
+	def toDict(self):
+		"""
+		Metodo que retorna o grupo no formato de dicionario de AdManager/ZabbixManager.
+		"""
+		data = {'group': self.name}
+		if self.id is not None:
+			data['id'] = self.id
+		if self.members is not None:
+			data['members'] = [member.toDict() for member in self.members]
+		return data
+
+	def aliases(self):
+		"""
+		Metodo que retorna o conjunto de alias dos membros.
+		"""
+		return set(member.alias for member in self.members or ())
+
+	def _key(self):
+		return self.id if self.id is not None else self.name
+
+	def __eq__(self, other):
+		return isinstance(other, Group) and self._key() == other._key()
+
+	def __hash__(self):
+		return hash(self._key())
+
+	def __repr__(self):
+		return 'Group(%r, %r, %d membros)' % (self.name, self.id, len(self.members or ()))
+
+
+class Membership:
+	"""
+	Classe que representa a atualizacao dos membros de um grupo de usuario do Zabbix
+	(IDs dos usuarios a adicionar e a remover). Igualdade e hash pelo ID do grupo.
+	"""
+	__slots__ = ('group', 'id', 'add', 'remove')
+
+	def __init__(self, group, id, add=(), remove=()):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		group : str
+			Ex: 'Your Group (AD)'
+		id : str
+			ID do grupo de usuario no Zabbix.
+			Ex: '55'
+		add : list
+			IDs dos usuarios a adicionar.
+			Ex: ['8']
+		remove : list
+			IDs dos usuarios a remover.
+		"""
+		self.group = group
+		self.id = id
+		self.add = list(add)
+		self.remove = list(remove)
+
+	@classmethod
+	def fromDict(cls, data):
+		"""
+		Metodo que cria a atualizacao a partir do dicionario usado por ZabbixManager.updateUsers.
+		Ex: {'group': 'Your Group (AD)', 'id': '55', 'add': ['8'], 'remove': []}
+		"""
+		return cls(data['group'], data['id'], data['add'], data['remove'])
+
+	def toDict(self):
+		"""
+		Metodo que retorna a atualizacao no formato de dicionario de ZabbixManager.updateUsers.
+		"""
+		return {'group': self.group, 'id': self.id, 'add': list(self.add), 'remove': list(self.remove)}
+
+	def __eq__(self, other):
+		return isinstance(other, Membership) and self.id == other.id
+
+	def __hash__(self):
+		return hash(self.id)
+
+	def __repr__(self):
+		return 'Membership(%r, %r, add=%r, remove=%r)' % (self.group, self.id, self.add, self.remove)
+
+
+def asRecords(record_class, items):
+	"""
+	Metodo que converte dicionarios no tipo informado, mantendo os itens que ja sao registros.
+
+	Parameters
+	----------
+	record_class : type
+		User, Group ou Membership.
+	items : list
+		Registros e/ou dicionarios.
+
+	Returns
+	-------
+	list
+		Lista de registros.
+	"""
+	return [item if isinstance(item, record_class) else record_class.fromDict(item) for item in items or ()]
+
+def iterGroups(ad_list):
+	"""
+	Metodo que retorna, um a um, os grupos do AD como Group, aceitando um MembershipIndex
+	ou a lista no formato de AdManager.getGroupMembersDic.
+	"""
+	if hasattr(ad_list, 'iterGroups'):
+		return ad_list.iterGroups()
+	return (item if isinstance(item, Group) else Group.fromDict(item) for item in ad_list)
@@ -0,0 +1,115 @@
+class SyncSnapshot:
+	"""
+	Classe que memoriza as leituras feitas no AD e no Zabbix durante uma execucao
+	da sincronizacao. As leituras do Zabbix devem ser descartadas (invalidate) apos as
+	escritas, como feito por sync_users.applyPlan.
+	"""
+
+	def __init__(self, zm, am):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		zm : ZabbixManager
+			Instancia conectada na API Zabbix.
+		am : AdManager
+			Instancia conectada no AD.
+		"""
+		self.zm = zm
+		self.am = am
+		self._cache = {}
+
+	def _get(self, key, loader):
+		"""
+		Metodo que retorna o valor memorizado para a chave, carregando-o na primeira chamada.
+		"""
+		if key not in self._cache:
+			self._cache[key] = loader()
+		return self._cache[key]
+
+	def invalidate(self, *keys):
+		"""
+		Metodo que descarta valores memorizados.
+
+		Parameters
+		----------
+		keys : str
+			Chaves a serem descartadas ('ad_groups', 'ad_members', 'zb_usergroups',
+			'zb_users', 'zb_hostgroups'). Sem parametros descarta todas.
+		"""
+		if not keys:
+			self._cache.clear()
+		# Inclui as leituras parciais, memorizadas com a chave (chave, nomes...)
+		for cached in [cached for cached in self._cache if (cached[0] if isinstance(cached, tuple) else cached) in keys]:
+			del self._cache[cached]
+
+	def getAdGroups(self):
+		"""
+		Metodo que retorna os nomes dos grupos do AD informados no conexao.ini.
+
+		Returns
+		-------
+		list
+			Ex:
+			['Monitoracao - Your Group 1', 'Monitoracao - Your Group 2']
+		"""
+		return self._get('ad_groups', lambda: self.am.getGroupsList(self.am.FILTER_GROUP_SEARCH_AD))
+
+	def getAdMembers(self):
+		"""
+		Metodo que retorna os grupos do AD e seus membros em um MembershipIndex, cuja iteracao
+		produz os itens no formato de AdManager.getGroupMembersDic.
+		"""
+		return self._get('ad_members', lambda: self.am.getGroupMembersIndex(self.am.FILTER_GROUP_SEARCH_AD, self.getAdGroups()))
+
+	def getZabbixUsergroups(self, names=None):
+		"""
+		Metodo que retorna os grupos de usuario do Zabbix com o sufixo dos grupos do AD
+		e seus membros (lista de Group, como em ZabbixManager.getUsergroups(True)).
+
+		Parameters
+		----------
+		names : list
+			Somente os grupos informados (ex: os grupos alterados no AD). Opcional.
+		"""
+		if names is None:
+			return self._get('zb_usergroups', lambda: self.zm.getUsergroups(True, self.am.FILTER_GROUP_SUFFIX_ZB))
+		names = sorted(names)
+		return self._get(('zb_usergroups',) + tuple(names), lambda: self.zm.getUsergroups(True, names=names))
+
+	def getZabbixUsers(self, aliases=None):
+		"""
+		Metodo que retorna o ID dos usuarios do Zabbix que sao membros dos grupos do AD.
+
+		Parameters
+		----------
+		aliases : list
+			Somente os usuarios informados. Opcional.
+
+		Returns
+		-------
+		dict
+			Ex:
+			{'thiago': '3'}
+		"""
+		if aliases is not None:
+			aliases = sorted(aliases)
+			return self._get(('zb_users',) + tuple(aliases), lambda: self.zm.getUsersByAlias(aliases))
+		def load():
+			return self.zm.getUsersByAlias(sorted(self.getAdMembers().aliases()))
+		return self._get('zb_users', load)
+
+	def getZabbixHostgroups(self):
+		"""
+		Metodo que retorna os nomes dos grupos de host do Zabbix.
+		"""
+		return self._get('zb_hostgroups', self.zm.getHostgroupsList)
+
+	def createHostgroups(self, hostgroup_list):
+		"""
+		Metodo que cria grupos de host no Zabbix e invalida a leitura dos hostgroups.
+		"""
+		if hostgroup_list:
+			self.invalidate('zb_hostgroups')
+		return self.zm.createHostgroups(hostgroup_list)
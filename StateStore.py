@@ -0,0 +1,156 @@
+import sqlite3
+from Records import iterGroups
+
+class StateStore:
+	"""
+	Classe para gerenciar o estado local (SQLite) da ultima sincronizacao aplicada:
+	grupos do AD e seus membros, e IDs dos usergroups e usuarios no Zabbix.
+	"""
+
+	def __init__(self, path='sync_state.db'):
+		"""
+		Metodo construtor.
+
+		Parameters
+		----------
+		path : str
+			Caminho do arquivo SQLite.
+		"""
+		self._path = path
+		self._db = sqlite3.connect(path)
+		with self._db:
+			self._db.execute('CREATE TABLE IF NOT EXISTS membership (usergroup TEXT NOT NULL, alias TEXT NOT NULL, name TEXT, PRIMARY KEY (usergroup, alias))')
+			self._db.execute('CREATE TABLE IF NOT EXISTS usergroup (name TEXT PRIMARY KEY, usrgrpid TEXT NOT NULL)')
+			self._db.execute('CREATE TABLE IF NOT EXISTS user (alias TEXT PRIMARY KEY, userid TEXT NOT NULL)')
+			self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+	def close(self):
+		"""
+		Metodo que fecha o arquivo de estado.
+		"""
+		self._db.close()
+
+	def hasState(self):
+		"""
+		Metodo que indica se ja existe uma sincronizacao aplicada gravada.
+
+		Returns
+		-------
+		bool
+		"""
+		return self._db.execute("SELECT 1 FROM meta WHERE key = 'applied'").fetchone() is not None
+
+	def clear(self):
+		"""
+		Metodo que apaga todo o estado gravado (usado pelo --rebuild-state).
+		"""
+		with self._db:
+			for table in ('membership', 'usergroup', 'user', 'meta'):
+				self._db.execute('DELETE FROM ' + table)
+
+	def getMembership(self):
+		"""
+		Metodo que retorna os grupos e membros da ultima sincronizacao aplicada.
+
+		Returns
+		-------
+		dict
+			Dicionario grupo -> conjunto de aliases.
+			Ex:
+			{'Your Group (AD)': {'thiago', 'fulano'}}
+		"""
+		membership = {}
+		for group, alias in self._db.execute('SELECT usergroup, alias FROM membership'):
+			membership.setdefault(group, set()).add(alias)
+		for (group,) in self._db.execute('SELECT name FROM usergroup'):
+			membership.setdefault(group, set())
+		return membership
+
+	def getUsergroupIds(self):
+		"""
+		Metodo que retorna os IDs dos usergroups gravados.
+
+		Returns
+		-------
+		dict
+			Ex:
+			{'Your Group (AD)': '55'}
+		"""
+		return dict(self._db.execute('SELECT name, usrgrpid FROM usergroup'))
+
+	def getUserIds(self):
+		"""
+		Metodo que retorna os IDs dos usuarios gravados.
+
+		Returns
+		-------
+		dict
+			Ex:
+			{'thiago': '3'}
+		"""
+		return dict(self._db.execute('SELECT alias, userid FROM user'))
+
+	def getChangedGroups(self, ad_list):
+		"""
+		Metodo que retorna os grupos cujos membros no AD diferem da ultima sincronizacao aplicada.
+
+		Parameters
+		----------
+		ad_list : list ou MembershipIndex
+			Ex:
+			[{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]}]
+
+		Returns
+		-------
+		list
+			Nomes dos grupos novos, alterados ou que nao existem mais no AD.
+			Ex:
+			['Acesso de leitura']
+		"""
+		stored = self.getMembership()
+		changed = []
+		for ad_item in iterGroups(ad_list):
+			if stored.pop(ad_item.name, None) != ad_item.aliases():
+				changed.append(ad_item.name)
+		changed.extend(stored)
+		return changed
+
+	def save(self, ad_list, usergroup_ids, user_ids, failed_groups=(), groups=None):
+		"""
+		Metodo que grava, em uma unica transacao, o estado da sincronizacao aplicada.
+		Deve ser chamado somente apos as alteracoes terem sido aplicadas no Zabbix.
+
+		Parameters
+		----------
+		ad_list : list ou MembershipIndex
+			Grupos do AD e seus membros, no formato de AdManager.getGroupMembersDic.
+		usergroup_ids : dict
+			Nome -> ID dos usergroups no Zabbix.
+			Ex: {'Your Group (AD)': '55'}
+		user_ids : dict
+			Alias -> ID dos usuarios no Zabbix.
+			Ex: {'thiago': '3'}
+		failed_groups : set
+			Grupos cujas alteracoes nao foram aplicadas por completo. Nao sao gravados, para
+			que getChangedGroups os retorne novamente na proxima sincronizacao. Opcional.
+			Ex: {'Your Group (AD)'}
+		groups : list
+			Grupos sincronizados. Somente eles sao substituidos (os grupos ausentes de ad_list
+			sao removidos) e os demais grupos e IDs gravados sao mantidos. Opcional, por padrao
+			todo o estado e substituido.
+			Ex: ['Your Group (AD)']
+		"""
+		items = [item for item in iterGroups(ad_list) if item.name not in failed_groups]
+		with self._db:
+			if groups is None:
+				for table in ('membership', 'usergroup', 'user'):
+					self._db.execute('DELETE FROM ' + table)
+			else:
+				for table, column in (('membership', 'usergroup'), ('usergroup', 'name')):
+					self._db.executemany('DELETE FROM %s WHERE %s = ?' % (table, column), ((group,) for group in groups))
+			self._db.executemany('INSERT OR REPLACE INTO membership VALUES (?, ?, ?)',
+								((item.name, member.alias, member.name) for item in items for member in item.members))
+			self._db.executemany('INSERT OR REPLACE INTO usergroup VALUES (?, ?)',
+								((item.name, usergroup_ids[item.name]) for item in items if item.name in usergroup_ids))
+			self._db.executemany('INSERT OR REPLACE INTO user VALUES (?, ?)', user_ids.items())
+			self._db.execute("INSERT OR REPLACE INTO meta VALUES ('applied', datetime('now'))")
@@ -1,46 +1,212 @@
-from zabbix.api import ZabbixAPI
 from Logging import LogManager
+from Metrics import metrics
+from AsyncZabbixAPI import ZabbixClient, ZabbixAPIException
+from Records import User, Group, Membership, asRecords
+from IdResolver import IdResolver
+from Config import getConfig
 import string
 from random import randint, choice
-import configparser
+import json
+import os
 
 class ZabbixManager:
 	"""
 	Classe para gerenciar a conexao e operacoes via API Zabbix.
 	"""
 
-	def __init__(self):
+	def __init__(self, config=None):
 		"""
 		Metodo construtor.
 		Pega configuracoes iniciais do arquivo conexao.ini.
+
+		Parameters
+		----------
+		config : Config
+			Configuracao ja lida do conexao.ini. Opcional (padrao: getConfig()).
 		"""
-		cp = configparser.ConfigParser()
-		cp.read('conexao.ini')
-		if cp.has_section('zabbix'):
-			self._log_level = cp['zabbix']['log_level']
+		config = config or getConfig()
+		if config.has_section('zabbix'):
+			zabbix = config.section('zabbix')
+			self._log_level = zabbix['log_level']
 			self._log = LogManager(self._log_level, __name__)
-			self._server_url = cp['zabbix']['host']
-			self._user = cp['zabbix']['username']
-			self._password = cp['zabbix']['password']
-			self.DEFAULT_GROUP = cp['zabbix']['default_group']
-			#self.ADMIN_GROUPS = cp['zabbix']['admin_groups']
-			#self.SUPERADMIN_GROUPS = cp['zabbix']['superadmin_groups']
+			self._server_url = zabbix['host']
+			self._user = zabbix['username']
+			self._password = zabbix['password']
+			self.DEFAULT_GROUP = zabbix['default_group']
+			self._batch_size = max(1, zabbix.getint('batch_size', 100))
+			self._client = zabbix.get('client', 'pyzabbix')
+			self._max_concurrency = max(1, zabbix.getint('max_concurrency', 8))
+			self._timeout = zabbix.getint('timeout', 30)
+			self._verify = zabbix.getboolean('verify', True)
+			self._api_token = zabbix.get('api_token', '')
+			self._session_file = zabbix.get('session_file', '')
+			id_cache_ttl = zabbix.getint('id_cache_ttl', 300)
+			self._usergroup_ids = IdResolver(lambda names: self._loadIds('usergroup.get', 'usrgrpid', names), id_cache_ttl)
+			self._hostgroup_ids = IdResolver(lambda names: self._loadIds('hostgroup.get', 'groupid', names), id_cache_ttl)
+			#self.ADMIN_GROUPS = zabbix['admin_groups']
+			#self.SUPERADMIN_GROUPS = zabbix['superadmin_groups']
 			self._log.logger.debug("Pegou configuracoes do arquivo conexao.ini.")
 
 	def connect(self):
 		"""
-		Metodo para conexao ao Zabbix via API
+		Metodo para conexao ao Zabbix via API.
+		Com 'api_token' no conexao.ini nao realiza login. Com 'session_file' reaproveita a
+		sessao da execucao anterior enquanto for valida (user.checkAuthentication), realizando
+		login somente quando expirar. A sessao/token reaproveitada utiliza o cliente ZabbixClient,
+		pois o zabbix.api.ZabbixAPI sempre realiza login ao ser instanciado.
+		"""
+		auth = self._api_token or self._loadSession()
+		if auth:
+			self.zapi = ZabbixClient(self._server_url, max_concurrency=self._max_concurrency, auth=auth,
+									timeout=self._timeout, verify=self._verify)
+			if self._api_token or self._checkSession(auth):
+				self._log.logger.debug("Reaproveitou a sessao na API Zabbix.")
+				return
+			self.zapi.close()
+		self._login()
+		if self._session_file:
+			self._saveSession(self.zapi.auth)
+
+	def _login(self):
+		"""
+		Metodo que realiza login na API Zabbix com o cliente configurado.
 		"""
-		self.zapi = ZabbixAPI(url=self._server_url, user=self._user, password=self._password)
+		if self._client == 'async':
+			self.zapi = ZabbixClient(self._server_url, self._user, self._password, self._max_concurrency,
+									timeout=self._timeout, verify=self._verify)
+		else:
+			# O py-zabbix e importado somente quando utilizado
+			from zabbix.api import ZabbixAPI, ZabbixAPIException as PyZabbixAPIException
+			try:
+				with metrics.timer('zabbix.user.login'):
+					self.zapi = ZabbixAPI(url=self._server_url, user=self._user, password=self._password)
+			except PyZabbixAPIException as e:
+				raise ZabbixAPIException(*e.args) from e
+			self._instrument(self.zapi, PyZabbixAPIException)
 		self._log.logger.debug("Conectou na API Zabbix.")
 
+	def _instrument(self, zapi, api_exception):
+		"""
+		Metodo que registra duracao e quantidade de objetos enviados/recebidos de cada chamada
+		da API e converte a excecao do py-zabbix (api_exception) em ZabbixAPIException.
+		As chamadas no formato zapi.objeto.metodo() tambem passam pelo do_request.
+		"""
+		do_request = zapi.do_request
+
+		def timed_request(method, params=None):
+			items_out = len(params) if isinstance(params, list) else 1
+			with metrics.timer('zabbix.' + method, items_out) as timer:
+				try:
+					response = do_request(method, params)
+				except api_exception as e:
+					raise ZabbixAPIException(*e.args) from e
+				result = response.get('result')
+				timer.items_in = len(result) if isinstance(result, list) else 1
+			return response
+
+		zapi.do_request = timed_request
+
+	def _checkSession(self, sessionid):
+		"""
+		Metodo que verifica se a sessao continua valida na API Zabbix (estendendo sua validade).
+
+		Returns
+		-------
+		bool
+			False caso a sessao tenha expirado.
+		"""
+		try:
+			self.zapi.do_request('user.checkAuthentication', {'sessionid': sessionid})
+		except ZabbixAPIException as e:
+			self._log.logger.debug("Sessao armazenada invalida: " + str(e))
+			return False
+		return True
+
+	def _loadSession(self):
+		"""
+		Metodo que le a sessao gravada por uma execucao anterior para o mesmo host e usuario.
+
+		Returns
+		-------
+		str
+			Token da sessao ou None.
+		"""
+		if not self._session_file:
+			return None
+		try:
+			with open(self._session_file, encoding='utf-8') as session_file:
+				session = json.load(session_file)
+		except (OSError, ValueError):
+			return None
+		if session.get('host') != self._server_url or session.get('username') != self._user:
+			return None
+		return session.get('sessionid')
+
+	def _saveSession(self, sessionid):
+		"""
+		Metodo que grava a sessao atual de forma atomica, legivel somente pelo dono do arquivo.
+		"""
+		tmp_file = self._session_file + '.tmp'
+		fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		os.chmod(tmp_file, 0o600)
+		with os.fdopen(fd, 'w', encoding='utf-8') as session_file:
+			json.dump({'host': self._server_url, 'username': self._user, 'sessionid': sessionid}, session_file)
+		os.replace(tmp_file, self._session_file)
+
+	def isConnected(self):
+		"""
+		Metodo que verifica se a sessao na API Zabbix continua valida.
+
+		Returns
+		-------
+		bool
+			False caso a sessao tenha expirado ou a API esteja inacessivel.
+		"""
+		try:
+			self.zapi.do_request('user.get', {'output': ['userid'], 'limit': 1})
+		except Exception as e:
+			self._log.logger.warning('Sessao na API Zabbix perdida: ' + str(e))
+			return False
+		return True
+
 	def disconnect(self):
 		"""
-		Metodo para desconectar o usuario conectado na API Zabbix
+		Metodo para desconectar o usuario conectado na API Zabbix.
+		A sessao nao e encerrada quando reaproveitada entre execucoes ('session_file') ou
+		quando 'api_token' e utilizado.
 		"""
-		self.zapi.user.logout()
+		if not self._api_token and not self._session_file:
+			self.zapi.user.logout()
+		if isinstance(self.zapi, ZabbixClient):
+			self.zapi.close()
 		self._log.logger.debug("Desconectou da API Zabbix.")
 
+	def _requestMany(self, calls):
+		"""
+		Metodo que executa varias chamadas independentes da API: simultaneamente com o
+		cliente assincrono ('client = async' no conexao.ini) ou em sequencia com o py-zabbix.
+
+		Parameters
+		----------
+		calls : list
+			Lista de tuplas (metodo, parametros).
+			Ex: [('usergroup.update', {'usrgrpid': '55', 'userids': ['3']})]
+
+		Returns
+		-------
+		list
+			Respostas JSON-RPC na mesma ordem das chamadas; chamadas com erro retornam a excecao.
+		"""
+		if isinstance(self.zapi, ZabbixClient):
+			return self.zapi.do_requests(calls)
+		responses = []
+		for method, params in calls:
+			try:
+				responses.append(self.zapi.do_request(method, params))
+			except ZabbixAPIException as e:
+				responses.append(e)
+		return responses
+
 	def getUsers(self):
 		"""
 		Metodo que retorna usuarios Zabbix.
@@ -59,7 +225,7 @@ class ZabbixManager:
 		
 		return list_users
 
-	def getUsergroupsList(self, with_members=False):
+	def getUsergroupsList(self, with_members=False, name_search=None):
 		"""
 		Metodo que retorna lista com dicionarios contendo o nome do grupo 
 		de usuario, seu id e lista de membros caso parametro seja True.
@@ -68,6 +234,9 @@ class ZabbixManager:
 		----------
 		with_members : bool
 			Filtro que determina se retorna ou nao os membros dos grupos.
+		name_search : str
+			Trecho do nome dos grupos a serem retornados, filtrado pela API. Opcional.
+			Ex: ' (AD)'
 
 		Returns
 		-------
@@ -79,30 +248,79 @@ class ZabbixManager:
 			Ex:
 			[{'group': 'Zabbix administrators', 'id': '7', 'members': [{'id': '1', 'alias': 'Admin'}, {'id': '3', 'alias': 'thiago'}]}]
 		"""
-		usergroup_list = []
-		query = self.zapi.usergroup.get(selectUsers=1)
-		user_query = self.zapi.user.get(output=['id','alias'])
-		userid_map_alias = {}
+		return [usergroup.toDict() for usergroup in self.getUsergroups(with_members, name_search)]
+
+	def getUsergroups(self, with_members=False, name_search=None, names=None):
+		"""
+		Metodo que retorna os grupos de usuario do Zabbix como registros Group.
+		Os membros (User) sao compartilhados entre os grupos.
 
-		# Monta dicionario chave/valor -> id/alias
-		for user in user_query:
-			userid_map_alias[user['userid']] = user['alias']
+		Parameters
+		----------
+		with_members : bool
+			Filtro que determina se retorna ou nao os membros dos grupos.
+		name_search : str
+			Trecho do nome dos grupos a serem retornados, filtrado pela API. Opcional.
+			Ex: ' (AD)'
+		names : list
+			Nomes exatos dos grupos a serem retornados. Opcional.
+			Ex: ['Your Group (AD)']
+
+		Returns
+		-------
+		list
+			Ex:
+			[Group('Zabbix administrators', '7', [User('Admin', None, '1')])]
+		"""
+		params = {'output': ['usrgrpid', 'name']}
+		if name_search:
+			params['search'] = {'name': name_search}
+		if names is not None:
+			if not names:
+				return []
+			params['filter'] = {'name': list(names)}
+		if with_members:
+			params['selectUsers'] = ['userid']
+		query = self.zapi.usergroup.get(**params)
+
+		# Monta dicionario userid -> User somente dos membros dos grupos retornados
+		users = {}
+		if with_members and query:
+			user_query = self.zapi.user.get(output=['userid', 'alias'],
+											usrgrpids=[usergroup['usrgrpid'] for usergroup in query])
+			for user in user_query:
+				users[user['userid']] = User(user['alias'], id=user['userid'])
 
+		usergroup_list = []
 		for usergroup in query:
-			group_dic = {}
-			group_dic['group'] = usergroup['name']
-			group_dic['id'] = usergroup['usrgrpid']
-			member_list = []
-			if with_members:
-				for member in usergroup['users']:
-					member_dic = {}
-					member_dic['id'] = member['userid']
-					member_dic['alias'] = userid_map_alias[member['userid']]
-					member_list.append(member_dic)
-				group_dic['members'] = member_list
-			usergroup_list.append(group_dic)
+			members = [users[member['userid']] for member in usergroup['users']] if with_members else None
+			usergroup_list.append(Group(usergroup['name'], usergroup['usrgrpid'], members))
+		self._usergroup_ids.update(dict((usergroup.name, usergroup.id) for usergroup in usergroup_list))
 		return usergroup_list
 
+	def getUsersByAlias(self, aliases):
+		"""
+		Metodo que retorna o ID dos usuarios Zabbix com os aliases informados.
+
+		Parameters
+		----------
+		aliases : list
+			Aliases a serem procurados.
+			Ex: ['thiago', 'fulano']
+
+		Returns
+		-------
+		dict
+			Dicionario alias -> ID dos usuarios existentes.
+			Ex:
+			{'thiago': '3'}
+		"""
+		users = {}
+		if aliases:
+			for user in self.zapi.user.get(output=['userid', 'alias'], filter={'alias': list(aliases)}):
+				users[user['alias']] = user['userid']
+		return users
+
 	def getHostgroupsList(self):
 		"""
 		Metodo que retorna lista com nomes dos grupos de host do Zabbix.
@@ -115,16 +333,42 @@ class ZabbixManager:
 			['Templates', 'Linux Servers', 'Datacenter/Zabbix servers']
 		"""
 		hostgroup_list = []
-		query = self.zapi.hostgroup.get()
+		query = self.zapi.hostgroup.get(output=['name'])
 
 		for hostgroup in query:
 			hostgroup_list.append(hostgroup['name'])
 
 		return hostgroup_list
 
+	def _loadIds(self, method, idkey, names=None):
+		"""
+		Metodo que consulta, em uma unica chamada da API, os IDs dos objetos com os nomes informados.
+
+		Parameters
+		----------
+		method : str
+			Ex: 'usergroup.get'
+		idkey : str
+			Ex: 'usrgrpid'
+		names : list
+			Nomes dos objetos. Opcional (None retorna todos os objetos).
+
+		Returns
+		-------
+		dict
+			Dicionario nome -> ID dos objetos encontrados.
+			Ex:
+			{'Your Group': '128'}
+		"""
+		params = {'output': [idkey, 'name']}
+		if names is not None:
+			params['filter'] = {'name': list(names)}
+		return dict((item['name'], item[idkey]) for item in self.zapi.do_request(method, params)['result'])
+
 	def getHostgroupId(self, hostgroup_name):
 		"""
 		Metodo que recebe nome de um grupo de host e retorna o seu ID.
+		O ID e memorizado por id_cache_ttl segundos.
 
 		Parameters
 		----------
@@ -138,21 +382,20 @@ class ZabbixManager:
 			ID do grupo de host.
 			Ex:
 			1
+		bool
+			False caso nao encontre o grupo de host.
 		"""
-		#result = 'ID nao encontrado.'
+		grpid = False
 		if hostgroup_name:
-			result = self.zapi.do_request('hostgroup.get',
-										{
-											'filter': {
-												'name': hostgroup_name
-											}
-										})
-
-		return result['result'][0]['groupid']
+			grpid = self._hostgroup_ids.get(hostgroup_name) or False
+			if not grpid:
+				self._log.logger.debug("Nao encontrou ID do hostgroup " + hostgroup_name)
+		return grpid
 
 	def getUsergroupId(self, usergroup_name):
 		"""
 		Metodo que recebe nome de um grupo de usuario e retorna o seu ID.
+		O ID e memorizado por id_cache_ttl segundos.
 
 		Parameters
 		----------
@@ -166,21 +409,78 @@ class ZabbixManager:
 			ID do grupo de usuario.
 			Ex:
 			128
+		bool
+			False caso nao encontre o grupo de usuario.
 		"""
-		#result = 'ID nao encontrado.'
+		grpid = False
 		if usergroup_name:
-			result = self.zapi.do_request('usergroup.get',
-										{
-											'filter': {
-												'name': usergroup_name
-											}
-										})
-			grpid = False
-			try:
-				grpid = result['result'][0]['usrgrpid']
-			except IndexError:
+			grpid = self._usergroup_ids.get(usergroup_name) or False
+			if not grpid:
 				self._log.logger.debug("Nao encontrou ID do usergroup " + usergroup_name)
-			return grpid
+		return grpid
+
+	def resolveUsergroupIds(self, usergroup_names):
+		"""
+		Metodo que retorna os IDs de varios grupos de usuario, consultando em uma unica
+		chamada da API somente os nomes que nao estao memorizados.
+
+		Parameters
+		----------
+		usergroup_names : list
+			Ex: ['Your Group', 'Users from AD']
+
+		Returns
+		-------
+		dict
+			Dicionario nome -> ID dos grupos de usuario existentes.
+			Ex:
+			{'Users from AD': '13'}
+		"""
+		return self._usergroup_ids.resolve(usergroup_names)
+
+	def _createMany(self, method, objects, ids_key, label):
+		"""
+		Metodo que cria objetos no Zabbix enviando ate batch_size objetos por chamada da API.
+		Caso um lote falhe, os objetos do lote sao criados individualmente para identificar
+		e registrar no log quais falharam, sem interromper a criacao dos demais.
+
+		Parameters
+		----------
+		method : str
+			Metodo da API a ser chamado.
+			Ex: 'usergroup.create'
+		objects : list
+			Lista de objetos a serem criados.
+			Ex: [{'name': 'Your Group'}]
+		ids_key : str
+			Chave do resultado da API contendo os IDs criados.
+			Ex: 'usrgrpids'
+		label : function
+			Funcao que retorna o nome de um objeto para uso no log.
+
+		Returns
+		-------
+		list
+			Lista com os IDs criados na mesma ordem dos objetos, com None nos que falharam.
+			Ex:
+			['127', None, '128']
+		"""
+		chunks = [objects[start:start + self._batch_size] for start in range(0, len(objects), self._batch_size)]
+		ids = []
+		for chunk, response in zip(chunks, self._requestMany([(method, chunk) for chunk in chunks])):
+			if not isinstance(response, Exception):
+				ids.extend(response['result'][ids_key])
+				self._log.logger.debug('%s criou %d objeto(s) em uma chamada.' % (method, len(chunk)))
+				continue
+
+			self._log.logger.warning('%s falhou para o lote (%s), criando individualmente.' % (method, response))
+			for obj, item_response in zip(chunk, self._requestMany([(method, [obj]) for obj in chunk])):
+				if isinstance(item_response, Exception):
+					ids.append(None)
+					self._log.logger.error('Falha ao criar ' + label(obj) + ': ' + str(item_response))
+				else:
+					ids.extend(item_response['result'][ids_key])
+		return ids
 
 	def createUsergroups(self, usergroup_list):
 		"""
@@ -192,18 +492,24 @@ class ZabbixManager:
 			Lista contendo os nomes dos grupos a serem criados no Zabbix.
 			Ex:
 			['Your Group']
+
+		Returns
+		-------
+		dict
+			Dicionario nome -> ID dos grupos de usuario criados.
+			Ex:
+			{'Your Group': '127'}
 		"""
+		created = {}
 		if usergroup_list:
-			for usergroup in usergroup_list:
-				self.zapi.do_request('usergroup.create',
-									{
-										'name': usergroup#,
-										#'rights': {
-										#	'permission': 2,
-										#	'id': self.getHostgroupId(usergroup)
-										#}
-									})
-				self._log.logger.info('Criou o usergroup ' + usergroup)
+			objects = [{'name': usergroup} for usergroup in usergroup_list]
+			ids = self._createMany('usergroup.create', objects, 'usrgrpids', lambda obj: 'usergroup ' + obj['name'])
+			for usergroup, usrgrpid in zip(usergroup_list, ids):
+				if usrgrpid:
+					created[usergroup] = usrgrpid
+					self._log.logger.info('Criou o usergroup ' + usergroup)
+			self._usergroup_ids.update(created)
+		return created
 
 	def createHostgroups(self, hostgroup_list):
 		"""
@@ -215,11 +521,24 @@ class ZabbixManager:
 			Lista contendo nome dos grupos de host a serem criados.
 			Ex:
 			['Your Group']
+
+		Returns
+		-------
+		dict
+			Dicionario nome -> ID dos grupos de host criados.
+			Ex:
+			{'Your Group': '21'}
 		"""
+		created = {}
 		if hostgroup_list:
-			for hostgroup in hostgroup_list:
-				self.zapi.hostgroup.create(name=hostgroup)
-				self._log.logger.info('Criou o hostgroup ' + hostgroup)
+			objects = [{'name': hostgroup} for hostgroup in hostgroup_list]
+			ids = self._createMany('hostgroup.create', objects, 'groupids', lambda obj: 'hostgroup ' + obj['name'])
+			for hostgroup, groupid in zip(hostgroup_list, ids):
+				if groupid:
+					created[hostgroup] = groupid
+					self._log.logger.info('Criou o hostgroup ' + hostgroup)
+			self._hostgroup_ids.update(created)
+		return created
 
 	def createUsers(self, user_list):
 		"""
@@ -232,59 +551,93 @@ class ZabbixManager:
 			Ex:
 			[{'alias': 'fulano', 'groups': [{'usrgrpid': '127'}], 'name': 'FULANO DE ARAUJO'}, 
 			{'alias': 'ciclano', 'groups': [{'usrgrpid': '134'}], 'name': 'CICLANO OLIVEIRA'}]
+
+		Returns
+		-------
+		dict
+			Dicionario alias -> userid dos usuarios criados.
+			Ex:
+			{'fulano': '1463', 'ciclano': '1464'}
 		"""
 		allchar = string.ascii_letters + string.punctuation + string.digits
+		created = {}
 		if user_list:
 			default_group = {}
 			default_group['usrgrpid'] = self.getUsergroupId(self.DEFAULT_GROUP)
 			if not default_group['usrgrpid']:
-				self.createUsergroups([self.DEFAULT_GROUP])
-				default_group['usrgrpid'] = self.getUsergroupId(self.DEFAULT_GROUP)
+				default_group['usrgrpid'] = self.createUsergroups([self.DEFAULT_GROUP]).get(self.DEFAULT_GROUP)
 
+			objects = []
 			for user in user_list:
 				user['groups'].append(default_group)
-				result = self.zapi.user.create(alias=user['alias'],
-											name=user['name'],
-											passwd="".join(choice(allchar) for x in range(randint(8, 12))),
-											usrgrps=user['groups'],
-											refresh='60s',
-											rows_per_page='100',
-											lang='pt_BR'
-											)
-				self._log.logger.info('Criou o usuario ' + user['alias'] + ' nos usergroups ' + str(user['groups']))
-				self._log.logger.debug(result)
+				objects.append({'alias': user['alias'],
+								'name': user['name'],
+								'passwd': "".join(choice(allchar) for x in range(randint(8, 12))),
+								'usrgrps': user['groups'],
+								'refresh': '60s',
+								'rows_per_page': '100',
+								'lang': 'pt_BR'
+								})
+			ids = self._createMany('user.create', objects, 'userids', lambda obj: 'usuario ' + obj['alias'])
+			for user, userid in zip(user_list, ids):
+				if userid:
+					created[user['alias']] = userid
+					self._log.logger.info('Criou o usuario ' + user['alias'] + ' nos usergroups ' + str(user['groups']))
 		else:
 			self._log.logger.info('Nenhum usuario criado.')
+		return created
 
-	def updateUsers(self, user_list):
+	def updateUsers(self, user_list, usergroups=None):
 		"""
 		Metodo que atualiza usuarios no Zabbix ajustando os usergroups nos quais fazem parte.
+		Os membros atuais sao obtidos de usergroups (retorno de getUsergroupsList(True)) quando
+		informado; os grupos ausentes ou divergentes do plano (usuarios a adicionar que ja sao
+		membros ou a remover que nao sao) sao relidos do Zabbix em uma unica consulta.
 
 		Parameters
 		----------
 		user_list : list
-			Lista contendo dicionario com lista de usergroups a serem atualizados,
+			Lista de Membership (ou dicionarios) com os usergroups a serem atualizados,
 			contendo os usuarios a serem adicionados e removidos dos grupos.
 			Ex:
 			[{'group': 'Your Group', 'id': '55', 'add': ['8'], 'remove': []}]
+		usergroups : list
+			Grupos de usuario (Group ou dicionarios) e membros ja conhecidos. Opcional.
+			Ex:
+			[{'group': 'Your Group', 'id': '55', 'members': [{'id': '3', 'alias': 'thiago'}]}]
 		"""
 		if user_list:
-			for item in user_list:
-				zb_usergroup = self.zapi.usergroup.get(selectUsers=1, filter={'name' : item['group']})
-
-				users_list = []
-
-				for user in zb_usergroup[0]['users']:
-					users_list.append(user['userid'])
+			user_list = asRecords(Membership, user_list)
+			known_members = {}
+			for usergroup in asRecords(Group, usergroups):
+				known_members[usergroup.id] = [member.id for member in usergroup.members]
 
-				if item['add']:
-					users_list.extend(item['add'])
+			drifted = []
+			for item in user_list:
+				members = known_members.get(item.id)
+				if members is None or set(item.add) & set(members) or set(item.remove) - set(members):
+					drifted.append(item.id)
 
-				if item['remove']:
-					users_list = [n for n in users_list if n not in item['remove']]
+			if drifted:
+				self._log.logger.debug('Relendo membros dos usergroups ' + str(drifted))
+				for usergroup in self.zapi.usergroup.get(output=['usrgrpid'], selectUsers=['userid'], usrgrpids=drifted):
+					known_members[usergroup['usrgrpid']] = [user['userid'] for user in usergroup['users']]
 
-				self.zapi.usergroup.update(usrgrpid=item['id'], userids=users_list)
-				self._log.logger.info('Atualizou o usergroup ' + item['group'] + ' com os userids ' + str(users_list))
+			calls = []
+			for item in user_list:
+				remove = set(item.remove)
+				users_list = [n for n in dict.fromkeys(known_members.get(item.id, []) + item.add) if n not in remove]
+				calls.append(('usergroup.update', {'usrgrpid': item.id, 'userids': users_list}))
+
+			errors = []
+			for item, call, response in zip(user_list, calls, self._requestMany(calls)):
+				if isinstance(response, Exception):
+					errors.append(response)
+					self._log.logger.error('Falha ao atualizar o usergroup ' + item.group + ': ' + str(response))
+				else:
+					self._log.logger.info('Atualizou o usergroup ' + item.group + ' com os userids ' + str(call[1]['userids']))
+			if errors:
+				raise errors[0]
 		else:
 			self._log.logger.info('Nenhum usergroup atualizado.')
 		
@@ -389,3 +742,139 @@ class ZabbixManager:
 										dependsOnServiceid=svc_trigger,
 										soft=1)
 			self._log.logger.info('Adicionou dependencia "' + name + '". ParentID: ' + parent + '. ServiceID vinculado: ' + svc_trigger)
+
+	def getServiceIndex(self):
+		"""
+		Metodo que carrega toda a arvore de SLAs em uma unica chamada da API.
+
+		Returns
+		-------
+		dict
+			Indice da arvore: 'ids' com (nome, ID do pai) -> ID do servico (ID do pai None
+			para os servicos raiz) e 'dependencies' com ID do servico -> conjunto de IDs dos
+			servicos dos quais ele depende (filhos e dependencias soft).
+			Ex:
+			{'ids': {('Servicos', None): '1', ('Site', '1'): '2'}, 'dependencies': {'1': {'2'}, '2': set()}}
+		"""
+		ids = {}
+		dependencies = {}
+		for service in self.zapi.service.get(output=['serviceid', 'name'],
+											selectParent=['serviceid'],
+											selectDependencies=['serviceid']):
+			parent = service.get('parent') or None
+			ids[(service['name'], parent['serviceid'] if parent else None)] = service['serviceid']
+			dependencies[service['serviceid']] = set(dependency['serviceid'] for dependency in service.get('dependencies') or ())
+		return {'ids': ids, 'dependencies': dependencies}
+
+	def syncServiceTree(self, tree, parent=None):
+		"""
+		Metodo que cria na arvore de SLAs os servicos e dependencias soft que ainda nao existem.
+		A arvore atual e carregada uma unica vez (getServiceIndex); os servicos faltantes sao
+		criados nivel a nivel em lotes de batch_size e as dependencias em lotes de
+		service.adddependencies.
+
+		Parameters
+		----------
+		tree : list
+			Servicos de primeiro nivel. Cada servico possui 'name' e, opcionalmente,
+			'triggerid', 'children' (servicos filhos no mesmo formato) e 'dependencies'
+			(caminhos, a partir de 'parent', dos servicos dos quais ele tem dependencia soft).
+			Ex:
+			[{'name': 'Site', 'children': [{'name': 'Web', 'triggerid': '13550'},
+			{'name': 'Banco', 'triggerid': '13551', 'dependencies': [['Infra', 'Storage']]}]}]
+		parent : str
+			ID do servico pai no qual a arvore sera criada. Opcional.
+
+		Returns
+		-------
+		dict
+			Caminho (tupla de nomes) -> ID de cada servico da arvore. Servicos que falharam
+			(e seus filhos) nao sao retornados.
+			Ex:
+			{('Site',): '2', ('Site', 'Web'): '3', ('Site', 'Banco'): '4'}
+		"""
+		index = self.getServiceIndex()
+		ids = index['ids']
+		paths = {}
+		created = 0
+		level = [(node, (), parent) for node in tree]
+		while level:
+			missing = []
+			next_level = []
+			for node, path, parentid in level:
+				path = path + (node['name'],)
+				serviceid = ids.get((node['name'], parentid))
+				if serviceid is None:
+					missing.append((node, path, parentid))
+					continue
+				paths[path] = serviceid
+				next_level.extend((child, path, serviceid) for child in node.get('children', ()))
+
+			services = []
+			for node, path, parentid in missing:
+				service = {'name': node['name'], 'algorithm': 1, 'showsla': 1, 'goodsla': 97, 'sortorder': 0}
+				if parentid:
+					service['parentid'] = parentid
+				if node.get('triggerid'):
+					service['triggerid'] = node['triggerid']
+				services.append(service)
+			serviceids = self._createMany('service.create', services, 'serviceids',
+										lambda service: "o servico '" + service['name'] + "'")
+			for (node, path, parentid), serviceid in zip(missing, serviceids):
+				if serviceid is None:
+					continue
+				created += 1
+				ids[(node['name'], parentid)] = serviceid
+				index['dependencies'].setdefault(serviceid, set())
+				if parentid:
+					index['dependencies'].setdefault(parentid, set()).add(serviceid)
+				paths[path] = serviceid
+				next_level.extend((child, path, serviceid) for child in node.get('children', ()))
+			level = next_level
+
+		links = self._missingServiceDependencies(tree, parent, paths, index)
+		chunks = [links[start:start + self._batch_size] for start in range(0, len(links), self._batch_size)]
+		added = 0
+		for chunk, response in zip(chunks, self._requestMany([('service.adddependencies', chunk) for chunk in chunks])):
+			if isinstance(response, Exception):
+				self._log.logger.error('Falha ao adicionar %d dependencia(s) soft: %s' % (len(chunk), response))
+				continue
+			added += len(chunk)
+			self._log.logger.debug('service.adddependencies adicionou %d dependencia(s) em uma chamada.' % len(chunk))
+		self._log.logger.info('Arvore de SLAs sincronizada: %d servico(s) e %d dependencia(s) soft criados.'
+							% (created, added))
+		return paths
+
+	def _missingServiceDependencies(self, tree, parent, paths, index):
+		"""
+		Metodo que retorna as dependencias soft da arvore que ainda nao existem, no formato
+		de service.adddependencies.
+		"""
+		def resolve(path):
+			serviceid = parent
+			for name in path:
+				serviceid = index['ids'].get((name, serviceid))
+				if serviceid is None:
+					return None
+			return serviceid
+
+		links = []
+		pending = set()
+		stack = [(node, ()) for node in tree]
+		while stack:
+			node, path = stack.pop()
+			path = path + (node['name'],)
+			stack.extend((child, path) for child in node.get('children', ()))
+			serviceid = paths.get(path)
+			if serviceid is None:
+				continue
+			for dependency in node.get('dependencies', ()):
+				depends_on = resolve(dependency)
+				if depends_on is None:
+					self._log.logger.error('Servico ' + ' / '.join(dependency) + ' nao encontrado para a dependencia de ' + ' / '.join(path) + '.')
+					continue
+				if depends_on in index['dependencies'].get(serviceid, ()) or (serviceid, depends_on) in pending:
+					continue
+				pending.add((serviceid, depends_on))
+				links.append({'serviceid': serviceid, 'dependsOnServiceid': depends_on, 'soft': 1})
+		return links
@@ -0,0 +1,167 @@
+"""
+Benchmark offline da sincronizacao AD -> Zabbix.
+
+Executa o fluxo do sync_users contra um AD e uma API Zabbix sinteticos (FakeBackends),
+medindo por fase o tempo, a quantidade de consultas LDAP e de chamadas da API, alem
+do pico de memoria de cada execucao.
+
+Uso:
+	python3 benchmark.py --sizes 1000 10000 100000 --groups 300
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from FakeBackends import CONFIG, FakeDirectory, FakeZabbixServer, installed
+from Logging import shutdownLogging
+
+# Os modulos da sincronizacao sao importados apos mudar para o diretorio temporario
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Execucoes medidas em sequencia: carga inicial, nova execucao sem alteracoes
+# no AD e reconciliacao completa (equivalente ao --rebuild-state)
+RUNS = ['inicial', 'sem alteracoes', 'reconstrucao']
+
+
+class PhaseRecorder:
+	"""
+	Classe que mede tempo, consultas LDAP e chamadas da API de cada fase.
+	"""
+
+	def __init__(self, directory, server):
+		self._directory = directory
+		self._server = server
+		self.phases = []
+
+	def _counters(self):
+		return sum(self._directory.searches.values()), sum(self._server.calls.values())
+
+	def measure(self, name, function, *args, **kwargs):
+		"""
+		Metodo que executa a funcao registrando as metricas da fase.
+		"""
+		searches, calls = self._counters()
+		start = time.perf_counter()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			elapsed = time.perf_counter() - start
+			end_searches, end_calls = self._counters()
+			self.phases.append({'phase': name, 'seconds': elapsed,
+								'ldap_searches': end_searches - searches, 'api_calls': end_calls - calls})
+
+	def wrap(self, owner, attr, name):
+		"""
+		Metodo que substitui owner.attr por uma versao medida como a fase 'name'.
+		"""
+		function = getattr(owner, attr)
+		def measured(*args, **kwargs):
+			return self.measure(name, function, *args, **kwargs)
+		setattr(owner, attr, measured)
+
+
+def runScenario(users, args):
+	"""
+	Metodo que executa as sincronizacoes de um cenario com a quantidade de usuarios informada.
+
+	Returns
+	-------
+	dict
+		Resultado do cenario com as metricas de cada execucao e fase.
+	"""
+	directory = FakeDirectory(users=users, groups=args.groups, nesting=args.nesting,
+							memberships=args.memberships, seed=args.seed)
+	server = FakeZabbixServer(usergroups=args.zabbix_groups, latency=args.latency / 1000.0)
+	cwd = os.getcwd()
+	workdir = tempfile.TemporaryDirectory()
+	os.chdir(workdir.name)
+	try:
+		with open('conexao.ini', 'w', encoding='utf-8') as config:
+			config.write(CONFIG.format(users_ou=directory.users_ou, groups_ou=directory.groups_ou,
+										mode=args.mode, page_size=args.page_size, pool_size=args.pool_size,
+										batch_size=args.batch_size))
+		with installed(directory, server):
+			import sync_users
+			from StateStore import StateStore
+
+			result = {'users': users, 'groups': args.groups, 'runs': []}
+			tracemalloc.start()
+			for run in RUNS:
+				recorder = PhaseRecorder(directory, server)
+				saved = dict((attr, getattr(sync_users, attr)) for attr in ('buildPlan', 'applyUsergroups', 'applyUsers', 'applyMemberships'))
+				saved_ad = sync_users.AdManager.getGroupMembersIndex
+				recorder.wrap(sync_users.AdManager, 'getGroupMembersIndex', 'leitura AD')
+				recorder.wrap(sync_users, 'buildPlan', 'plano')
+				recorder.wrap(sync_users, 'applyUsergroups', 'grupos de usuario')
+				recorder.wrap(sync_users, 'applyUsers', 'usuarios')
+				recorder.wrap(sync_users, 'applyMemberships', 'membros')
+				tracemalloc.reset_peak()
+				start = time.perf_counter()
+				try:
+					store = StateStore('sync_state.db')
+					if run == 'reconstrucao':
+						store.clear()
+					recorder.measure('conexao', sync_users.connect)
+					recorder.measure('runSync (total)', sync_users.runSync, store)
+					recorder.measure('desconexao', sync_users.disconnect)
+					store.close()
+				finally:
+					sync_users.AdManager.getGroupMembersIndex = saved_ad
+					for attr, function in saved.items():
+						setattr(sync_users, attr, function)
+				result['runs'].append({'run': run, 'seconds': time.perf_counter() - start,
+									'peak_memory_mb': tracemalloc.get_traced_memory()[1] / 1048576.0,
+									'phases': recorder.phases})
+			tracemalloc.stop()
+			result['zabbix_users'] = len(server.users)
+			return result
+	finally:
+		# Os logs foram gravados no diretorio temporario
+		shutdownLogging(os.path.join(workdir.name, 'python.log'))
+		os.chdir(cwd)
+		workdir.cleanup()
+
+
+def printResult(result):
+	"""
+	Metodo que imprime o resultado de um cenario em formato de tabela.
+	"""
+	print('\n== %d usuarios, %d grupos (%d usuarios no Zabbix ao final) ==' % (result['users'], result['groups'], result['zabbix_users']))
+	print('%-16s %-20s %10s %10s %10s %10s' % ('execucao', 'fase', 'tempo(s)', 'LDAP', 'API', 'pico(MB)'))
+	for run in result['runs']:
+		for phase in run['phases']:
+			print('%-16s %-20s %10.3f %10d %10d %10s' % (run['run'], phase['phase'], phase['seconds'],
+															phase['ldap_searches'], phase['api_calls'], ''))
+		print('%-16s %-20s %10.3f %10s %10s %10.1f' % (run['run'], 'TOTAL', run['seconds'], '', '', run['peak_memory_mb']))
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Benchmark offline da sincronizacao AD -> Zabbix.')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='quantidades de usuarios')
+	parser.add_argument('--groups', type=int, default=300, help='grupos monitorados no AD')
+	parser.add_argument('--nesting', type=int, default=2, help='profundidade de grupos aninhados')
+	parser.add_argument('--memberships', type=int, default=3, help='grupos diretos por usuario')
+	parser.add_argument('--zabbix-groups', type=int, default=1000, help='usergroups nao relacionados no Zabbix')
+	parser.add_argument('--mode', default='bulk', choices=['bulk', 'per_group'], help='membership_mode do AD')
+	parser.add_argument('--page-size', type=int, default=1000)
+	parser.add_argument('--pool-size', type=int, default=1)
+	parser.add_argument('--batch-size', type=int, default=100)
+	parser.add_argument('--latency', type=float, default=0.0, help='latencia simulada por chamada da API (ms)')
+	parser.add_argument('--seed', type=int, default=1)
+	parser.add_argument('--json', help='grava o resultado em JSON no arquivo informado')
+	args = parser.parse_args()
+
+	results = []
+	for size in args.sizes:
+		result = runScenario(size, args)
+		printResult(result)
+		results.append(result)
+
+	if args.json:
+		with open(args.json, 'w', encoding='utf-8') as output:
+			json.dump(results, output, indent=2)
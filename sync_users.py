@@ -1,9 +1,49 @@
 from AdManager import AdManager
+from AdSources import createAdManager
 from ZabbixManager import ZabbixManager
-from collections import Counter
+from Logging import LogManager, configureLogging
+from Snapshot import SyncSnapshot
+from StateStore import StateStore
+from Metrics import metrics
+from Records import User, Group, Membership, asRecords, iterGroups
+from Daemon import SyncDaemon
+from Config import getConfig, ConfigError
+import argparse
+import json
 
 _dic_users_ad = None
 zm = am = None
+snapshot = None
+_log = None
+
+def getLog():
+	"""
+	Metodo que retorna o log do sync_users, criado somente na primeira utilizacao com o
+	nivel informado na secao [sync] do conexao.ini (log_level).
+
+	Returns
+	-------
+	LogManager
+	"""
+	global _log
+	if _log is None:
+		_log = LogManager(getConfig().parser.get('sync', 'log_level', fallback='INFO'), 'sync_users')
+	return _log
+
+def getSnapshot():
+	"""
+	Metodo que retorna o snapshot da execucao atual, criando um novo caso
+	ainda nao exista ou caso zm/am tenham sido substituidos.
+
+	Returns
+	-------
+	SyncSnapshot
+		Snapshot com as leituras memorizadas do AD e do Zabbix.
+	"""
+	global snapshot
+	if snapshot is None or snapshot.zm is not zm or snapshot.am is not am:
+		snapshot = SyncSnapshot(zm, am)
+	return snapshot
 
 def zabbixUsergroupsToBeCreated():
 	"""
@@ -18,16 +58,15 @@ def zabbixUsergroupsToBeCreated():
 		['Your Group']
 	"""
 	group_list = []
-	zb_groups = zm.getUsergroupsList()
-	group_name_zb_list = []
+	zb_groups = getSnapshot().getZabbixUsergroups()
+	group_name_zb_list = set()
 	
-	#converte lista de dicionarios {name: value, id: value} do zabbix
-	#para lista contendo somente nomes do Usergroup
+	#converte lista de grupos do zabbix para conjunto contendo somente nomes do Usergroup
 	for item in zb_groups:
-		group_name_zb_list.append(item['group'])
+		group_name_zb_list.add(item.name)
 
-	for ad_group in am.getGroupsList(am.FILTER_GROUP_SEARCH_AD):
-		zb_group = AdManager().convertAdGroupNameToZabbix(ad_group)
+	for ad_group in getSnapshot().getAdGroups():
+		zb_group = am.convertAdGroupNameToZabbix(ad_group)
 
 		if zb_group not in group_name_zb_list:
 			group_list.append(zb_group)
@@ -47,17 +86,116 @@ def zabbixHostgroupsToBeCreated():
 		['Your Group']
 	"""
 	hostgroup_list = []
-	zb_hostgroups = zm.getHostgroupsList()
+	zb_hostgroups = set(getSnapshot().getZabbixHostgroups())
 			
-	for ad_group in am.getGroupsList(am.FILTER_GROUP_SEARCH_AD):
-		ad_hostgroup = AdManager().convertAdGroupNameToZabbix(ad_group)
+	for ad_group in getSnapshot().getAdGroups():
+		ad_hostgroup = am.convertAdGroupNameToZabbix(ad_group)
 
 		if ad_hostgroup not in zb_hostgroups:
 			hostgroup_list.append(ad_hostgroup)
 		
 	return hostgroup_list
 
-def getUsersListToBeCreatedZabbix(zabbix_list, ad_list):
+def getPlanUsersToBeCreated(zabbix_list, ad_list, zabbix_users=None):
+	"""
+	Metodo que retorna, no formato do plano (buildPlan), os usuarios que existem no AD e que
+	ainda nao existem no Zabbix, com os nomes dos grupos dos quais devem ser membros
+	(inclusive os grupos que ainda serao criados no Zabbix).
+
+	Parameters
+	----------
+	zabbix_list : list
+		Ex:
+		[{'group': 'Zabbix administrators', 'id': '7', 'members': [{'id': '1', 'alias': 'Admin'}, {'id': '3', 'alias': 'thiago'}]}]
+	ad_list : list ou MembershipIndex
+		Ex:
+		[{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}, 
+		{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}]
+	zabbix_users : dict
+		Usuarios existentes no Zabbix (alias -> ID). Opcional, por padrao considera
+		somente os membros dos grupos em zabbix_list.
+		Ex:
+		{'thiago': '3'}
+
+	Returns
+	-------
+	list
+		Lista contendo dicionarios de usuarios que existem no AD nao existem no Zabbix.
+		Ex:
+		[{'alias': 'fulano', 'groups': ['Acesso de leitura'], 'name': 'FULANO OLIVEIRA'}]
+	"""
+	zb_users = set(zabbix_users or ())
+	for zb_item in asRecords(Group, zabbix_list):
+		zb_users.update(zb_item.aliases())
+
+	# Indice alias -> usuario a ser criado, em uma unica passada pelos grupos do AD
+	tobe_created = {}
+	for ad_item in iterGroups(ad_list):
+		seen = set()
+		for member in ad_item.members:
+			alias = member.alias
+			if alias in zb_users or alias in seen:
+				continue
+			seen.add(alias)
+			tobe_user = tobe_created.get(alias)
+			if tobe_user is None:
+				tobe_user = tobe_created[alias] = {'alias': alias, 'groups': []}
+			tobe_user['name'] = member.name
+			tobe_user['groups'].append(ad_item.name)
+
+	return list(tobe_created.values())
+
+
+def getPlanMemberships(zabbix_list, ad_list, zabbix_users=None):
+	"""
+	Metodo que retorna, no formato do plano (buildPlan), os grupos com os aliases que devem ser
+	adicionados e removidos no Zabbix. Os grupos que ainda nao existem no Zabbix recebem os
+	usuarios ja existentes; os usuarios a serem criados (getPlanUsersToBeCreated) nao sao incluidos.
+
+	Parameters
+	----------
+	zabbix_list : list
+		Ex:
+		[{'group': 'Zabbix administrators', 'id': '7', 'members': [{'id': '1', 'alias': 'Admin'}, {'id': '3', 'alias': 'thiago'}]}]
+	ad_list : list ou MembershipIndex
+		Ex:
+		[{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}, 
+		{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}]
+	zabbix_users : dict
+		Usuarios existentes no Zabbix (alias -> ID), inclusive os que nao sao membros
+		dos grupos em zabbix_list. Opcional.
+		Ex:
+		{'thiago': '3'}
+
+	Returns
+	-------
+	list
+		Lista contendo dicionarios de grupos e aliases a serem adicionados e removidos.
+		Ex:
+		[{'group': 'Acesso de leitura', 'add': ['fulano'], 'remove': []}]
+	"""
+	# Indices de usuarios existentes e nome do grupo -> membros, montados uma unica vez
+	zb_users = set(zabbix_users or ())
+	zb_members = {}
+	for zb_item in asRecords(Group, zabbix_list):
+		zb_members[zb_item.name] = [member.alias for member in zb_item.members]
+		zb_users.update(zb_members[zb_item.name])
+
+	update_list = []
+	for ad_item in iterGroups(ad_list):
+		ad_members = dict.fromkeys(member.alias for member in ad_item.members)
+		current = zb_members.get(ad_item.name, [])
+		current_set = set(current)
+
+		add = [alias for alias in ad_members if alias not in current_set and alias in zb_users]
+		remove = [alias for alias in current if alias not in ad_members]
+		if add or remove:
+			update_list.append({'group': ad_item.name, 'add': add, 'remove': remove})
+
+	return update_list
+
+
+def getUsersListToBeCreatedZabbix(zabbix_list, ad_list, zabbix_users=None):
 	"""
 	Metodo que retorna lista de dicionarios contendo usuarios que existem no AD
 	e que ainda nao existem no Zabbix.
@@ -71,6 +209,11 @@ def getUsersListToBeCreatedZabbix(zabbix_list, ad_list):
 		Ex:
 		[{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}, 
 		{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}]
+	zabbix_users : dict
+		Usuarios existentes no Zabbix (alias -> ID). Opcional, por padrao considera
+		somente os membros dos grupos em zabbix_list.
+		Ex:
+		{'thiago': '3'}
 
 	Returns
 	-------
@@ -80,48 +223,16 @@ def getUsersListToBeCreatedZabbix(zabbix_list, ad_list):
 		[{'alias': 'ciclano', 'groups': [{'usrgrpid': '127'}], 'name': 'CICLANO PIRES'}, 
 		{'alias': 'robson', 'groups': [{'usrgrpid': '134'}], 'name': 'ROBSON RANDOM'}]
 	"""
-	zb_users = set()
-	for item in zabbix_list:
-		for member in item['members']:
-			zb_users.add(member['alias'])
-
-	zb_groupid_map = {}
-	for ad_item in ad_list:
-		ad_group = ad_item['group']
-		for zb_item in zabbix_list:
-			zb_group = zb_item['group']
-			if zb_group == ad_group:
-				zb_groupid_map[ad_group] = zb_item['id']
-
-	alias_list = set()
-	for ad_item in ad_list:
-		ad_group = ad_item['group']
-		for member_ad in ad_item['members']:
-			for zb_item in zabbix_list:
-				zb_group = zb_item['group']
-				if member_ad['alias'] not in zb_users:
-					alias_list.add(member_ad['alias']) # lista de users a serem criados
-				#if zb_group == ad_group and member_ad['alias'] not in zb_item['members']:
-					#alias_list.add(zb_item['id']+"-"+member_ad['alias'])
-
-	tobe_created = []
-	for alias in alias_list:
-		tobe_user = {}
-		tobe_user['alias'] = alias
-		tobe_user['groups'] = []
-		for ad_item in ad_list:
-			for member in ad_item['members']:
-				if alias == member['alias']:
-					member_group = {}
-					tobe_user['name'] = member['name']
-					member_group['usrgrpid'] = zb_groupid_map[ad_item['group']]
-					tobe_user['groups'].append(member_group)
-		tobe_created.append(tobe_user)
-
-	return list(tobe_created)
-		
+	# Sem grupos no Zabbix nao ha usrgrpid para associar aos usuarios
+	if not zabbix_list:
+		return []
+
+	zb_groupid_map = dict((zb_item.name, zb_item.id) for zb_item in asRecords(Group, zabbix_list))
+	return [{'alias': user['alias'], 'groups': [{'usrgrpid': zb_groupid_map[group]} for group in user['groups']],
+			'name': user['name']} for user in getPlanUsersToBeCreated(zabbix_list, ad_list, zabbix_users)]
 
-def getUsersListToBeUpdatedZabbix(zabbix_list, ad_list):
+
+def getUsersListToBeUpdatedZabbix(zabbix_list, ad_list, zabbix_users=None):
 	"""
 	Metodo que retorna lista de dicionarios de grupos e usuarios membros do AD que devem ser atualiza
 	dos no Zabbix
@@ -135,6 +246,11 @@ def getUsersListToBeUpdatedZabbix(zabbix_list, ad_list):
 		Ex:
 		[{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}, 
 		{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}]
+	zabbix_users : dict
+		Usuarios existentes no Zabbix (alias -> ID), inclusive os que nao sao membros
+		dos grupos em zabbix_list. Opcional.
+		Ex:
+		{'thiago': '3'}
 
 	Returns
 	-------
@@ -143,75 +259,479 @@ def getUsersListToBeUpdatedZabbix(zabbix_list, ad_list):
 		Ex:
 		[{'group': 'Acesso de leitura', 'id': '127', 'add': ['1463'], 'remove': []}]
 	"""
-	zb_userid_map = {}
-	for item in zabbix_list:
-		for member in item['members']:
-			zb_userid_map[member['alias']] = member['id']
+	# Indices alias -> userid e nome do grupo -> grupo, montados uma unica vez
+	zb_userid_map = dict(zabbix_users or {})
+	zb_groups = {}
+	for zb_item in asRecords(Group, zabbix_list):
+		zb_groups[zb_item.name] = zb_item
+		for member in zb_item.members:
+			zb_userid_map[member.alias] = member.id
 
+	# Somente os grupos que ja existem no Zabbix possuem ID para a atualizacao
+	ad_groups = [ad_item for ad_item in iterGroups(ad_list) if ad_item.name in zb_groups]
 	update_list = []
-	for ad_item in ad_list:
-		ad_group = ad_item['group']
+	for item in getPlanMemberships(zabbix_list, ad_groups, zb_userid_map):
+		update_list.append(Membership(item['group'], zb_groups[item['group']].id,
+									[zb_userid_map[alias] for alias in item['add']],
+									[zb_userid_map[alias] for alias in item['remove']]).toDict())
 
-		ad_members = []
-		for member in ad_item['members']:
-			ad_members.append(member['alias'])
+	missing = set(member.alias for ad_item in ad_groups for member in ad_item.members) - set(zb_userid_map)
+	if missing:
+		getLog().logger.warning('Usuarios sem userid no Zabbix ignorados na atualizacao: ' + str(sorted(missing)))
 
-		for zb_item in zabbix_list:
-			zb_group = zb_item['group']
+	return update_list
 
-			zb_members = []
-			for member in zb_item['members']:
-				zb_members.append(member['alias'])
-		
-			if zb_group == ad_group and Counter(zb_members) != Counter(ad_members):
-				to_update = {}
-				to_update['group'] = zb_group
-				to_update['id'] = zb_item['id']
-				zb_remove = []
-				zb_add = []
-
-				for ad_member in ad_members:
-					if ad_member not in zb_members:
-						zb_add.append(zb_userid_map[ad_member])
-	
-				for zb_member in zb_members:
-					if zb_member not in ad_members:
-						zb_remove.append(zb_userid_map[zb_member])
 
-				to_update['add'] = zb_add
-				to_update['remove'] = zb_remove
-				update_list.append(to_update)
+def getIdsFromUsergroups(zabbix_list):
+	"""
+	Metodo que retorna os IDs dos usergroups e dos usuarios membros do Zabbix.
 
-	return list(update_list)
+	Parameters
+	----------
+	zabbix_list : list
+		Ex:
+		[{'group': 'Zabbix administrators', 'id': '7', 'members': [{'id': '1', 'alias': 'Admin'}]}]
 
+	Returns
+	-------
+	tuple
+		Dicionarios nome -> ID dos usergroups e alias -> ID dos usuarios.
+		Ex:
+		({'Zabbix administrators': '7'}, {'Admin': '1'})
+	"""
+	usergroup_ids = {}
+	user_ids = {}
+	for zb_item in asRecords(Group, zabbix_list):
+		usergroup_ids[zb_item.name] = zb_item.id
+		for member in zb_item.members:
+			user_ids[member.alias] = member.id
+	return usergroup_ids, user_ids
 
-if __name__ == '__main__':
 
-	# Instancia classes e conecta na API Zabbix e no AD
-	zm = ZabbixManager()
+def buildPlan(ad_list, groups=None, known_user_ids=None):
+	"""
+	Metodo que monta, a partir de uma unica leitura do AD e do Zabbix, o plano com todas as
+	alteracoes a serem aplicadas no Zabbix. Nenhuma escrita e feita na API.
+
+	Parameters
+	----------
+	ad_list : list ou MembershipIndex
+		Grupos do AD e seus membros, no formato de AdManager.getGroupMembersDic.
+	groups : list
+		Nomes dos grupos do AD cobertos pelo plano. Opcional, por padrao os grupos de ad_list.
+	known_user_ids : dict
+		Alias -> ID dos usuarios gravados na ultima sincronizacao (StateStore.getUserIds).
+		Quando informado, o Zabbix e consultado somente para os grupos do plano e para os
+		usuarios sem ID conhecido. Opcional, por padrao le todos os grupos com o sufixo do AD.
+
+	Returns
+	-------
+	dict
+		Plano serializavel em JSON. Usuarios e grupos sao referenciados pelo nome; os IDs ja
+		existentes no Zabbix sao incluidos para que a aplicacao nao precise reler o Zabbix.
+		Ex:
+		{'groups': ['Your Group (AD)'], 'usergroups_create': ['Your Group (AD)'],
+		'users_create': [{'alias': 'ciclano', 'name': 'CICLANO PIRES', 'groups': ['Your Group (AD)']}],
+		'memberships': [{'group': 'Your Group (AD)', 'add': ['thiago'], 'remove': ['fulano']}],
+		'usergroup_ids': {'Other Group (AD)': '55'}, 'user_ids': {'thiago': '3', 'fulano': '8'},
+		'ad_groups': [{'group': 'Your Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]}]}
+	"""
+	snapshot = getSnapshot()
+	with metrics.timer('sync.plan') as timer:
+		ad_groups = [item.toDict() for item in iterGroups(ad_list)]
+		planned = sorted(groups if groups is not None else [item['group'] for item in ad_groups])
+		if known_user_ids is None:
+			zb_usergroups = snapshot.getZabbixUsergroups()
+			usergroup_ids, user_ids = getIdsFromUsergroups(zb_usergroups)
+			user_ids.update(snapshot.getZabbixUsers())
+			usergroups_create = zabbixUsergroupsToBeCreated()
+		else:
+			# Somente os grupos do plano; os IDs dos demais usuarios vem do estado gravado
+			zb_usergroups = snapshot.getZabbixUsergroups(planned)
+			usergroup_ids, user_ids = getIdsFromUsergroups(zb_usergroups)
+			aliases = set(member['alias'] for item in ad_groups for member in item['members'])
+			for alias in aliases.difference(user_ids):
+				if alias in known_user_ids:
+					user_ids[alias] = known_user_ids[alias]
+			user_ids.update(snapshot.getZabbixUsers(aliases.difference(user_ids)))
+			usergroups_create = [item['group'] for item in ad_groups if item['group'] not in usergroup_ids]
+		plan = {'groups': planned,
+				'usergroups_create': usergroups_create,
+				# Usuarios novos sao criados ja como membros dos seus grupos
+				'users_create': getPlanUsersToBeCreated(zb_usergroups, ad_list, user_ids),
+				'memberships': getPlanMemberships(zb_usergroups, ad_list, user_ids),
+				'usergroup_ids': usergroup_ids,
+				'user_ids': user_ids,
+				# Membros do AD dos grupos do plano, gravados no estado apos a aplicacao
+				'ad_groups': ad_groups}
+		timer.items_out = len(plan['usergroups_create']) + len(plan['users_create']) + len(plan['memberships'])
+	return plan
+
+def applyUsergroups(plan):
+	"""
+	Metodo que cria no Zabbix os grupos de usuario do plano.
+
+	Returns
+	-------
+	dict
+		Nome -> ID dos grupos de usuario existentes e criados.
+	"""
+	with metrics.timer('sync.usergroups', len(plan['usergroups_create'])):
+		usergroup_ids = dict(plan['usergroup_ids'])
+		usergroup_ids.update(zm.createUsergroups(plan['usergroups_create']))
+	return usergroup_ids
+
+def applyUsers(plan, usergroup_ids):
+	"""
+	Metodo que cria no Zabbix os usuarios do plano, ja como membros dos seus grupos.
+
+	Returns
+	-------
+	dict
+		Alias -> ID dos usuarios criados.
+	"""
+	with metrics.timer('sync.users') as timer:
+		user_list = []
+		for user in plan['users_create']:
+			groups = [{'usrgrpid': usergroup_ids[group]} for group in user['groups'] if group in usergroup_ids]
+			if groups:
+				user_list.append({'alias': user['alias'], 'name': user['name'], 'groups': groups})
+			else:
+				getLog().logger.warning('Usuario ' + user['alias'] + ' ignorado: nenhum dos seus usergroups existe no Zabbix.')
+		timer.items_out = len(user_list)
+		return zm.createUsers(user_list)
+
+def applyMemberships(plan, usergroup_ids, user_ids, created_users, usergroups=None):
+	"""
+	Metodo que atualiza os membros dos grupos de usuario do Zabbix conforme o plano.
+
+	Parameters
+	----------
+	plan : dict
+		Plano retornado por buildPlan.
+	usergroup_ids : dict
+		Nome -> ID dos grupos de usuario.
+	user_ids : dict
+		Alias -> ID dos usuarios, inclusive os criados.
+	created_users : dict
+		Alias -> ID dos usuarios criados por applyUsers.
+	usergroups : list
+		Grupos de usuario e membros lidos ao montar o plano (formato de getUsergroupsList(True)).
+		Opcional, sem eles os membros atuais dos grupos existentes sao relidos em uma unica consulta.
+	"""
+	with metrics.timer('sync.memberships') as timer:
+		# Membros conhecidos apos a criacao: os lidos no plano e os usuarios criados em cada grupo
+		known = {}
+		for item in asRecords(Group, usergroups):
+			known[item.name] = list(item.members)
+		for group in plan['usergroups_create']:
+			known.setdefault(group, [])
+		for user in plan['users_create']:
+			if user['alias'] in created_users:
+				for group in user['groups']:
+					if group in known:
+						known[group].append(User(user['alias'], id=created_users[user['alias']]))
+
+		update_list = []
+		for item in plan['memberships']:
+			if item['group'] not in usergroup_ids:
+				getLog().logger.warning('Usergroup ' + item['group'] + ' nao existe no Zabbix, membros nao atualizados.')
+				continue
+			update_list.append(Membership(item['group'], usergroup_ids[item['group']],
+										[user_ids[alias] for alias in item['add'] if alias in user_ids],
+										[user_ids[alias] for alias in item['remove'] if alias in user_ids]))
+		timer.items_out = len(update_list)
+		zm.updateUsers(update_list, [Group(group, usergroup_ids[group], members)
+									for group, members in known.items() if group in usergroup_ids])
+
+def applyPlan(plan, usergroups=None):
+	"""
+	Metodo que aplica no Zabbix o plano retornado por buildPlan, usando os IDs retornados
+	pelas criacoes em vez de reler o Zabbix.
+
+	Parameters
+	----------
+	plan : dict
+		Plano retornado por buildPlan (ou lido do JSON gravado com --plan-out).
+	usergroups : list
+		Grupos de usuario e membros lidos ao montar o plano. Opcional.
+
+	Returns
+	-------
+	tuple
+		Dicionarios nome -> ID dos usergroups e alias -> ID dos usuarios apos a aplicacao e
+		conjunto dos grupos nao aplicados por completo (ver getFailedGroups).
+		Ex:
+		({'Your Group (AD)': '55'}, {'thiago': '3'}, set())
+	"""
+	usergroup_ids = applyUsergroups(plan)
+	created_users = applyUsers(plan, usergroup_ids)
+	user_ids = dict(plan['user_ids'])
+	user_ids.update(created_users)
+	applyMemberships(plan, usergroup_ids, user_ids, created_users, usergroups)
+	if snapshot is not None:
+		snapshot.invalidate('zb_usergroups', 'zb_users')
+	failed = getFailedGroups(plan, usergroup_ids, user_ids)
+	if failed:
+		getLog().logger.warning('Grupos nao sincronizados por completo, serao reprocessados: ' + str(sorted(failed)))
+	return usergroup_ids, user_ids, failed
+
+def getFailedGroups(plan, usergroup_ids, user_ids):
+	"""
+	Metodo que retorna os grupos do plano cujas alteracoes nao foram aplicadas por completo:
+	usergroups que nao puderam ser criados e grupos de usuarios que nao foram criados.
+
+	Parameters
+	----------
+	plan : dict
+		Plano retornado por buildPlan.
+	usergroup_ids : dict
+		Nome -> ID dos grupos de usuario apos a aplicacao.
+	user_ids : dict
+		Alias -> ID dos usuarios apos a aplicacao.
+
+	Returns
+	-------
+	set
+		Ex:
+		{'Your Group (AD)'}
+	"""
+	failed = set(group for group in plan['usergroups_create'] if group not in usergroup_ids)
+	for user in plan['users_create']:
+		if user['alias'] not in user_ids:
+			failed.update(user['groups'])
+	for item in plan['memberships']:
+		if item['group'] not in usergroup_ids:
+			failed.add(item['group'])
+	return failed
+
+def planSync(store):
+	"""
+	Metodo que le o AD, compara com a ultima sincronizacao aplicada e monta o plano
+	para os grupos alterados, usando zm e am ja conectados.
+
+	Parameters
+	----------
+	store : StateStore
+		Estado da ultima sincronizacao aplicada.
+
+	Returns
+	-------
+	tuple
+		Plano (None quando nada mudou no AD) e grupos do AD com seus membros. Com estado
+		gravado, o plano le do Zabbix somente os grupos alterados (ver buildPlan).
+	"""
+	snapshot = getSnapshot()
+
+	# Grupos do AD alterados desde a ultima sincronizacao aplicada
+	with metrics.timer('sync.ad_read') as timer:
+		ad_dic = snapshot.getAdMembers()
+		timer.items_in = len(ad_dic)
+	changed_groups = set(store.getChangedGroups(ad_dic))
+	if store.hasState() and not changed_groups:
+		getLog().logger.info('Nenhuma alteracao no AD desde a ultima sincronizacao.')
+		return None, ad_dic
+	ad_changed = ad_dic.select(changed_groups)
+
+	# Criacao de grupos de host - Nao utilizado, gerenciar no Zabbix.
+	#snapshot.createHostgroups(zabbixHostgroupsToBeCreated())
+
+	return buildPlan(ad_changed, changed_groups, store.getUserIds() if store.hasState() else None), ad_dic
+
+def runSync(store):
+	"""
+	Metodo que executa uma sincronizacao completa entre AD e Zabbix, usando zm e am ja conectados.
+
+	Parameters
+	----------
+	store : StateStore
+		Estado da ultima sincronizacao aplicada.
+
+	Returns
+	-------
+	list
+		Grupos do AD que foram sincronizados (alterados desde a ultima sincronizacao).
+		Ex:
+		['Your Group (AD)']
+	"""
+	scoped = store.hasState()
+	plan, ad_dic = planSync(store)
+	if plan is None:
+		return []
+	applyAndSave(plan, store, getSnapshot().getZabbixUsergroups(plan['groups'] if scoped else None))
+	return plan['groups']
+
+def applyAndSave(plan, store, usergroups=None):
+	"""
+	Metodo que aplica o plano no Zabbix e, em seguida, grava no estado os grupos do plano,
+	exceto os que nao foram aplicados por completo (ver getFailedGroups).
+
+	Parameters
+	----------
+	plan : dict
+		Plano retornado por buildPlan (ou lido do JSON gravado com --plan-out).
+	store : StateStore
+		Estado da ultima sincronizacao aplicada.
+	usergroups : list
+		Grupos de usuario e membros lidos ao montar o plano. Opcional.
+	"""
+	usergroup_ids, user_ids, failed = applyPlan(plan, usergroups)
+
+	# Grava o estado somente apos aplicar as alteracoes no Zabbix. Os grupos com falha nao
+	# sao gravados e voltam a ser considerados alterados na proxima execucao.
+	store.save(plan.get('ad_groups', []), usergroup_ids, user_ids, failed, plan['groups'])
+
+def writePlan(plan, path=None):
+	"""
+	Metodo que grava o plano em JSON no arquivo informado (ou na saida padrao).
+	"""
+	content = json.dumps(plan, indent=2, sort_keys=True)
+	if path:
+		with open(path, 'w', encoding='utf-8') as plan_file:
+			plan_file.write(content + '\n')
+	else:
+		print(content)
+
+def readPlan(path):
+	"""
+	Metodo que le o plano gravado por writePlan.
+	"""
+	with open(path, encoding='utf-8') as plan_file:
+		return json.load(plan_file)
+
+def connect():
+	"""
+	Metodo que conecta na API Zabbix e no AD, reaproveitando as conexoes atuais
+	enquanto continuarem validas.
+	"""
+	global zm, am
+	if zm is not None and am is not None and zm.isConnected() and am.isConnected():
+		return
+	disconnect()
+	config = getConfig()
+	zm = ZabbixManager(config)
 	zm.connect()
-	am = AdManager()
+	am = createAdManager(config)
 	am.connect()
-	
-	# Criacao de grupos de host - Nao utilizado, gerenciar no Zabbix.
-	#hostgroups_to_be_created = zabbixHostgroupsToBeCreated()
-	#zm.createHostgroups(hostgroups_to_be_created)
-	
-	# Criacao de grupos de usuario
-	usergroups_to_be_created = zabbixUsergroupsToBeCreated()
-	zm.createUsergroups(usergroups_to_be_created)
-	
-	# Criacao de usuarios no Zabbix
-	ad_dic = am.getGroupMembersDic(am.FILTER_GROUP_SEARCH_AD)	
-	zb_dic = zm.getUsergroupsList(True)
-	users_tobe_created = getUsersListToBeCreatedZabbix(zb_dic, ad_dic)
-	zm.createUsers(users_tobe_created)
-
-	# Sincronizacao usuarios AD e Zabbix
-	zb_dic = zm.getUsergroupsList(True)
-	users_tobe_updated = getUsersListToBeUpdatedZabbix(zb_dic, ad_dic)
-	zm.updateUsers(users_tobe_updated)
-
-	# Desconecta da API Zabbix e do AD
-	am.disconnect()
-	zm.disconnect()
+
+def disconnect():
+	"""
+	Metodo que desconecta da API Zabbix e do AD, ignorando falhas de conexoes ja perdidas.
+	"""
+	global zm, am
+	for manager in (am, zm):
+		if manager is None:
+			continue
+		try:
+			manager.disconnect()
+		except Exception as e:
+			getLog().logger.debug('Falha ao desconectar: ' + str(e))
+	zm = am = None
+
+def runDaemon(cp, store):
+	"""
+	Metodo que executa a sincronizacao periodicamente conforme a secao [daemon] do conexao.ini,
+	mantendo as conexoes com o AD e a API Zabbix abertas entre as execucoes.
+
+	Parameters
+	----------
+	cp : configparser.ConfigParser
+		Configuracoes lidas do conexao.ini.
+	store : StateStore
+		Estado da ultima sincronizacao aplicada.
+	"""
+	def sync():
+		global snapshot
+		# Cada execucao le novamente o AD e o Zabbix
+		snapshot = None
+		metrics.reset()
+		try:
+			with metrics.timer('sync.total'):
+				return runSync(store)
+		finally:
+			emitMetrics(cp)
+
+	daemon = SyncDaemon(connect, sync, disconnect,
+						interval=cp.getint('daemon', 'interval', fallback=300),
+						jitter=cp.getint('daemon', 'jitter', fallback=30),
+						status_file=cp.get('daemon', 'status_file', fallback='sync_status.json'),
+						retry_interval=cp.getint('daemon', 'retry_interval', fallback=30),
+						log_level=cp.get('daemon', 'log_level', fallback='INFO'))
+	daemon.run()
+
+def emitMetrics(cp):
+	"""
+	Metodo que emite o resumo das metricas da execucao conforme a secao [metrics] do conexao.ini:
+	JSON (arquivo ou log), arquivo texto do Prometheus e/ou itens Zabbix trapper.
+
+	Parameters
+	----------
+	cp : configparser.ConfigParser
+		Configuracoes lidas do conexao.ini.
+	"""
+	json_file = cp.get('metrics', 'json_file', fallback='')
+	if json_file:
+		metrics.writeJson(json_file)
+	else:
+		getLog().logger.info('Metricas: ' + metrics.toJson())
+
+	prometheus_file = cp.get('metrics', 'prometheus_file', fallback='')
+	if prometheus_file:
+		metrics.writePrometheus(prometheus_file)
+
+	trapper_server = cp.get('metrics', 'trapper_server', fallback='')
+	if trapper_server:
+		try:
+			metrics.sendZabbixTrapper(trapper_server, cp.get('metrics', 'trapper_host'),
+									cp.getint('metrics', 'trapper_port', fallback=10051))
+		except Exception as e:
+			getLog().logger.warning('Falha ao enviar metricas ao Zabbix trapper: ' + str(e))
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Sincroniza usuarios e grupos do AD com o Zabbix.')
+	parser.add_argument('--rebuild-state', action='store_true',
+						help='descarta o estado local e sincroniza todos os grupos')
+	parser.add_argument('--daemon', action='store_true',
+						help='executa continuamente no intervalo da secao [daemon] do conexao.ini')
+	parser.add_argument('--dry-run', action='store_true',
+						help='somente monta o plano de alteracoes, sem escrever no Zabbix')
+	parser.add_argument('--plan-out', metavar='ARQUIVO',
+						help='grava o plano do --dry-run em JSON (padrao: saida padrao)')
+	parser.add_argument('--apply-plan', metavar='ARQUIVO',
+						help='aplica no Zabbix o plano gravado com --plan-out')
+	args = parser.parse_args()
+
+	try:
+		cp = getConfig().validate().parser
+	except ConfigError as e:
+		parser.exit(2, 'Configuracao invalida: %s\n' % e)
+	if cp.has_section('log'):
+		configureLogging(cp['log'].getint('max_bytes', 10485760), cp['log'].getint('backup_count', 5),
+						cp['log'].get('format', 'text'), cp['log'].get('file', 'python.log'))
+	store = StateStore(cp.get('sync', 'state_db', fallback='sync_state.db'))
+	if args.rebuild_state:
+		store.clear()
+
+	if args.daemon:
+		runDaemon(cp, store)
+		store.close()
+	else:
+		# Instancia classes e conecta na API Zabbix e no AD
+		connect()
+		try:
+			with metrics.timer('sync.total'):
+				if args.apply_plan:
+					applyAndSave(readPlan(args.apply_plan), store)
+				elif args.dry_run:
+					plan, ad_dic = planSync(store)
+					writePlan(plan or {'groups': [], 'usergroups_create': [], 'users_create': [], 'memberships': [],
+										'usergroup_ids': {}, 'user_ids': {}}, args.plan_out)
+				else:
+					runSync(store)
+		finally:
+			# Desconecta da API Zabbix e do AD e emite as metricas mesmo em caso de erro
+			store.close()
+			disconnect()
+			emitMetrics(cp)
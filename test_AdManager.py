@@ -1,5 +1,9 @@
 import unittest
+import json
+import sys
 import AdManager
+import FakeBackends
+from FakeBackends import fakeEnvironment
 
 class AdTestCase(unittest.TestCase):
 
@@ -35,12 +39,173 @@ class AdTestCase(unittest.TestCase):
         """
         self.assertRegex(am.getGroupMembersDic('cn=Monitoracao - Your Group')[0]['group'], 'Your Group')
 
+    def testGetGroupMembersDicBulk(self):
+        """
+        Testa se a consulta em lote retorna os mesmos grupos e membros da consulta por grupo.
+        """
+        def normalize(groups):
+            return {item['group']: sorted(m['alias'] for m in item['members']) for item in groups}
+        bulk = am.getGroupMembersDicBulk(am.FILTER_GROUP_SEARCH_AD)
+        per_group = am.getGroupMembersDicPerGroup(am.FILTER_GROUP_SEARCH_AD)
+        self.assertEqual(normalize(bulk), normalize(per_group))
+
     def tearDown(self):
         """
         Testa desconexao do AD. Executado por ultimo.
         """
         am.disconnect()
 
+class GroupFilterTestCase(unittest.TestCase):
+
+    def testChunkedGroupSearch(self):
+        """
+        Testa se o filtro de grupos dividido em partes retorna os mesmos grupos, um por consulta.
+        """
+        directory = FakeBackends.FakeDirectory(users=40, groups=6, nesting=1)
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server):
+            from AdManager import AdManager
+            from LdapFilter import orFilter, orFilters
+            am = AdManager()
+            am.connect()
+            expected = am.getGroupsList(am.FILTER_GROUP_SEARCH_AD)
+            am.FILTER_GROUP_SEARCH_AD = orFilter('cn', expected + ['Monitoracao - Group 0'])
+            am._group_search_filters = orFilters('cn', expected + ['Monitoracao - Group 0'], max_length=60)
+            directory.searches.clear()
+            self.assertEqual(am.getGroupsList(am.FILTER_GROUP_SEARCH_AD), expected)
+            self.assertEqual(sum(directory.searches.values()), len(am._group_search_filters))
+            self.assertGreater(len(am._group_search_filters), 1)
+            self.assertEqual(am.convertAdGroupNameToZabbix('Monitoracao - Group 0'), 'Group 0 (AD)')
+            self.assertTrue(am.getUsersFromGroup(expected[0]))
+
+class BulkMembershipTestCase(unittest.TestCase):
+
+    def members(self, ad_list):
+        return dict((item['group'], set(member['alias'] for member in item['members'])) for item in ad_list)
+
+    def testGroupsOutsideUsersOu(self):
+        """
+        Testa se a consulta em lote encontra grupos monitorados e aninhados fora de users_ou
+        e se um grupo ausente do grafo usa a consulta por grupo em vez de retornar vazio.
+        """
+        directory = FakeBackends.FakeDirectory(users=60, groups=3, nesting=1, disabled=0)
+        directory.users_ou = 'OU=Users,' + directory.base
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server):
+            from AdManager import AdManager
+            am = AdManager()
+            am.connect()
+            groups = am.getGroupsList(am.FILTER_GROUP_SEARCH_AD)
+            per_group = self.members(am.getGroupMembersDicPerGroup(am.FILTER_GROUP_SEARCH_AD, groups))
+            self.assertTrue(all(per_group.values()))
+            self.assertEqual(self.members(am.getGroupMembersDicBulk(am.FILTER_GROUP_SEARCH_AD, groups)), per_group)
+
+            am._group_dns[groups[0]] = 'CN=%s,OU=Outra,%s' % (groups[0], directory.base)
+            self.assertRaises(KeyError, am.getGroupMembersDicBulk, am.FILTER_GROUP_SEARCH_AD, groups)
+            self.assertEqual(self.members(am.getGroupMembersIndex(am.FILTER_GROUP_SEARCH_AD, groups)), per_group)
+
+    def testGraphLoadsOnlyMonitoredGroups(self):
+        """
+        Testa se o grafo em lote carrega somente os grupos monitorados e os aninhados neles,
+        buscando um nivel de aninhamento por vez.
+        """
+        directory = FakeBackends.FakeDirectory(users=60, groups=3, nesting=2)
+        for g in range(5):
+            outro = directory._addGroup('Outro %d' % g, 'OU=Outros,' + directory.base)
+            directory.entries[outro.lower()]['attrs']['member'].append(('CN=USER %d,OU=Users,%s' % (g, directory.base)).encode('utf-8'))
+        directory._buildClosure()
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server):
+            from AdManager import AdManager
+            am = AdManager()
+            am.connect()
+            groups = am.getGroupsList(am.FILTER_GROUP_SEARCH_AD)
+            graph = am.getDirectoryGraph(groups)
+            expected = set(key for key, entry in directory.entries.items()
+                           if b'group' in entry['attrs']['objectClass'] and not key.startswith('cn=outro'))
+            self.assertEqual(set(graph['groups']), expected)
+            self.assertEqual(len(graph['guids']), len(graph['groups']) + len(graph['users']))
+
+    def testPerGroupWindow(self):
+        """
+        Testa se a consulta por grupo com pool mantem no maximo pool_size * 2 consultas
+        pendentes e retorna todos os grupos.
+        """
+        directory = FakeBackends.FakeDirectory(users=60, groups=12, nesting=0)
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server):
+            from AdManager import AdManager
+            am = AdManager()
+            am.connect()
+            groups = am.getGroupsList(am.FILTER_GROUP_SEARCH_AD)
+            expected = self.members(am.getGroupMembersDicPerGroup(am.FILTER_GROUP_SEARCH_AD, groups))
+            am._pool_size = 2
+            am.connect()
+            submitted = []
+            get_members = am._getGroupMembers
+            am._getGroupMembers = lambda ad_group: submitted.append(ad_group) or get_members(ad_group)
+            results = am._iterGroupMembersPerGroup(groups)
+            first = next(results)
+            self.assertLessEqual(len(submitted), am._pool_size * 2 + 1)
+            members = self.members(am._toDic([first] + list(results)))
+            self.assertEqual(members, expected)
+            self.assertEqual(sorted(submitted), sorted(groups))
+
+class IncrementalGraphTestCase(unittest.TestCase):
+
+    def effective(self, am, graph):
+        """
+        Retorna os usuarios, os objectGUIDs e os membros efetivos (grupos aninhados expandidos) de cada grupo.
+        """
+        members = dict((group, sorted(user.lower() for user in am._expandGroup(graph, group))) for group in graph['groups'])
+        return graph['users'], graph['guids'], members
+
+    def testIncrementalMatchesFullLoad(self):
+        """
+        Testa se o grafo incremental (renomeacao, movimentacao, desabilitacao, remocao, alteracao
+        de membros e estado por DC) fica igual ao grafo carregado por completo.
+        """
+        directory = FakeBackends.FakeDirectory(users=40, groups=3, nesting=2, disabled=0)
+        directory.users_ou = 'OU=Users,' + directory.base
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        users = lambda u: 'CN=USER %d,OU=Users,%s' % (u, directory.base)
+        with fakeEnvironment(directory, server):
+            with open('conexao.ini') as content:
+                text = content.read().replace('membership_mode = bulk', 'membership_mode = bulk\nincremental = true', 1)
+            with open('conexao.ini', 'w') as content:
+                content.write(text)
+            from AdManager import AdManager
+            am = AdManager()
+            am.connect()
+            am.getDirectoryGraph()
+            group_dns = [am._getGroupDn(ad_group) for ad_group in directory.monitored]
+
+            group = 'CN=Monitoracao - Group 0,' + directory.groups_ou
+            nested = 'CN=Nested 1-0,OU=Nested,' + directory.base
+            directory.rename(users(0), 'CN=USER 0 RENOMEADO,OU=Users,' + directory.base)
+            directory.rename(users(1), 'CN=USER 1,OU=Outros,' + directory.base)
+            directory.modify(users(2), {'userAccountControl': [b'514']})
+            directory.delete(users(3))
+            directory.modify(users(4), {'userAccountControl': [b'514']})
+            directory.rename(nested, 'CN=Nested 1-0 novo,OU=Nested,' + directory.base)
+            members = directory.entries[group.lower()]['attrs']['member']
+            directory.modify(group, {'member': members[1:] + [users(5).encode('utf-8')]})
+            graph = am.getDirectoryGraph()
+            self.assertEqual(self.effective(am, graph), self.effective(am, am._loadDirectoryGraph(group_dns)))
+            self.assertNotIn(users(2).lower(), graph['users'])
+            self.assertTrue(all(member is sys.intern(member) for members in graph['groups'].values() for member in members))
+
+            directory.modify(users(4), {'userAccountControl': [b'512']})
+            graph = am.getDirectoryGraph()
+            self.assertIn(users(4).lower(), graph['users'])
+            self.assertEqual(self.effective(am, graph), self.effective(am, am._loadDirectoryGraph(group_dns)))
+
+            # O uSNChanged e local a cada DC: outro DC carrega o grafo completo e mantem estado proprio
+            directory.server_name = 'DC2'
+            graph = am.getDirectoryGraph()
+            self.assertEqual(self.effective(am, graph), self.effective(am, am._loadDirectoryGraph(group_dns)))
+            with open('ad_state.json') as state_file:
+                self.assertEqual(len(json.load(state_file)), 2)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import json
+import FakeBackends
+from FakeBackends import fakeEnvironment
+
+class AdSourcesTestCase(unittest.TestCase):
+
+    EXTRA_CONFIG = """
+[ad:filial]
+host = ldap://filial.local
+membership_mode = per_group
+"""
+
+    def setUp(self):
+        self.main = FakeBackends.FakeDirectory(users=30, groups=2, nesting=1, disabled=0, seed=1)
+        self.branch = FakeBackends.FakeDirectory(users=20, groups=3, nesting=1, disabled=0, seed=2)
+        self.directories = {'ldap://bench.local': self.main, 'ldap://filial.local': self.branch}
+
+    def loadIndex(self, policy):
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(self.directories, server, extra_config=self.EXTRA_CONFIG):
+            with open('conexao.ini') as content:
+                text = content.read().replace('host = ldap://bench.local', 'host = ldap://down.local ldap://bench.local', 1)
+                text = text.replace('membership_mode = bulk', 'membership_mode = bulk\nduplicate_users = ' + policy, 1)
+            with open('conexao.ini', 'w') as content:
+                content.write(text)
+            import sync_users
+            sync_users.connect()
+            self.assertEqual([source._server_url for source in sync_users.am.sources], ['ldap://bench.local', 'ldap://filial.local'])
+            snapshot = sync_users.getSnapshot()
+            index = snapshot.getAdMembers()
+            self.assertEqual(snapshot.getAdGroups(), ['Monitoracao - Group 0', 'Monitoracao - Group 1', 'Monitoracao - Group 2'])
+            main = sync_users.am.sources[0].getGroupMembersIndex(sync_users.am.FILTER_GROUP_SEARCH_AD)
+            branch = sync_users.am.sources[1].getGroupMembersIndex(sync_users.am.FILTER_GROUP_SEARCH_AD)
+            sync_users.disconnect()
+            return index, main, branch
+
+    def testFirstSourceWins(self):
+        """
+        Testa se os dominios sao unidos com failover de DC e se usuarios duplicados
+        permanecem somente no primeiro dominio.
+        """
+        index, main, branch = self.loadIndex('first')
+        duplicates = main.aliases() & branch.aliases()
+        self.assertTrue(duplicates)
+        self.assertEqual(index.aliases(), main.aliases() | branch.aliases())
+        self.assertEqual(index.aliases('Group 2 (AD)'), branch.aliases('Group 2 (AD)') - duplicates)
+        self.assertEqual(index.aliases('Group 0 (AD)'), main.aliases('Group 0 (AD)') | (branch.aliases('Group 0 (AD)') - duplicates))
+
+    def testQualifyDuplicates(self):
+        """
+        Testa se usuarios duplicados dos demais dominios sao mantidos como alias@dominio.
+        """
+        index, main, branch = self.loadIndex('qualify')
+        duplicates = main.aliases() & branch.aliases()
+        expected = set(alias + '@filial' if alias in duplicates else alias for alias in branch.aliases('Group 2 (AD)'))
+        self.assertEqual(index.aliases('Group 2 (AD)'), expected)
+        self.assertEqual(len(index.aliases()), len(main.aliases() | branch.aliases()) + len(duplicates))
+
+    def testOwnerIsStable(self):
+        """
+        Testa se o dominio dono de um usuario duplicado e mantido quando os membros dos
+        grupos mudam e se o dono gravado em owners_file e respeitado.
+        """
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(self.directories, server, extra_config=self.EXTRA_CONFIG):
+            import sync_users
+            sync_users.connect()
+            am = sync_users.am
+            index = am.getGroupMembersIndex(am.FILTER_GROUP_SEARCH_AD)
+            self.assertIn('user0', index.aliases())
+            with open('ad_owners.json') as owners_file:
+                self.assertEqual(json.load(owners_file)['user0'], 'ad')
+
+            # user0 deixa os grupos do dominio principal, mas mantem a conta ativa
+            user_dn = next(entry['dn'] for entry in self.main.entries.values()
+                           if entry['attrs'].get('sAMAccountName') == [b'user0']).encode('utf-8')
+            for entry in list(self.main.entries.values()):
+                if user_dn in entry['attrs'].get('member', []):
+                    self.main.modify(entry['dn'], {'member': [member for member in entry['attrs']['member'] if member != user_dn]})
+            index = am.getGroupMembersIndex(am.FILTER_GROUP_SEARCH_AD)
+            self.assertNotIn('user0', index.aliases())
+            self.assertEqual(am.getUserOwners([source.getGroupMembersIndex(am.FILTER_GROUP_SEARCH_AD) for source in am.sources])['user0'], 'ad')
+
+            # Dono gravado em outro dominio e mantido enquanto a conta existir nele
+            with open('ad_owners.json', 'w') as owners_file:
+                json.dump({'user1': 'ad:filial'}, owners_file)
+            branch = am.sources[1].getGroupMembersIndex(am.FILTER_GROUP_SEARCH_AD)
+            index = am.getGroupMembersIndex(am.FILTER_GROUP_SEARCH_AD)
+            self.assertTrue(branch.aliases() >= {'user1'})
+            self.assertEqual(set(group for group in index.groups() if 'user1' in index.aliases(group)),
+                             set(group for group in branch.groups() if 'user1' in branch.aliases(group)))
+            sync_users.disconnect()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import json
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import AsyncZabbixAPI
+import Metrics
+
+class JsonRpcHandler(BaseHTTPRequestHandler):
+    """
+    API Zabbix minima: user.login, usergroup.update (com atraso), http.error (HTTP 500),
+    slow.get (acima do timeout) e erro nos demais metodos.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(request)
+        if request['method'] == 'user.login':
+            response = {'jsonrpc': '2.0', 'result': 'token', 'id': request['id']}
+        elif request['method'] == 'usergroup.update':
+            time.sleep(0.2)
+            response = {'jsonrpc': '2.0', 'result': {'usrgrpids': [request['params']['usrgrpid']]}, 'id': request['id']}
+        elif request['method'] == 'http.error':
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        elif request['method'] == 'slow.get':
+            time.sleep(0.5)
+            response = {'jsonrpc': '2.0', 'result': [], 'id': request['id']}
+        else:
+            response = {'jsonrpc': '2.0', 'error': {'code': -32602, 'message': 'Invalid params.', 'data': 'x'}, 'id': request['id']}
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class AsyncZabbixAPITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), JsonRpcHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = AsyncZabbixAPI.ZabbixClient('http://127.0.0.1:%d/' % self.server.server_port,
+                                                  'Admin', 'zabbix', max_concurrency=5)
+
+    def testLoginAndAuth(self):
+        """
+        Testa se o token do login e enviado nas chamadas seguintes.
+        """
+        self.assertEqual(self.client.auth, 'token')
+        self.client.do_requests([('usergroup.update', {'usrgrpid': '1', 'userids': []})])
+        self.assertEqual(self.server.requests[-1]['auth'], 'token')
+
+    def testRequestBytes(self):
+        """
+        Testa se os bytes da requisicao e da resposta sao registrados nas metricas.
+        """
+        Metrics.metrics.reset()
+        self.client.do_request('usergroup.update', {'usrgrpid': '1', 'userids': []})
+        metric = Metrics.metrics.summary()['operations']['zabbix.usergroup.update']
+        request = self.server.requests[-1]
+        self.assertEqual(metric['bytes_out'], len(json.dumps(request).encode('utf-8')))
+        self.assertEqual(metric['bytes_in'], len(json.dumps({'jsonrpc': '2.0', 'result': {'usrgrpids': ['1']},
+                                                              'id': request['id']}).encode('utf-8')))
+
+    def testConcurrentRequests(self):
+        """
+        Testa se as chamadas sao executadas simultaneamente e na ordem informada.
+        """
+        calls = [('usergroup.update', {'usrgrpid': str(i), 'userids': []}) for i in range(5)]
+        start = time.perf_counter()
+        responses = self.client.do_requests(calls)
+        self.assertLess(time.perf_counter() - start, 0.8)
+        self.assertEqual([r['result']['usrgrpids'][0] for r in responses], ['0', '1', '2', '3', '4'])
+
+    def testErrors(self):
+        """
+        Testa se erros da API sao levantados no do_request e retornados no do_requests.
+        """
+        with self.assertRaises(AsyncZabbixAPI.ZabbixAPIException):
+            self.client.usergroup.get(output=['name'])
+        responses = self.client.do_requests([('usergroup.get', {})])
+        self.assertIsInstance(responses[0], AsyncZabbixAPI.ZabbixAPIException)
+
+    def testConnectionClosedOnErrors(self):
+        """
+        Testa se a conexao e fechada, e nao devolvida ao pool, em respostas HTTP com erro e
+        em timeouts, e se a chamada com timeout nao e repetida.
+        """
+        api = AsyncZabbixAPI.AsyncZabbixAPI('http://127.0.0.1:%d/' % self.server.server_port, timeout=0.2)
+        connections = []
+        new_connection = api._newConnection
+        api._newConnection = lambda: connections.append(new_connection()) or connections[-1]
+        with self.assertRaises(AsyncZabbixAPI.ZabbixAPIException):
+            api._post(b'{"jsonrpc": "2.0", "method": "http.error", "params": {}, "id": 1}')
+        requests = len(self.server.requests)
+        with self.assertRaises(OSError):
+            api._post(b'{"jsonrpc": "2.0", "method": "slow.get", "params": {}, "id": 2}')
+        time.sleep(0.4)
+        self.assertEqual(len(self.server.requests), requests + 1)
+        self.assertEqual(len(connections), 2)
+        self.assertTrue(all(conn.sock is None for conn in connections))
+        self.assertTrue(api._connections.empty())
+        api.close()
+
+    def testVerifyAndTimeout(self):
+        """
+        Testa se timeout e verify sao repassados pelo ZabbixClient e se verify = False
+        desativa a validacao do certificado e do nome do servidor.
+        """
+        client = AsyncZabbixAPI.ZabbixClient('https://zabbix.yourdomain.com/', auth='token', timeout=5, verify=False)
+        self.assertEqual(client._api._timeout, 5)
+        self.assertFalse(client._api._context.check_hostname)
+        self.assertEqual(client._api._context.verify_mode, ssl.CERT_NONE)
+        client.close()
+        client = AsyncZabbixAPI.ZabbixClient('https://zabbix.yourdomain.com/', auth='token')
+        self.assertTrue(client._api._context.check_hostname)
+        self.assertEqual(client._api._context.verify_mode, ssl.CERT_REQUIRED)
+        client.close()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
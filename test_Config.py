@@ -0,0 +1,95 @@
+import unittest
+import os
+import tempfile
+from Config import Config, ConfigError, getConfig
+
+CONFIG = """[zabbix]
+host = https://zabbix.yourdomain.com/
+username = zabbix_user
+password = zabbix_passwd
+log_level = INFO
+default_group = Users from AD
+batch_size = 100
+
+[ad]
+host = ldap://dc1.yourdomain.com
+bind_dn = CN=zabbix,DC=yourdomain,DC=com
+bind_pw = passwd
+users_ou = OU=Usuarios,DC=yourdomain,DC=com
+groups_ou = OU=Grupos,DC=yourdomain,DC=com
+log_level = INFO
+filter_group_search_zb = 'Monitoracao - '
+filter_group_suffix_zb = ' (AD)'
+filter_group_search =
+    Monitoracao - *
+
+[ad:filial]
+host = ldap://dc1.filial.yourdomain.com
+"""
+
+class ConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'conexao.ini')
+        self.write(CONFIG)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, content):
+        with open(self.path, 'w', encoding='utf-8') as config:
+            config.write(content)
+
+    def testParsedOnce(self):
+        """
+        Testa se o arquivo e lido uma unica vez e novamente somente apos alterado.
+        """
+        config = getConfig(self.path)
+        self.assertIs(getConfig(self.path), config)
+        self.write(CONFIG.replace('batch_size = 100', 'batch_size = 50'))
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNot(getConfig(self.path), config)
+        self.assertEqual(getConfig(self.path).section('zabbix').getint('batch_size'), 50)
+
+    def testAdSections(self):
+        """
+        Testa se as secoes '[ad:<nome>]' herdam as opcoes da secao [ad].
+        """
+        config = Config(self.path).validate()
+        self.assertEqual(config.adSections(), ['ad', 'ad:filial'])
+        filial = config.section('ad:filial')
+        self.assertEqual(filial['host'], 'ldap://dc1.filial.yourdomain.com')
+        self.assertEqual(filial['bind_dn'], 'CN=zabbix,DC=yourdomain,DC=com')
+        self.assertEqual(filial['state_file'], 'ad_state_filial.json')
+
+    def testValidate(self):
+        """
+        Testa se a validacao aponta todas as opcoes ausentes ou invalidas.
+        """
+        self.write(CONFIG.replace('bind_pw = passwd\n', '').replace('batch_size = 100', 'batch_size = cem\nverify = nao')
+                   + 'membership_mode = todos\n')
+        with self.assertRaises(ConfigError) as error:
+            Config(self.path).validate()
+        message = str(error.exception)
+        self.assertIn('[ad] bind_pw', message)
+        self.assertIn('[ad:filial] bind_pw', message)
+        self.assertIn('[zabbix] batch_size', message)
+        self.assertIn('[zabbix] verify', message)
+        self.assertIn('[ad:filial] membership_mode', message)
+
+    def testIncrementalRequiresBulk(self):
+        """
+        Testa se incremental = true e rejeitado sem membership_mode = bulk.
+        """
+        self.write(CONFIG.replace('[ad:filial]', 'incremental = true\n\n[ad:filial]'))
+        with self.assertRaises(ConfigError) as error:
+            Config(self.path).validate()
+        self.assertIn('[ad] incremental = true requer membership_mode = bulk', str(error.exception))
+        self.assertIn('[ad:filial] incremental', str(error.exception))
+
+        self.write(CONFIG.replace('[ad:filial]', 'incremental = true\nmembership_mode = bulk\n\n[ad:filial]\nincremental = false'))
+        Config(self.path).validate()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import json
+import tempfile
+from Daemon import SyncDaemon
+from Logging import shutdownLogging
+
+class SyncDaemonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.status_file = os.path.join(self.tmpdir.name, 'status.json')
+        self.log_file = os.path.join(self.tmpdir.name, 'test.log')
+        self.events = []
+
+    def tearDown(self):
+        shutdownLogging(self.log_file)
+        self.tmpdir.cleanup()
+
+    def createDaemon(self, results):
+        """
+        Cria um daemon cujas sincronizacoes retornam (ou lancam) os itens de results.
+        """
+        def sync():
+            self.events.append('sync')
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return SyncDaemon(lambda: self.events.append('connect'), sync, lambda: self.events.append('disconnect'),
+                          interval=0, jitter=0, status_file=self.status_file, retry_interval=0, log_level='WARN',
+                          log_file=self.log_file)
+
+    def readStatus(self):
+        with open(self.status_file) as content:
+            return json.load(content)
+
+    def testRunKeepsConnections(self):
+        """
+        Testa se as execucoes reaproveitam as conexoes e desconectam somente ao encerrar.
+        """
+        daemon = self.createDaemon([['Your Group (AD)'], []])
+        daemon.run(max_runs=2)
+        self.assertEqual(self.events, ['connect', 'sync', 'connect', 'sync', 'disconnect'])
+        status = self.readStatus()
+        self.assertEqual(status['state'], 'stopped')
+        self.assertEqual(status['runs'], 2)
+        self.assertEqual(status['last_result'], [])
+        self.assertIsNotNone(status['last_success'])
+
+    def testFailureReconnects(self):
+        """
+        Testa se uma falha desconecta, registra o erro e aplica o backoff.
+        """
+        daemon = self.createDaemon([ConnectionError('AD indisponivel'), ['Your Group (AD)']])
+        daemon._interval = 300
+        daemon._retry_interval = 10
+        self.assertFalse(daemon.runOnce())
+        self.assertEqual(self.events, ['connect', 'sync', 'disconnect'])
+        status = self.readStatus()
+        self.assertEqual(status['state'], 'error')
+        self.assertEqual(status['last_error'], 'AD indisponivel')
+        self.assertEqual(daemon.nextDelay(), 10)
+        daemon.status['consecutive_failures'] = 10
+        self.assertEqual(daemon.nextDelay(), 300)
+        daemon.status['consecutive_failures'] = 1
+        self.assertTrue(daemon.runOnce())
+        self.assertEqual(self.readStatus()['consecutive_failures'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from GroupMapper import GroupMapper
+
+class GroupMapperTestCase(unittest.TestCase):
+
+    def testAnchoredPrefix(self):
+        """
+        Testa se o prefixo e removido somente do inicio do nome.
+        """
+        mapper = GroupMapper('Monitoracao - ', ' (AD)')
+        self.assertEqual(mapper.map('Monitoracao - Your Group 1'), 'Your Group 1 (AD)')
+        self.assertEqual(mapper.map('Infra - Monitoracao - Web'), 'Infra - Monitoracao - Web (AD)')
+
+    def testRenameRules(self):
+        """
+        Testa se as regras do conexao.ini sao aplicadas em ordem, antes do sufixo.
+        """
+        rules = GroupMapper.parseRules('\n^NOC (.*) => \\1 - NOC\n^(.*) - Leitura$ => \\1 (leitura)')
+        self.assertEqual(rules, [('^NOC (.*)', '\\1 - NOC'), ('^(.*) - Leitura$', '\\1 (leitura)')])
+        mapper = GroupMapper('Monitoracao - ', ' (AD)', rules)
+        self.assertEqual(mapper.map('Monitoracao - NOC Redes'), 'Redes - NOC (AD)')
+        self.assertEqual(mapper.map('Monitoracao - Web - Leitura'), 'Web (leitura) (AD)')
+        self.assertRaises(ValueError, GroupMapper.parseRules, '^NOC (.*)')
+
+    def testMemoized(self):
+        """
+        Testa se o resultado de cada nome e calculado uma unica vez.
+        """
+        mapper = GroupMapper('Monitoracao - ', ' (AD)', [('Web', 'Site')])
+        self.assertIs(mapper.map('Monitoracao - Web'), mapper.map('Monitoracao - Web'))
+        self.assertEqual(len(mapper._cache), 1)
+
+if __name__ == '__main__':
+    unittest.main()
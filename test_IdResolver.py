@@ -0,0 +1,53 @@
+import unittest
+from IdResolver import IdResolver
+
+class IdResolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.objects = {'Users from AD': '13', 'Your Group (AD)': '55', 'Guests': '8'}
+        self.loads = []
+        self.now = 0
+        self.resolver = IdResolver(self.load, ttl=60, clock=lambda: self.now)
+
+    def load(self, names):
+        self.loads.append(None if names is None else sorted(names))
+        return dict((name, objectid) for name, objectid in self.objects.items() if names is None or name in names)
+
+    def testBatchResolve(self):
+        """
+        Testa se os nomes que faltam sao consultados juntos e memorizados.
+        """
+        self.assertEqual(self.resolver.resolve(['Users from AD', 'Your Group (AD)', 'Missing']),
+                         {'Users from AD': '13', 'Your Group (AD)': '55'})
+        self.assertEqual(self.resolver.get('Users from AD'), '13')
+        self.assertEqual(self.loads, [['Missing', 'Users from AD', 'Your Group (AD)']])
+
+    def testUpdateAndPopulate(self):
+        """
+        Testa se IDs registrados (objetos criados) e a carga completa evitam novas consultas.
+        """
+        self.resolver.update({'New Group (AD)': '127'})
+        self.assertEqual(self.resolver.get('New Group (AD)'), '127')
+        self.resolver.populate()
+        self.assertEqual(self.resolver.resolve(['Guests', 'Users from AD']), {'Guests': '8', 'Users from AD': '13'})
+        self.assertEqual(self.loads, [None])
+
+    def testExpiration(self):
+        """
+        Testa se as entradas expiram apos o ttl e se ttl 0 desativa o cache.
+        """
+        self.resolver.get('Guests')
+        self.now = 30
+        self.resolver.get('Guests')
+        self.now = 61
+        self.objects['Guests'] = '9'
+        self.assertEqual(self.resolver.get('Guests'), '9')
+        self.assertEqual(len(self.loads), 2)
+        resolver = IdResolver(self.load, ttl=0)
+        self.assertEqual(resolver.get('Guests'), '9')
+        self.assertEqual(resolver.get('Guests'), '9')
+        self.assertEqual(len(resolver), 0)
+        self.assertEqual(len(self.loads), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from LdapFilter import escapeValue, equalityFilter, orFilter, orFilters
+from FakeBackends import parseFilter
+
+class LdapFilterTestCase(unittest.TestCase):
+
+    def testEscapeValue(self):
+        """
+        Testa se os caracteres especiais da RFC 4515 sao escapados.
+        """
+        self.assertEqual(escapeValue('Web (Prod)*\\x\x00'), 'Web \\28Prod\\29\\2a\\5cx\\00')
+        self.assertEqual(escapeValue('Monitoracao - (*)', wildcard=True), 'Monitoracao - \\28*\\29')
+        self.assertEqual(equalityFilter('cn', 'a*b'), '(cn=a\\2ab)')
+
+    def testOrFilter(self):
+        """
+        Testa se o filtro com varios valores e valido.
+        """
+        self.assertEqual(orFilter('cn', ['Monitoracao - *', 'Web (Prod)'], wildcard=True),
+                         '(|(cn=Monitoracao - *)(cn=Web \\28Prod\\29))')
+        self.assertEqual(parseFilter(orFilter('cn', ['a', 'b']))[0], '|')
+
+    def testOrFiltersChunks(self):
+        """
+        Testa se os valores sao divididos em filtros de ate max_length caracteres, sem perder valores.
+        """
+        values = ['Monitoracao - Group %d' % g for g in range(100)]
+        filters = orFilters('cn', values, max_length=200)
+        self.assertGreater(len(filters), 1)
+        self.assertTrue(all(len(item) <= 200 for item in filters))
+        self.assertEqual(''.join(filters).count('(cn='), 100)
+        self.assertEqual(orFilters('cn', values), [orFilter('cn', values)])
+        self.assertEqual(orFilters('cn', ['x' * 50], max_length=10), ['(|(cn=' + 'x' * 50 + '))'])
+        self.assertEqual(orFilters('cn', []), [])
+
+if __name__ == '__main__':
+    unittest.main()
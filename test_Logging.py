@@ -0,0 +1,70 @@
+import unittest
+import json
+import logging
+import os
+import tempfile
+from Logging import LogManager, configureLogging, shutdownLogging
+
+class LogManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmpdir.name, 'test.log')
+
+    def tearDown(self):
+        shutdownLogging(self.log_file)
+        configureLogging(10485760, 5, 'text', 'python.log')
+        self.tmpdir.cleanup()
+
+    def readLines(self):
+        shutdownLogging(self.log_file)
+        with open(self.log_file, encoding='utf-8') as log:
+            return log.read().splitlines()
+
+    def testSingleHandler(self):
+        """
+        Testa se varias instancias para o mesmo logger nao duplicam handlers nem linhas.
+        """
+        for i in range(20):
+            lg = LogManager('INFO', 'test_Logging.single', self.log_file)
+        self.assertEqual(len(logging.getLogger('test_Logging.single').handlers), 1)
+        lg.logger.info('mensagem')
+        lg.logger.debug('ignorada')
+        lines = self.readLines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith('test_Logging.single - INFO - mensagem'))
+        self.assertEqual(logging.getLogger('test_Logging.single').handlers, [])
+
+    def testDefaultLogFile(self):
+        """
+        Testa se os LogManager criados sem arquivo gravam no arquivo informado em configureLogging.
+        """
+        configureLogging(log_file=self.log_file)
+        LogManager('INFO', 'test_Logging.default').logger.info('mensagem')
+        self.assertTrue(self.readLines()[0].endswith('test_Logging.default - INFO - mensagem'))
+
+    def testJsonFormat(self):
+        """
+        Testa se o formato json grava uma linha JSON por registro.
+        """
+        lg = LogManager('DEBUG', 'test_Logging.json', self.log_file)
+        configureLogging(log_format='json')
+        lg.logger.debug('usuario %s criado', 'thiago')
+        record = json.loads(self.readLines()[0])
+        self.assertEqual((record['name'], record['level'], record['message']),
+                         ('test_Logging.json', 'DEBUG', 'usuario thiago criado'))
+
+    def testRotation(self):
+        """
+        Testa se o arquivo e rotacionado ao atingir max_bytes.
+        """
+        configureLogging(max_bytes=200, backup_count=2)
+        lg = LogManager('INFO', 'test_Logging.rotation', self.log_file)
+        for i in range(20):
+            lg.logger.info('linha %d', i)
+        self.readLines()
+        self.assertTrue(os.path.exists(self.log_file + '.1'))
+        self.assertFalse(os.path.exists(self.log_file + '.3'))
+
+if __name__ == '__main__':
+    unittest.main()
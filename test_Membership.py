@@ -0,0 +1,41 @@
+import unittest
+from Membership import MembershipIndex
+
+class MembershipIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ad_list = [{'group': 'Your Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'},
+                                                                 {'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]},
+                        {'group': 'Other Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]},
+                        {'group': 'Empty Group (AD)', 'members': []}]
+        self.index = MembershipIndex.fromList(self.ad_list)
+
+    def testUsersStoredOnce(self):
+        """
+        Testa se usuarios presentes em varios grupos sao armazenados uma unica vez.
+        """
+        self.assertEqual(len(self.index._users), 2)
+        self.assertIs(self.index.users('Other Group (AD)')[0], self.index.users('Your Group (AD)')[1])
+        self.assertEqual(self.index.countMemberships(), 3)
+        self.assertEqual(self.index.aliases(), {'thiago', 'fulano'})
+        self.assertEqual(self.index.aliases('Other Group (AD)'), {'thiago'})
+
+    def testIterationMatchesGetGroupMembersDic(self):
+        """
+        Testa se a iteracao produz o formato de getGroupMembersDic, inclusive grupos vazios.
+        """
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.toList()[0]['members'], sorted(self.ad_list[0]['members'], key=lambda m: m['alias']))
+        self.assertEqual([item['group'] for item in self.index], ['Your Group (AD)', 'Other Group (AD)', 'Empty Group (AD)'])
+
+    def testSelect(self):
+        """
+        Testa se select retorna somente os grupos informados.
+        """
+        selected = self.index.select({'Other Group (AD)'})
+        self.assertEqual(selected.groups(), ['Other Group (AD)'])
+        self.assertNotIn('Your Group (AD)', selected)
+        self.assertEqual(selected.toList(), [self.ad_list[1]])
+
+if __name__ == '__main__':
+    unittest.main()
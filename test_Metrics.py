@@ -0,0 +1,48 @@
+import unittest
+import os
+import json
+import tempfile
+import Metrics
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Metrics.MetricsRegistry()
+
+    def testTimer(self):
+        """
+        Testa se o timer registra quantidade, itens e bucket da operacao.
+        """
+        with self.registry.timer('zabbix.user.create', 3) as timer:
+            timer.items_in = 3
+            timer.bytes_in, timer.bytes_out = 120, 480
+        self.registry.observe('zabbix.user.create', 60.0)
+        metric = self.registry.summary()['operations']['zabbix.user.create']
+        self.assertEqual(metric['count'], 2)
+        self.assertEqual(metric['items_out'], 3)
+        self.assertEqual(metric['items_in'], 3)
+        self.assertEqual((metric['bytes_in'], metric['bytes_out']), (120, 480))
+        self.assertEqual(metric['buckets']['0.005'], 1)
+        self.assertEqual(metric['buckets']['+Inf'], 1)
+
+    def testWriteFiles(self):
+        """
+        Testa se o resumo e gravado em JSON e no formato do Prometheus.
+        """
+        self.registry.observe('ldap.search', 0.2, 100)
+        self.registry.observe('zabbix.user.get', 0.1, 2, 1, 900, 150)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file = os.path.join(tmpdir, 'metrics.json')
+            prom_file = os.path.join(tmpdir, 'metrics.prom')
+            self.registry.writeJson(json_file)
+            self.registry.writePrometheus(prom_file)
+            with open(json_file) as content:
+                self.assertEqual(json.load(content)['operations']['ldap.search']['items_in'], 100)
+            with open(prom_file) as content:
+                prom = content.read()
+            self.assertIn('zabbix_ad_sync_duration_seconds_bucket{operation="ldap.search",le="+Inf"} 1', prom)
+            self.assertIn('zabbix_ad_sync_bytes_total{operation="zabbix.user.get",direction="in"} 900', prom)
+            self.assertNotIn('zabbix_ad_sync_bytes_total{operation="ldap.search"', prom)
+
+if __name__ == '__main__':
+    unittest.main()
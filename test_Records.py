@@ -0,0 +1,49 @@
+import unittest
+from Records import User, Group, Membership, asRecords, iterGroups
+from Membership import MembershipIndex
+
+class RecordsTestCase(unittest.TestCase):
+
+    def testUserHashOnAlias(self):
+        """
+        Testa se usuarios sao comparados pelo alias e nao possuem __dict__.
+        """
+        self.assertEqual(User('thiago', 'THIAGO MURILO DINIZ'), User('thiago', id='3'))
+        self.assertEqual(len({User('thiago'), User('thiago', id='3'), User('fulano')}), 2)
+        self.assertFalse(hasattr(User('thiago'), '__dict__'))
+
+    def testGroupHashOnId(self):
+        """
+        Testa se grupos sao comparados pelo ID, ou pelo nome quando ainda nao possuem ID.
+        """
+        self.assertEqual(Group('Your Group (AD)', '55'), Group('Renamed (AD)', '55'))
+        self.assertNotEqual(Group('Your Group (AD)', '55'), Group('Your Group (AD)', '56'))
+        self.assertEqual(Group('Your Group (AD)'), Group('Your Group (AD)'))
+        self.assertEqual(Membership('Your Group (AD)', '55', ['8']), Membership('Your Group (AD)', '55'))
+
+    def testDictAdapters(self):
+        """
+        Testa se os registros convertem de/para os dicionarios de AdManager e ZabbixManager.
+        """
+        zabbix = {'group': 'Zabbix administrators', 'id': '7', 'members': [{'id': '1', 'alias': 'Admin'}]}
+        ad = {'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]}
+        update = {'group': 'Your Group', 'id': '55', 'add': ['8'], 'remove': []}
+        self.assertEqual(Group.fromDict(zabbix).toDict(), zabbix)
+        self.assertEqual(Group.fromDict(ad).toDict(), ad)
+        self.assertEqual(Group.fromDict({'group': 'Guests', 'id': '8'}).toDict(), {'group': 'Guests', 'id': '8'})
+        self.assertEqual(Membership.fromDict(update).toDict(), update)
+        groups = asRecords(Group, [zabbix, Group('Guests', '8')])
+        self.assertEqual([group.name for group in groups], ['Zabbix administrators', 'Guests'])
+        self.assertEqual(groups[0].aliases(), {'Admin'})
+
+    def testIterGroups(self):
+        """
+        Testa se iterGroups aceita a lista de getGroupMembersDic e o MembershipIndex.
+        """
+        ad_list = [{'group': 'Acesso de leitura', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]}]
+        for source in (ad_list, MembershipIndex.fromList(ad_list)):
+            groups = list(iterGroups(source))
+            self.assertEqual([group.toDict() for group in groups], ad_list)
+
+if __name__ == '__main__':
+    unittest.main()
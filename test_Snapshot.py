@@ -0,0 +1,74 @@
+import unittest
+import Snapshot
+from Membership import MembershipIndex
+from Records import Group
+
+class FakeZabbixManager:
+    """
+    Substituto do ZabbixManager que conta as leituras realizadas.
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.groups = [Group('Your Group (AD)', '55', [])]
+
+    def getUsergroups(self, with_members=False, name_search=None):
+        self.reads += 1
+        self.name_search = name_search
+        return list(self.groups)
+
+class FakeAdManager:
+    """
+    Substituto do AdManager que conta as consultas realizadas.
+    """
+    FILTER_GROUP_SEARCH_AD = '(|(cn=Monitoracao - Your Group))'
+    FILTER_GROUP_SUFFIX_ZB = ' (AD)'
+
+    def __init__(self):
+        self.reads = 0
+
+    def getGroupsList(self, filter):
+        self.reads += 1
+        return ['Monitoracao - Your Group']
+
+    def getGroupMembersIndex(self, group_filter, groups=None):
+        self.groups_received = groups
+        return MembershipIndex.fromList([{'group': 'Your Group (AD)', 'members': []}])
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.zm = FakeZabbixManager()
+        self.am = FakeAdManager()
+        self.snapshot = Snapshot.SyncSnapshot(self.zm, self.am)
+
+    def testReadsAreMemoized(self):
+        """
+        Testa se leituras repetidas consultam o AD e o Zabbix apenas uma vez.
+        """
+        self.snapshot.getZabbixUsergroups()
+        self.snapshot.getZabbixUsergroups()
+        self.snapshot.getAdGroups()
+        self.snapshot.getAdMembers()
+        self.assertEqual(self.zm.reads, 1)
+        self.assertEqual(self.zm.name_search, ' (AD)')
+        self.assertEqual(self.am.reads, 1)
+        self.assertEqual(self.am.groups_received, ['Monitoracao - Your Group'])
+
+    def testInvalidate(self):
+        """
+        Testa se somente as leituras descartadas sao refeitas.
+        """
+        self.snapshot.getZabbixUsergroups()
+        self.snapshot.getAdGroups()
+        self.snapshot.invalidate('zb_usergroups')
+        self.snapshot.getZabbixUsergroups()
+        self.snapshot.getAdGroups()
+        self.assertEqual(self.zm.reads, 2)
+        self.assertEqual(self.am.reads, 1)
+        self.snapshot.invalidate()
+        self.snapshot.getAdGroups()
+        self.assertEqual(self.am.reads, 2)
+
+if __name__ == '__main__':
+    unittest.main()
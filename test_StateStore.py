@@ -0,0 +1,72 @@
+import unittest
+import os
+import tempfile
+import StateStore
+
+class StateStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Cria um arquivo de estado temporario.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = StateStore.StateStore(os.path.join(self.tmpdir.name, 'state.db'))
+        self.ad_list = [{'group': 'Your Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]},
+                        {'group': 'Other Group (AD)', 'members': []}]
+
+    def testEmptyState(self):
+        """
+        Testa se um estado vazio considera todos os grupos alterados.
+        """
+        self.assertFalse(self.store.hasState())
+        self.assertEqual(self.store.getChangedGroups(self.ad_list), ['Your Group (AD)', 'Other Group (AD)'])
+
+    def testSaveAndDiff(self):
+        """
+        Testa se, apos gravar, somente os grupos alterados sao retornados.
+        """
+        self.store.save(self.ad_list, {'Your Group (AD)': '55', 'Other Group (AD)': '56'}, {'thiago': '3'})
+        self.assertTrue(self.store.hasState())
+        self.assertEqual(self.store.getChangedGroups(self.ad_list), [])
+        self.assertEqual(self.store.getUserIds(), {'thiago': '3'})
+
+        self.ad_list[1]['members'].append({'alias': 'fulano', 'name': 'FULANO OLIVEIRA'})
+        self.assertEqual(self.store.getChangedGroups(self.ad_list), ['Other Group (AD)'])
+        self.assertEqual(self.store.getChangedGroups(self.ad_list[:1]), ['Other Group (AD)'])
+
+    def testFailedGroupsNotSaved(self):
+        """
+        Testa se os grupos com falha nao sao gravados e continuam alterados.
+        """
+        self.store.save(self.ad_list, {'Your Group (AD)': '55', 'Other Group (AD)': '56'}, {}, {'Your Group (AD)'})
+        self.assertEqual(self.store.getChangedGroups(self.ad_list), ['Your Group (AD)'])
+        self.assertEqual(self.store.getUsergroupIds(), {'Other Group (AD)': '56'})
+
+    def testPartialSave(self):
+        """
+        Testa se a gravacao parcial substitui somente os grupos sincronizados.
+        """
+        self.store.save(self.ad_list, {'Your Group (AD)': '55', 'Other Group (AD)': '56'}, {'thiago': '3'})
+        changed = [{'group': 'Other Group (AD)', 'members': [{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}]
+        self.store.save(changed, {'Other Group (AD)': '56'}, {'fulano': '4'}, groups=['Other Group (AD)'])
+        self.assertEqual(self.store.getMembership(), {'Your Group (AD)': {'thiago'}, 'Other Group (AD)': {'fulano'}})
+        self.assertEqual(self.store.getUsergroupIds(), {'Your Group (AD)': '55', 'Other Group (AD)': '56'})
+        self.assertEqual(self.store.getUserIds(), {'thiago': '3', 'fulano': '4'})
+
+        self.store.save([], {}, {}, groups=['Other Group (AD)'])
+        self.assertEqual(self.store.getUsergroupIds(), {'Your Group (AD)': '55'})
+
+    def testClear(self):
+        """
+        Testa se o estado e descartado.
+        """
+        self.store.save(self.ad_list, {}, {})
+        self.store.clear()
+        self.assertFalse(self.store.hasState())
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
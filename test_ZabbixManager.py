@@ -1,5 +1,12 @@
 import unittest
+import os
+import stat
+import subprocess
+import sys
+import AsyncZabbixAPI
 import ZabbixManager
+import FakeBackends
+from FakeBackends import fakeEnvironment
 
 class ZabbixTestCase(unittest.TestCase):
 
@@ -47,5 +54,116 @@ class ZabbixTestCase(unittest.TestCase):
         """
         zm.disconnect()
 
+class ZabbixOfflineTestCase(unittest.TestCase):
+
+    def testSessionReuse(self):
+        """
+        Testa se a sessao gravada em session_file e reaproveitada entre execucoes.
+        """
+        directory = FakeBackends.FakeDirectory(users=10, groups=1)
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server, 'session_file = session.json'):
+            from ZabbixManager import ZabbixManager
+            for run in range(3):
+                zm = ZabbixManager()
+                zm.connect()
+                zm.getUsergroupsList()
+                zm.disconnect()
+            self.assertEqual(server.calls['user.login'], 1)
+            self.assertEqual(server.calls['user.logout'], 0)
+            self.assertEqual(server.calls['user.checkAuthentication'], 2)
+            self.assertEqual(stat.S_IMODE(os.stat('session.json').st_mode), 0o600)
+            server.sessions.clear()
+            zm = ZabbixManager()
+            zm.connect()
+            self.assertEqual(server.calls['user.login'], 2)
+
+    def testClientOptions(self):
+        """
+        Testa se timeout e verify do conexao.ini sao repassados ao cliente async.
+        """
+        directory = FakeBackends.FakeDirectory(users=10, groups=1)
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server, 'client = async\ntimeout = 5\nverify = false'):
+            from ZabbixManager import ZabbixManager
+            zm = ZabbixManager()
+            zm.connect()
+            self.assertEqual((zm.zapi.timeout, zm.zapi.verify), (5, False))
+            zm.disconnect()
+
+    def testLazyPyZabbix(self):
+        """
+        Testa se o py-zabbix nao e importado junto com o ZabbixManager e se as suas excecoes
+        sao convertidas em AsyncZabbixAPI.ZabbixAPIException.
+        """
+        code = ('import sys\n'
+                'class Blocker:\n'
+                '    def find_spec(self, name, path=None, target=None):\n'
+                '        if name.split(".")[0] == "zabbix":\n'
+                '            raise AssertionError("import de " + name)\n'
+                'sys.meta_path.insert(0, Blocker())\n'
+                'import ZabbixManager, sync_users\n')
+        subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+        directory = FakeBackends.FakeDirectory(users=10, groups=1)
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server):
+            from ZabbixManager import ZabbixManager
+            zm = ZabbixManager()
+            zm.connect()
+            self.assertIsInstance(zm._requestMany([('usergroup.delete', ['1'])])[0], AsyncZabbixAPI.ZabbixAPIException)
+            with self.assertRaises(AsyncZabbixAPI.ZabbixAPIException):
+                zm.zapi.hostgroup.delete(['1'])
+
+    def testUsergroupIdCache(self):
+        """
+        Testa se o grupo padrao e resolvido uma unica vez e se os grupos criados sao memorizados.
+        """
+        directory = FakeBackends.FakeDirectory(users=10, groups=1)
+        server = FakeBackends.FakeZabbixServer(usergroups=5)
+        with fakeEnvironment(directory, server):
+            from ZabbixManager import ZabbixManager
+            zm = ZabbixManager()
+            zm.connect()
+            for run in range(3):
+                zm.createUsers([{'alias': 'user%d' % run, 'name': 'USER %d' % run, 'groups': []}])
+            created = zm.createUsergroups(['Group A (AD)', 'Group B (AD)'])
+            self.assertEqual(server.calls['usergroup.get'], 1)
+            self.assertEqual(zm.resolveUsergroupIds(['Group A (AD)', 'Group B (AD)', 'Local Group 1']),
+                             dict(created, **{'Local Group 1': zm.getUsergroupId('Local Group 1')}))
+            self.assertEqual(server.calls['usergroup.get'], 2)
+            default = zm.getUsergroupId('Users from AD')
+            self.assertEqual(len(server.usergroups[default]['userids']), 3)
+
+    def testSyncServiceTree(self):
+        """
+        Testa se a arvore de SLAs e criada em lotes e se uma nova sincronizacao nao altera nada.
+        """
+        tree = [{'name': 'Infra', 'children': [{'name': 'Storage %d' % s, 'triggerid': str(100 + s)} for s in range(15)]},
+                {'name': 'Site', 'children': [{'name': 'App %d' % a,
+                                               'dependencies': [['Infra', 'Storage %d' % (a % 15)], ['Infra', 'Storage 0']]}
+                                              for a in range(25)]}]
+        directory = FakeBackends.FakeDirectory(users=10, groups=1)
+        server = FakeBackends.FakeZabbixServer(usergroups=1)
+        with fakeEnvironment(directory, server):
+            from ZabbixManager import ZabbixManager
+            zm = ZabbixManager()
+            zm.connect()
+            zm.serviceCreate('Infra', None, None)
+            paths = zm.syncServiceTree(tree)
+            self.assertEqual(len(paths), 42)
+            self.assertEqual(len(server.services), 42)
+            self.assertEqual(server.calls['service.get'], 1)
+            self.assertEqual(server.calls['service.create'], 1 + 1 + 4)
+            self.assertEqual(server.calls['service.adddependencies'], 5)
+            app = server.services[paths[('Site', 'App 3')]]
+            self.assertEqual(set(dependency['serviceid'] for dependency in app['dependencies'] if dependency['soft'] == '1'),
+                             {paths[('Infra', 'Storage 3')], paths[('Infra', 'Storage 0')]})
+            self.assertEqual(server.services[paths[('Infra', 'Storage 1')]]['parentid'], paths[('Infra',)])
+
+            server.calls.clear()
+            self.assertEqual(zm.syncServiceTree(tree), paths)
+            self.assertEqual(dict(server.calls), {'service.get': 1})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import argparse
+import benchmark
+import FakeBackends
+
+class FakeBackendsTestCase(unittest.TestCase):
+
+    def testParseFilter(self):
+        """
+        Testa se o filtro LDAP e convertido na arvore esperada.
+        """
+        self.assertEqual(FakeBackends.parseFilter('(&(objectClass=user)(!(cn=a\\2a*)))'),
+                         ('&', [('=', 'objectclass', None, 'user'), ('!', ('=', 'cn', None, 'a\\2a*'))]))
+
+    def testInChainSearch(self):
+        """
+        Testa se a busca com LDAP_MATCHING_RULE_IN_CHAIN retorna os membros aninhados ativos.
+        """
+        directory = FakeBackends.FakeDirectory(users=50, groups=2, nesting=2, disabled=0)
+        group_dn = 'CN=Monitoracao - Group 0,' + directory.groups_ou
+        filter = '(&(objectClass=user)(memberof:1.2.840.113556.1.4.1941:=%s))' % group_dn
+        result = directory.search(directory.users_ou, FakeBackends.SCOPE_SUBTREE, filter, ['samaccountname'])
+        self.assertTrue(result)
+        self.assertIn('sAMAccountName', result[0][1])
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def runScenario(self, mode):
+        args = argparse.Namespace(groups=5, nesting=2, memberships=2, zabbix_groups=10, mode=mode,
+                                  page_size=7, pool_size=2, batch_size=10, latency=0, seed=1)
+        return benchmark.runScenario(60, args)
+
+    def testRunsAndCounts(self):
+        """
+        Testa se o benchmark executa as sincronizacoes e contabiliza consultas e chamadas.
+        """
+        for mode in ('bulk', 'per_group'):
+            result = self.runScenario(mode)
+            self.assertEqual([run['run'] for run in result['runs']], benchmark.RUNS)
+            first = dict((phase['phase'], phase) for phase in result['runs'][0]['phases'])
+            self.assertGreater(first['leitura AD']['ldap_searches'], 0)
+            self.assertGreater(first['usuarios']['api_calls'], 0)
+            self.assertGreater(result['zabbix_users'], 1)
+
+    def testModesAgree(self):
+        """
+        Testa se os modos bulk e per_group criam os mesmos usuarios no Zabbix.
+        """
+        self.assertEqual(self.runScenario('bulk')['zabbix_users'], self.runScenario('per_group')['zabbix_users'])
+
+if __name__ == '__main__':
+    unittest.main()
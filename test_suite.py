@@ -3,6 +3,20 @@ import sys
 import test_AdManager
 import test_ZabbixManager
 import test_sync_users
+import test_Snapshot
+import test_StateStore
+import test_benchmark
+import test_Metrics
+import test_AsyncZabbixAPI
+import test_Daemon
+import test_Membership
+import test_Records
+import test_IdResolver
+import test_Logging
+import test_Config
+import test_GroupMapper
+import test_LdapFilter
+import test_AdSources
 
 def createSuite():
     """
@@ -18,6 +32,20 @@ def createSuite():
     test_suite.addTests(loader.loadTestsFromModule(test_AdManager))
     test_suite.addTests(loader.loadTestsFromModule(test_ZabbixManager))
     test_suite.addTests(loader.loadTestsFromModule(test_sync_users))
+    test_suite.addTests(loader.loadTestsFromModule(test_Snapshot))
+    test_suite.addTests(loader.loadTestsFromModule(test_StateStore))
+    test_suite.addTests(loader.loadTestsFromModule(test_benchmark))
+    test_suite.addTests(loader.loadTestsFromModule(test_Metrics))
+    test_suite.addTests(loader.loadTestsFromModule(test_AsyncZabbixAPI))
+    test_suite.addTests(loader.loadTestsFromModule(test_Daemon))
+    test_suite.addTests(loader.loadTestsFromModule(test_Membership))
+    test_suite.addTests(loader.loadTestsFromModule(test_Records))
+    test_suite.addTests(loader.loadTestsFromModule(test_IdResolver))
+    test_suite.addTests(loader.loadTestsFromModule(test_Logging))
+    test_suite.addTests(loader.loadTestsFromModule(test_Config))
+    test_suite.addTests(loader.loadTestsFromModule(test_GroupMapper))
+    test_suite.addTests(loader.loadTestsFromModule(test_LdapFilter))
+    test_suite.addTests(loader.loadTestsFromModule(test_AdSources))
     return test_suite
 
 if __name__ == '__main__':
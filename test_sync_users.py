@@ -1,5 +1,28 @@
 import unittest
+import os
+import json
+import random
+import runpy
+import tempfile
+from collections import Counter
+from unittest import mock
 import sync_users
+import FakeBackends
+from FakeBackends import fakeEnvironment
+from Logging import configureLogging, shutdownLogging
+
+def setUpModule():
+    """
+    Grava os logs do sync_users em um diretorio temporario.
+    """
+    global log_dir
+    log_dir = tempfile.TemporaryDirectory()
+    configureLogging(log_file=os.path.join(log_dir.name, 'python.log'))
+
+def tearDownModule():
+    shutdownLogging(os.path.join(log_dir.name, 'python.log'))
+    configureLogging(log_file='python.log')
+    log_dir.cleanup()
 
 class SyncUsersTestCase(unittest.TestCase):
 
@@ -51,5 +74,286 @@ class SyncUsersTestCase(unittest.TestCase):
         zm.disconnect()
         am.disconnect()
 
+def legacyGetUsersListToBeCreatedZabbix(zabbix_list, ad_list):
+    """
+    Implementacao original (O(A*M*Z)) de getUsersListToBeCreatedZabbix, usada como referencia.
+    """
+    zb_users = set()
+    for item in zabbix_list:
+        for member in item['members']:
+            zb_users.add(member['alias'])
+
+    zb_groupid_map = {}
+    for ad_item in ad_list:
+        ad_group = ad_item['group']
+        for zb_item in zabbix_list:
+            zb_group = zb_item['group']
+            if zb_group == ad_group:
+                zb_groupid_map[ad_group] = zb_item['id']
+
+    alias_list = set()
+    for ad_item in ad_list:
+        for member_ad in ad_item['members']:
+            for zb_item in zabbix_list:
+                if member_ad['alias'] not in zb_users:
+                    alias_list.add(member_ad['alias'])
+
+    tobe_created = []
+    for alias in alias_list:
+        tobe_user = {}
+        tobe_user['alias'] = alias
+        tobe_user['groups'] = []
+        for ad_item in ad_list:
+            for member in ad_item['members']:
+                if alias == member['alias']:
+                    member_group = {}
+                    tobe_user['name'] = member['name']
+                    member_group['usrgrpid'] = zb_groupid_map[ad_item['group']]
+                    tobe_user['groups'].append(member_group)
+        tobe_created.append(tobe_user)
+
+    return list(tobe_created)
+
+def legacyGetUsersListToBeUpdatedZabbix(zabbix_list, ad_list):
+    """
+    Implementacao original (O(n^2) por grupo) de getUsersListToBeUpdatedZabbix, usada como referencia.
+    """
+    zb_userid_map = {}
+    for item in zabbix_list:
+        for member in item['members']:
+            zb_userid_map[member['alias']] = member['id']
+
+    update_list = []
+    for ad_item in ad_list:
+        ad_group = ad_item['group']
+        ad_members = [member['alias'] for member in ad_item['members']]
+        for zb_item in zabbix_list:
+            zb_group = zb_item['group']
+            zb_members = [member['alias'] for member in zb_item['members']]
+            if zb_group == ad_group and Counter(zb_members) != Counter(ad_members):
+                zb_add = [zb_userid_map[m] for m in ad_members if m not in zb_members]
+                zb_remove = [zb_userid_map[m] for m in zb_members if m not in ad_members]
+                update_list.append({'group': zb_group, 'id': zb_item['id'], 'add': zb_add, 'remove': zb_remove})
+
+    return update_list
+
+def syntheticData(groups=30, users=400, zabbix_users=150, seed=42):
+    """
+    Gera listas sinteticas no formato de getUsergroupsList(True) e getGroupMembersDic.
+    """
+    rnd = random.Random(seed)
+    aliases = ['user%d' % i for i in range(users)]
+    known = aliases[:zabbix_users]
+    ad_list = []
+    zabbix_list = [{'group': 'Zabbix administrators', 'id': '7', 'members': [{'id': '1', 'alias': 'Admin'}]},
+                   {'group': 'Users from AD', 'id': '8', 'members': [{'id': a[4:], 'alias': a} for a in known]}]
+    for g in range(groups):
+        group = 'Group %d (AD)' % g
+        members = rnd.sample(aliases, rnd.randint(0, 40))
+        ad_list.append({'group': group, 'members': [{'alias': a, 'name': a.upper()} for a in members]})
+        zb_members = [a for a in members if int(a[4:]) < zabbix_users and rnd.random() < 0.8]
+        zb_members += [a for a in rnd.sample(known, 3) if a not in zb_members]
+        zabbix_list.append({'group': group, 'id': str(100 + g),
+                            'members': [{'id': a[4:], 'alias': a} for a in zb_members]})
+    return zabbix_list, ad_list
+
+class PlannerTestCase(unittest.TestCase):
+
+    def test_getUsersListToBeCreatedZabbixMatchesLegacy(self):
+        """
+        Testa se a implementacao indexada retorna o mesmo resultado da implementacao original.
+        """
+        for seed in range(5):
+            zabbix_list, ad_list = syntheticData(seed=seed)
+            expected = sorted(legacyGetUsersListToBeCreatedZabbix(zabbix_list, ad_list), key=lambda u: u['alias'])
+            result = sorted(sync_users.getUsersListToBeCreatedZabbix(zabbix_list, ad_list), key=lambda u: u['alias'])
+            self.assertEqual(result, expected)
+
+    def test_getUsersListToBeCreatedZabbixEmptyZabbix(self):
+        """
+        Testa se nenhum usuario e retornado quando nao existem grupos no Zabbix.
+        """
+        zabbix_list, ad_list = syntheticData()
+        self.assertEqual(sync_users.getUsersListToBeCreatedZabbix([], ad_list), [])
+
+    def test_getUsersListToBeUpdatedZabbixMatchesLegacy(self):
+        """
+        Testa se o diff por conjuntos retorna o mesmo resultado da implementacao original.
+        """
+        for seed in range(5):
+            zabbix_list, ad_list = syntheticData(zabbix_users=400, seed=seed)
+            expected = legacyGetUsersListToBeUpdatedZabbix(zabbix_list, ad_list)
+            self.assertEqual(sync_users.getUsersListToBeUpdatedZabbix(zabbix_list, ad_list), expected)
+
+    def test_getUsersListToBeUpdatedZabbixMissingUserid(self):
+        """
+        Testa se usuarios do AD ainda sem userid no Zabbix sao ignorados, sem KeyError.
+        """
+        zabbix_list = [{'group': 'Your Group (AD)', 'id': '55', 'members': [{'id': '3', 'alias': 'thiago'}]}]
+        ad_list = [{'group': 'Your Group (AD)', 'members': [{'alias': 'fulano', 'name': 'FULANO OLIVEIRA'}]}]
+        self.assertEqual(sync_users.getUsersListToBeUpdatedZabbix(zabbix_list, ad_list),
+                         [{'group': 'Your Group (AD)', 'id': '55', 'add': [], 'remove': ['3']}])
+
+class PlanHelpersTestCase(unittest.TestCase):
+
+    def test_getPlanUsersToBeCreatedEmptyZabbix(self):
+        """
+        Testa se, sem grupos no Zabbix, todos os usuarios do AD sao criados como membros dos
+        grupos que ainda serao criados, uma unica vez cada.
+        """
+        ad_list = [{'group': 'Your Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'},
+                                                            {'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]},
+                   {'group': 'Other Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'}]}]
+        self.assertEqual(sync_users.getPlanUsersToBeCreated([], ad_list),
+                         [{'alias': 'thiago', 'groups': ['Your Group (AD)', 'Other Group (AD)'], 'name': 'THIAGO MURILO DINIZ'}])
+
+    def test_getPlanMembershipsNewGroup(self):
+        """
+        Testa se um grupo que ainda nao existe no Zabbix recebe os usuarios ja existentes e se os
+        usuarios a serem criados sao ignorados.
+        """
+        zabbix_list = [{'group': 'Your Group (AD)', 'id': '55', 'members': [{'id': '3', 'alias': 'thiago'}]}]
+        ad_list = [{'group': 'Your Group (AD)', 'members': [{'alias': 'ciclano', 'name': 'CICLANO PIRES'}]},
+                   {'group': 'Other Group (AD)', 'members': [{'alias': 'thiago', 'name': 'THIAGO MURILO DINIZ'},
+                                                             {'alias': 'ciclano', 'name': 'CICLANO PIRES'}]}]
+        self.assertEqual(sync_users.getPlanMemberships(zabbix_list, ad_list, {'fulano': '8'}),
+                         [{'group': 'Your Group (AD)', 'add': [], 'remove': ['thiago']},
+                          {'group': 'Other Group (AD)', 'add': ['thiago'], 'remove': []}])
+
+class PlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = FakeBackends.FakeDirectory(users=60, groups=4, nesting=1, memberships=2)
+        self.server = FakeBackends.FakeZabbixServer(usergroups=3, users=2)
+
+    def zabbixMembership(self):
+        aliases = dict((userid, user['alias']) for userid, user in self.server.users.items())
+        return dict((group['name'], set(aliases[userid] for userid in group['userids']))
+                    for group in self.server.usergroups.values() if group['name'].endswith(' (AD)'))
+
+    def testDryRunAndApply(self):
+        """
+        Testa se o dry-run nao escreve no Zabbix e se o plano aplicado (inclusive relido do
+        JSON) deixa os usergroups com os mesmos membros do AD.
+        """
+        with fakeEnvironment(self.directory, self.server):
+            import sync_users
+            from StateStore import StateStore
+            sync_users.connect()
+            store = StateStore(':memory:')
+            plan, ad_dic = sync_users.planSync(store)
+            self.assertFalse(self.server.calls['user.create'] + self.server.calls['usergroup.create'])
+            self.assertEqual(len(plan['usergroups_create']), 4)
+            self.assertTrue(plan['users_create'])
+            sync_users.writePlan(plan, 'plan.json')
+            sync_users.applyAndSave(sync_users.readPlan('plan.json'), store)
+            expected = dict((item['group'], set(member['alias'] for member in item['members'])) for item in ad_dic)
+            self.assertEqual(self.zabbixMembership(), expected)
+            self.assertEqual(store.getChangedGroups(ad_dic), [])
+
+            # Divergencias no Zabbix: um membro removido e um usuario local adicionado
+            group = next(group for group in self.server.usergroups.values() if group['name'].endswith(' (AD)'))
+            removed = group['userids'].pop()
+            local = next(userid for userid, user in self.server.users.items() if user['alias'] == 'local0')
+            group['userids'].append(local)
+            sync_users.snapshot = None
+            store.clear()
+            plan, ad_dic = sync_users.planSync(store)
+            self.assertEqual(plan['users_create'], [])
+            self.assertEqual(plan['memberships'], [{'group': group['name'], 'add': [self.server.users[removed]['alias']],
+                                                    'remove': ['local0']}])
+            usergroups = sync_users.getSnapshot().getZabbixUsergroups()
+            reads = self.server.calls['usergroup.get'] + self.server.calls['user.get']
+            sync_users.applyPlan(plan, usergroups)
+            self.assertEqual(self.server.calls['usergroup.get'] + self.server.calls['user.get'], reads)
+            self.assertEqual(self.zabbixMembership(), expected)
+            sync_users.disconnect()
+
+    def testFailedUserIsRetried(self):
+        """
+        Testa se os grupos de um usuario que falhou ao ser criado nao sao gravados no estado
+        e voltam a ser sincronizados na proxima execucao.
+        """
+        with fakeEnvironment(self.directory, self.server):
+            import sync_users
+            from StateStore import StateStore
+            sync_users.connect()
+            store = StateStore(':memory:')
+            plan, ad_dic = sync_users.planSync(store)
+            user = plan['users_create'][0]
+            self.server.rejected.add(user['alias'])
+            sync_users.snapshot = None
+            groups = sync_users.runSync(store)
+            self.assertTrue(groups)
+            self.assertNotIn(user['alias'], [item['alias'] for item in self.server.users.values()])
+            self.assertEqual(sorted(store.getChangedGroups(ad_dic)), sorted(user['groups']))
+
+            self.server.rejected.clear()
+            sync_users.snapshot = None
+            self.assertEqual(sync_users.runSync(store), sorted(user['groups']))
+            expected = dict((item['group'], set(member['alias'] for member in item['members'])) for item in ad_dic)
+            self.assertEqual(self.zabbixMembership(), expected)
+            self.assertEqual(store.getChangedGroups(ad_dic), [])
+            sync_users.snapshot = None
+            self.assertEqual(sync_users.runSync(store), [])
+            sync_users.disconnect()
+
+    def testCommandLineMetrics(self):
+        """
+        Testa se --dry-run e --apply-plan emitem as metricas da execucao e se o --apply-plan
+        grava o estado.
+        """
+        with fakeEnvironment(self.directory, self.server, extra_config='\n[metrics]\njson_file = metrics.json\n'):
+            from Metrics import metrics
+            for argv in (['--dry-run', '--plan-out', 'plan.json'], ['--apply-plan', 'plan.json']):
+                metrics.reset()
+                with mock.patch('sys.argv', ['sync_users.py'] + argv):
+                    runpy.run_module('sync_users', run_name='__main__')
+                with open('metrics.json') as metrics_file:
+                    operations = json.load(metrics_file)['operations']
+                self.assertEqual(operations['sync.total']['count'], 1)
+                os.remove('metrics.json')
+            self.assertIn('sync.memberships', operations)
+            from StateStore import StateStore
+            store = StateStore('sync_state.db')
+            self.assertTrue(store.hasState())
+            store.close()
+
+    def testStateLimitsZabbixReads(self):
+        """
+        Testa se, com estado gravado, somente o grupo alterado no AD e os usuarios sem ID
+        conhecido sao consultados no Zabbix.
+        """
+        with fakeEnvironment(self.directory, self.server):
+            import sync_users
+            from StateStore import StateStore
+            sync_users.connect()
+            store = StateStore(':memory:')
+            sync_users.runSync(store)
+
+            # Um usuario ja sincronizado passa a ser membro direto de um grupo monitorado
+            group = next(entry for entry in self.directory.entries.values()
+                         if entry['attrs'].get('cn', [b''])[0] == self.directory.monitored[0].encode('utf-8'))
+            members = group['attrs']['member']
+            user = next(entry['dn'] for entry in self.directory.entries.values()
+                        if entry['attrs'].get('userAccountControl') == [b'512'] and group['dn'].lower() not in entry['closure']
+                        and entry['attrs']['sAMAccountName'][0].decode('utf-8') in store.getUserIds())
+            self.directory.modify(group['dn'], {'member': members + [user.encode('utf-8')]})
+
+            requests = []
+            request = self.server.request
+            self.server.request = lambda method, params: requests.append((method, params)) or request(method, params)
+            sync_users.snapshot = None
+            groups = sync_users.runSync(store)
+            self.assertEqual(len(groups), 1)
+            usergroup_gets = [params for method, params in requests if method == 'usergroup.get']
+            self.assertEqual(usergroup_gets, [dict(usergroup_gets[0], filter={'name': groups})])
+            self.assertFalse([params for method, params in requests if method == 'user.get' and 'filter' in params])
+            ad_dic = sync_users.getSnapshot().getAdMembers()
+            expected = dict((item['group'], set(member['alias'] for member in item['members'])) for item in ad_dic)
+            self.assertEqual(self.zabbixMembership(), expected)
+            self.assertEqual(store.getChangedGroups(ad_dic), [])
+            sync_users.disconnect()
+
 if __name__ == '__main__':
     unittest.main()